@@ -1,10 +1,13 @@
 from src.shared.Logger import create_logger
 from Config import config
+from FrameRing import CAPTURED, FORMATTING, FORMATTED
+from Overlay import Overlay
+from MotionDetector import MotionDetector
+from FrameTransform import FrameTransform
 import multiprocessing as mp
 import ctypes
 import cv2
 from threading import Thread
-from datetime import datetime
 import time
 
 
@@ -13,84 +16,141 @@ class Capture:
         self.logger = create_logger(__name__, config.DebugMode, "client.log")
         self.logger.debug("Initializing Capture Class...")
         self.is_running = mp.Value(ctypes.c_bool, False)
+        # Set by the server when it falls behind, 0 means no pressure.
+        self.pressure_level = mp.Value(ctypes.c_ubyte, 0, lock=False)
         self.height, self.width = resolution  # frame.shape = (height, width, 3)
-        self.fps = self.__get_camera_fps()
-        self.__record_timer = mp.Manager().Value(ctypes.c_wchar_p, "00:00:00:00")
+        self.__capture_mode, self.__source_resolution, self.fps = self.__negotiate_capture_mode()
+        self.__report_frame_preparation_speedup()
+        self.__record_start_time = mp.Value(ctypes.c_double, 0.0, lock=False)
         self.__processes_threads = []
         self.logger.debug("Capture Class initialized.")
 
-    def __get_camera_fps(self):
+    def __negotiate_capture_mode(self):
+        # Looks for a pixel format the device can deliver at the requested resolution, so no resize is needed.
+        self.logger.debug("probing capture modes...")
         cap = cv2.VideoCapture(config.CaptureDevice)
-        fps = cap.get(cv2.CAP_PROP_FPS)
+        default_resolution = self.__get_capture_resolution(cap)
+        default_fps = cap.get(cv2.CAP_PROP_FPS)
+        modes = []
+        for fourcc in ("YUYV", "MJPG"):  # YUYV first, it doesn't have to be decoded.
+            Capture.__apply_capture_mode(cap, fourcc, self.width, self.height)
+            actual_fourcc = Capture.__decode_fourcc(cap.get(cv2.CAP_PROP_FOURCC))
+            resolution = self.__get_capture_resolution(cap)
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            self.logger.debug(f"requested {fourcc} {self.width}x{self.height}, got {actual_fourcc} "
+                              f"{resolution[1]}x{resolution[0]} @ {fps} fps.")
+            if actual_fourcc == fourcc and resolution == (self.height, self.width):
+                modes.append((fps, fourcc))
         cap.release()
-        return fps
+        if not modes:
+            self.logger.info(f"no native {self.width}x{self.height} capture mode found, frames will be resized "
+                             f"from {default_resolution[1]}x{default_resolution[0]}.")
+            return None, default_resolution, default_fps
+        fps, fourcc = max(modes, key=lambda mode: mode[0])
+        self.logger.info(f"capturing natively in {fourcc} {self.width}x{self.height} @ {fps} fps.")
+        return fourcc, (self.height, self.width), fps
 
-    def start(self, pipe_in):
-        frame_pipe_out, frame_pipe_in = mp.Pipe(False)
-        self.__start_capture_thread(frame_pipe_in)
-        self.__start_record_timer_process()
-        self.__start_frame_formatting_process(frame_pipe_out, pipe_in)
+    def __report_frame_preparation_speedup(self):
+        old_time = FrameTransform.measure_flip_and_resize(self.__source_resolution, (self.height, self.width))
+        new_time = FrameTransform(self.__source_resolution, (self.height, self.width)).measure()
+        self.logger.info(f"frame preparation: {new_time * 1000:.2f} ms instead of {old_time * 1000:.2f} ms "
+                         f"per frame ({old_time / max(new_time, 1e-9):.1f}x faster).")
 
-    def __start_capture_thread(self, pipe_in):
-        def loop(log, is_running, capture_device, width, height, pipe):
+    @staticmethod
+    def __get_capture_resolution(cap):
+        return int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+
+    @staticmethod
+    def __apply_capture_mode(cap, fourcc, width, height):
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+    @staticmethod
+    def __decode_fourcc(value):
+        value = int(value)
+        return "".join(chr((value >> 8 * i) & 0xFF) for i in range(4))
+
+    def start(self, frame_ring, on_frame_rate_change):
+        self.__record_start_time.value = time.time()
+        self.__start_capture_thread(frame_ring, on_frame_rate_change)
+        self.__start_frame_formatting_process(frame_ring)
+
+    def __start_capture_thread(self, frame_ring, on_frame_rate_change):
+        def loop(log, is_running, capture_device, width, height, ring, fps, frame_rate_changed, capture_mode,
+                 source_resolution, pressure_level):
             log.debug("starting Video Capture...")
             is_running.value = True
             cap = cv2.VideoCapture(capture_device)
+            if capture_mode is not None:
+                Capture.__apply_capture_mode(cap, capture_mode, width, height)
+            transform = FrameTransform(source_resolution, (height, width))
+            motion_detector = MotionDetector(config.MotionPixelThreshold, config.MotionAreaThreshold,
+                                             config.IdleAfter) if config.MotionGating else None
+            idle = False
+            # The frame rate the server knows of, it only follows the motion gating.
+            reported_frame_rate = fps
+            frame_rate = fps
+            last_frame_time = 0
             while is_running.value:
                 ret, frame = cap.read()
-                frame = cv2.flip(frame, 1)
-                frame = cv2.resize(frame, (width, height))
-                pipe.send(frame)
+                capture_time = time.monotonic()
+                if motion_detector is not None:
+                    if motion_detector.detect(frame) and idle:
+                        log.debug("motion detected, returning to full frame rate.")
+                        idle = False
+                    elif not idle and motion_detector.is_idle():
+                        log.debug("no motion detected, lowering frame rate.")
+                        idle = True
+                # Motion gating and pressure from the server lower the frame rate by skipping frames.
+                # Only motion gating is reported, a new frame rate starts a new file on the server and pressure
+                # must not cause more files to encode. The server fills the gaps from the capture times.
+                gated_frame_rate = config.IdleFPS if idle else fps
+                if gated_frame_rate != reported_frame_rate:
+                    reported_frame_rate = gated_frame_rate
+                    frame_rate_changed(reported_frame_rate)
+                frame_rate = max(gated_frame_rate // (pressure_level.value + 1), 1)
+                if frame_rate < fps:
+                    if capture_time - last_frame_time < 1 / frame_rate:
+                        continue
+                    last_frame_time = capture_time
+                index = ring.acquire_free_slot()
+                if index is None:
+                    continue
+                if frame.shape[:2] != transform.source_resolution:
+                    log.warning(f"capture resolution changed to {frame.shape[1]}x{frame.shape[0]}.")
+                    transform = FrameTransform(frame.shape[:2], (height, width))
+                transform.apply(frame, ring.frame(index))
+                ring.publish(index, CAPTURED, capture_time)
             cap.release()
-            log.debug("Video Capture stopped.")
+            if reported_frame_rate != fps:
+                frame_rate_changed(fps)
+            log.debug(f"Video Capture stopped. {ring.get_counters()}.")
 
         t = Thread(target=loop,
-                   args=[self.logger, self.is_running, config.CaptureDevice, self.width, self.height, pipe_in],
+                   args=[self.logger, self.is_running, config.CaptureDevice, self.width, self.height, frame_ring,
+                         int(self.fps), on_frame_rate_change, self.__capture_mode, self.__source_resolution,
+                         self.pressure_level],
                    daemon=True)
         t.start()
         self.__processes_threads.append(t)
 
-    def __start_record_timer_process(self):
-        def loop(log, is_running, record_timer):
-            log.debug("starting record timer.")
-            start_time = datetime.now()
-            while is_running.value:
-                rc = datetime.now() - start_time
-                days = rc.days
-                hours, rem = divmod(rc.seconds, 3600)
-                minutes, seconds = divmod(rem, 60)
-                record_timer.value = f"{days:02d}:{hours:02d}:{minutes:02d}:{seconds:02d}"
-                if rc == "99:23:59:59":  # max REC timer value
-                    break
-                time.sleep(1)
-            log.debug("stop record timer.")
-
-        p = mp.Process(target=loop, args=(self.logger, self.is_running, self.__record_timer))
-        p.start()
-        self.__processes_threads.append(p)
-
-    def __start_frame_formatting_process(self, pipe_out, pipe_in):
-        def loop(log, is_running, pipe_o, pipe_i, height, width, record_timer):
+    def __start_frame_formatting_process(self, frame_ring):
+        def loop(log, is_running, ring, height, width, record_start_time):
             log.debug("starting frame formatting.")
+            overlay = Overlay((height, width))
             while is_running.value:
-                frame = pipe_o.recv()
-                # Current day:
-                frame = cv2.rectangle(frame, (10, height - 5), (195, height - 25), (0, 0, 0), -1)
-                now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                frame = cv2.putText(frame, now, (10, height - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
-                                    (255, 255, 255), 1)
-
-                # Record time:
-                frame = cv2.rectangle(frame, ((width - 10) - 95, height - 5),
-                                      (width - 10, height - 25), (0, 0, 0), -1)
-                frame = cv2.putText(frame, record_timer.value, ((width - 10) - 95, height - 10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-                pipe_i.send_bytes(frame.tobytes())
+                index = ring.acquire(CAPTURED, FORMATTING, is_running)
+                if index is None:
+                    continue
+                # Current day and record time:
+                overlay.apply(ring.frame(index), record_start_time)
+                ring.publish(index, FORMATTED)
             log.debug("stop frame formatting.")
 
         p = mp.Process(
             target=loop,
-            args=(self.logger, self.is_running, pipe_out, pipe_in, self.height, self.width, self.__record_timer),
+            args=(self.logger, self.is_running, frame_ring, self.height, self.width, self.__record_start_time),
             daemon=True)
         p.start()
         self.__processes_threads.append(p)
@@ -4,12 +4,18 @@ sys.path.append(os.path.dirname(os.path.dirname(sys.path[0])))
 from src.shared.Logger import create_logger
 from Config import config
 from Capture import Capture
+from FrameRing import FrameRing, FORMATTED, SENDING
+from VideoStreamEncoder import VideoStreamEncoder, CODECS
+from LiveViewSender import LiveViewSender
+from src.shared.FrameCodec import RAW, JPEG, DELTA, VIDEO_STREAM_ENCODINGS, encode_jpeg, get_encoding_name
+from src.shared.FrameProtocol import PROTOCOL_VERSION, VERSION, KEYFRAME, send_frame
+from src.shared.TileDelta import TileDeltaEncoder, KEYFRAME as DELTA_KEYFRAME
 import socket
 import time
 import struct
 import multiprocessing as mp
 import signal
-from threading import Thread
+from threading import Thread, Lock
 
 
 class Client:
@@ -17,10 +23,12 @@ class Client:
         self.__logger = create_logger(__name__, config.DebugMode, "client.log")
         self.__logger.debug("Initializing Client Class...")
         self.__processes_threads = []
+        self.__frame_ring = None
         # Network
         self.__ip = config.ServerIP
         self.__port = config.ServerPort
         self.__server_crashed = False
+        self.__management_lock = Lock()
         self.__management_connection = self.__create_connection()
         self.__stream_connection = self.__create_connection()
         self.__initialize_connections()
@@ -30,6 +38,8 @@ class Client:
         self.__update_server_resolution_if_necessary()
         self.__capture = Capture(self.__resolution)
         self.__set_server_fps()
+        self.__set_server_stream_encoding()
+        self.__live_view_port = self.__request_live_view_port()
         self.__logger.debug("resolution set.")
         self.__logger.debug("Client Class initialized.")
 
@@ -51,7 +61,12 @@ class Client:
         self.__logger.debug("Initialize management connection.")
         self.__management_connection.send(b"m")  # management
         self.__logger.debug("Initialize stream connection.")
-        self.__stream_connection.send(b"c")  # camera
+        self.__stream_connection.send(b"c" + VERSION.pack(PROTOCOL_VERSION))  # camera
+        version = VERSION.unpack(self.__stream_connection.recv(VERSION.size))[0]
+        if version != PROTOCOL_VERSION:
+            self.__logger.error(f"Server does not support frame protocol version {PROTOCOL_VERSION}.")
+            raise Exception("UNSUPPORTED FRAME PROTOCOL")
+        self.__logger.debug(f"frame protocol version {version} negotiated.")
 
     def __request_resolution(self):
         self.__logger.debug("request server resolution...")
@@ -67,10 +82,34 @@ class Client:
             self.__management_connection.send(struct.pack(">2H", height, width))
             self.__logger.debug("Send custom resolution to server.")
 
-    def __set_server_fps(self):
-        self.__management_connection.send(b"sf")  # set fps
-        self.__management_connection.send(struct.pack(">B", int(self.__capture.fps)))
-        self.__logger.debug("Send fps to server.")
+    def __set_server_fps(self, fps=None):
+        fps = int(self.__capture.fps) if fps is None else fps
+        # Also called from the capture thread when the motion gating changes the frame rate.
+        with self.__management_lock:
+            self.__management_connection.sendall(b"sf" + struct.pack(">B", fps))  # set fps
+        self.__logger.debug(f"Send fps to server: {fps}.")
+
+    def __change_frame_rate(self, fps):
+        try:
+            self.__set_server_fps(fps)
+        except OSError as e:
+            self.__logger.warning(e)
+
+    def __set_server_stream_encoding(self):
+        self.__management_connection.send(b"se")  # set encoding
+        self.__management_connection.send(struct.pack(">2B", config.StreamEncoding, config.JPEGQuality))
+        self.__logger.debug(f"Send stream encoding to server: {get_encoding_name(config.StreamEncoding)}.")
+
+    def __request_live_view_port(self):
+        if not config.LiveView:
+            return 0
+        self.__management_connection.send(b"lv")  # live view
+        port = struct.unpack(">H", self.__management_connection.recv(struct.calcsize(">H")))[0]
+        if port == 0:
+            self.__logger.info("server does not support the udp live view, it is shown from the stream.")
+        else:
+            self.__logger.debug(f"live view is sent over udp to port {port}.")
+        return port
 
     def run(self):
         self.__logger.info("starting client...")
@@ -94,6 +133,9 @@ class Client:
             # Stop Stream
             elif command == struct.pack(">?", False):
                 self.__stop_stream()
+            # pressure: the server falls behind and asks to lower the frame rate and quality.
+            elif command == b"p":
+                self.__set_pressure_level(struct.unpack(">B", self.__management_connection.recv(1))[0])
             # quit / shutdown
             elif command == b"q":
                 if len(self.__processes_threads) > 0:
@@ -108,27 +150,82 @@ class Client:
                     break
         self.__logger.debug("stop listening for commands.")
 
+    def __set_pressure_level(self, level):
+        if level != self.__capture.pressure_level.value:
+            self.__logger.info(f"server pressure level changed to {level}.")
+            self.__capture.pressure_level.value = level
+
     def __start_stream(self):
         self.__logger.info("starting stream...")
-        frame_pipe_out, frame_pipe_in = mp.Pipe(False)
-        self.__capture.start(frame_pipe_in)
-        self.__start_streaming_process(frame_pipe_out)
+        self.__frame_ring = FrameRing(config.FrameQueueDepth, self.__resolution)
+        self.__limit_stream_send_buffer(self.__frame_ring)
+        self.__capture.start(self.__frame_ring, self.__change_frame_rate)
+        self.__start_streaming_process(self.__frame_ring)
         self.__logger.debug("stream started.")
 
-    def __start_streaming_process(self, pipe_out):
-        def loop(log, is_running, pipe, conn, wait_frame):
+    def __limit_stream_send_buffer(self, frame_ring):
+        # Keep the kernel from queueing more frames than the frame ring would.
+        send_buffer_size = frame_ring.depth * frame_ring.frame_byte_size
+        self.__stream_connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer_size)
+        self.__logger.debug(f"stream send buffer limited to {send_buffer_size} bytes.")
+
+    def __start_streaming_process(self, frame_ring):
+        def loop(log, is_running, ring, conn, wait_frame, encoding, quality, delta_encoder, resolution,
+                 pressure_level, live_view_port):
             log.info("streaming...")
+            raw_bytes = 0
+            sent_bytes = 0
+            last_report = time.monotonic()
+            video_encoder = None
+            if encoding in VIDEO_STREAM_ENCODINGS:
+                video_encoder = VideoStreamEncoder(resolution, CODECS[get_encoding_name(encoding)],
+                                                   config.FFMPEGStreamOptions, log)
+                video_encoder.start(conn)
+            live_view = LiveViewSender(config.ServerIP, live_view_port, config.LiveViewFPS, config.LiveViewQuality,
+                                       config.LiveViewChunkSize) if live_view_port != 0 else None
             try:
                 while is_running.value:
-                    frame = pipe.recv_bytes()
-                    conn.sendall(frame)
+                    if time.monotonic() - last_report >= 60:
+                        log.debug(f"{ring.get_counters()}.")
+                        last_report = time.monotonic()
+                    index = ring.acquire(FORMATTED, SENDING, is_running)
+                    if index is None:
+                        continue
+                    raw_bytes += ring.frame_byte_size
+                    if video_encoder is not None:
+                        video_encoder.write(ring.buffer(index))
+                    else:
+                        sequence, capture_time = ring.sequence(index), ring.capture_time(index)
+                        if encoding == RAW:
+                            frame, flags = ring.buffer(index), KEYFRAME
+                        elif encoding == JPEG:
+                            frame_quality = max(quality - pressure_level.value * config.PressureQualityStep, 1)
+                            frame, flags = encode_jpeg(ring.frame(index), frame_quality), KEYFRAME
+                        else:
+                            frame = delta_encoder.encode(ring.frame(index))
+                            flags = KEYFRAME if frame[0] & DELTA_KEYFRAME else 0
+                        sent_bytes += send_frame(conn, frame, sequence, capture_time, flags)
+                    if live_view is not None:
+                        live_view.send(ring.frame(index))
+                    ring.release(index)
             except (BrokenPipeError, OSError) as e:
                 log.warning(e)
                 log.debug("Handled TCP error from server crash.")
-            log.info("stream stopped.")
+            if video_encoder is not None:
+                video_encoder.stop()
+                sent_bytes += video_encoder.sent_bytes
+            if live_view is not None:
+                live_view.close()
+                log.info(f"live view stopped. {live_view.sent_bytes} bytes sent, "
+                         f"{live_view.failed_frames} frames not sent.")
+            log.info(f"stream stopped. {sent_bytes} bytes sent, {raw_bytes - sent_bytes} bytes saved.")
 
-        p = mp.Process(target=loop, args=(self.__logger, self.__capture.is_running, pipe_out, self.__stream_connection,
-                                          config.WaitAfterFrame), daemon=True)
+        delta_encoder = TileDeltaEncoder(self.__resolution, config.DeltaTileSize, config.DeltaThreshold,
+                                         config.DeltaKeyframeInterval) if config.StreamEncoding == DELTA else None
+        p = mp.Process(target=loop, args=(self.__logger, self.__capture.is_running, frame_ring,
+                                          self.__stream_connection, config.WaitAfterFrame, config.StreamEncoding,
+                                          config.JPEGQuality, delta_encoder, self.__resolution,
+                                          self.__capture.pressure_level, self.__live_view_port), daemon=True)
         p.start()
         self.__processes_threads.append(p)
 
@@ -136,6 +233,13 @@ class Client:
         self.__logger.info("stopping stream...")
         self.__capture.stop()
         self.__join_all_processes_threads()
+        self.__close_frame_ring()
+
+    def __close_frame_ring(self):
+        if self.__frame_ring is not None:
+            self.__logger.info(f"closing frame ring. {self.__frame_ring.get_counters()}.")
+            self.__frame_ring.close()
+            self.__frame_ring = None
 
     def __join_all_processes_threads(self):
         self.__processes_threads += self.__capture.get_processes_threads()
@@ -182,6 +286,8 @@ class Client:
                 self.__logger.info("Restarting client...")
                 self.__initialize_connections()
                 self.__update_server_resolution_if_necessary()
+                self.__set_server_stream_encoding()
+                self.__live_view_port = self.__request_live_view_port()
                 self.__request_stream_start()
                 self.__logger.info("Client Successfully restarted.")
         else:
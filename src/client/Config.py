@@ -1,5 +1,7 @@
 from src.shared.Logger import create_logger
 from src.shared.ConfigVerifier import ConfigVerifier
+from src.shared.FrameCodec import ENCODINGS
+from src.shared.LiveViewProtocol import CHUNK_HEADER, MAX_DATAGRAM_SIZE
 import configparser
 import cv2
 import sys
@@ -29,12 +31,41 @@ class Config:
         self.__log_custom_resolution_mode()
         self.CustomFrameHeight = client_config["VideoCapture"].getint("CustomFrameHeight")
         self.CustomFrameWidth = client_config["VideoCapture"].getint("CustomFrameWidth")
+        self.FrameQueueDepth = client_config["VideoCapture"].getint("FrameQueueDepth")
         self.__logger.debug("Camera settings loaded.")
+        # Stream Variables
+        self.__logger.debug("Loading Stream settings...")
+        self.StreamEncoding = client_config["Stream"]["StreamEncoding"].strip().lower()
+        self.JPEGQuality = client_config["Stream"].getint("JPEGQuality")
+        self.PressureQualityStep = client_config["Stream"].getint("PressureQualityStep")
+        self.DeltaTileSize = client_config["Stream"].getint("DeltaTileSize")
+        self.DeltaThreshold = client_config["Stream"].getint("DeltaThreshold")
+        self.DeltaKeyframeInterval = client_config["Stream"].getint("DeltaKeyframeInterval")
+        self.FFMPEGStreamOptions = client_config["Stream"]["FFMPEGStreamOptions"].strip()
+        self.__logger.debug("Stream settings loaded.")
+        # Motion Variables
+        self.__logger.debug("Loading Motion settings...")
+        self.MotionGating = client_config["Motion"].getboolean("MotionGating")
+        self.IdleFPS = client_config["Motion"].getint("IdleFPS")
+        self.IdleAfter = client_config["Motion"].getfloat("IdleAfter")
+        self.MotionPixelThreshold = client_config["Motion"].getint("MotionPixelThreshold")
+        self.MotionAreaThreshold = client_config["Motion"].getfloat("MotionAreaThreshold")
+        self.__logger.debug("Motion settings loaded.")
+        # Live View Variables
+        self.__logger.debug("Loading Live View settings...")
+        self.LiveView = client_config["LiveView"].getboolean("LiveView")
+        self.LiveViewFPS = client_config["LiveView"].getfloat("LiveViewFPS")
+        self.LiveViewQuality = client_config["LiveView"].getint("LiveViewQuality")
+        self.LiveViewChunkSize = client_config["LiveView"].getint("LiveViewChunkSize")
+        self.__logger.debug("Live View settings loaded.")
         # Check Values
         self.__logger.debug("verifying settings...")
         self.__config_verifier = ConfigVerifier(self.__logger)
         self.__check_network_settings()
         self.__check_video_capture_settings()
+        self.__check_stream_settings()
+        self.__check_motion_settings()
+        self.__check_live_view_settings()
         self.__logger.debug("settings verified.")
         self.__logger.info("Configuration file loaded.")
 
@@ -66,6 +97,86 @@ class Config:
             self.__config_verifier.check_frame_height(self.CustomFrameHeight)
             self.__config_verifier.check_frame_width(self.CustomFrameWidth)
 
+        self.__logger.debug("verifying FrameQueueDepth.")
+        if self.FrameQueueDepth < 1:
+            self.__logger.error("Bad FrameQueueDepth value in config. %s", "Value must be at least 1.")
+            raise Exception("BAD FRAME QUEUE DEPTH")
+
+    def __check_stream_settings(self):
+        self.__logger.debug("verifying StreamEncoding.")
+        if self.StreamEncoding not in ENCODINGS:
+            self.__logger.error("Bad StreamEncoding value in config. %s", f"Allowed values: {', '.join(ENCODINGS)}")
+            raise Exception("BAD STREAM ENCODING")
+        self.StreamEncoding = ENCODINGS[self.StreamEncoding]
+
+        self.__logger.debug("verifying JPEGQuality.")
+        if self.JPEGQuality < 1 or self.JPEGQuality > 100:
+            self.__logger.error("Bad JPEGQuality value in config. %s", "Allowed values: 1 <= quality <= 100")
+            raise Exception("BAD JPEG QUALITY")
+
+        self.__logger.debug("verifying PressureQualityStep.")
+        if self.PressureQualityStep < 0 or self.PressureQualityStep > 100:
+            self.__logger.error("Bad PressureQualityStep value in config. %s", "Allowed values: 0 <= step <= 100")
+            raise Exception("BAD PRESSURE QUALITY STEP")
+
+        self.__logger.debug("verifying DeltaTileSize.")
+        if self.DeltaTileSize < 1 or self.DeltaTileSize > 65535:
+            self.__logger.error("Bad DeltaTileSize value in config. %s", "Allowed values: 1 <= size <= 65535")
+            raise Exception("BAD DELTA TILE SIZE")
+
+        self.__logger.debug("verifying DeltaThreshold.")
+        if self.DeltaThreshold < 0 or self.DeltaThreshold > 255:
+            self.__logger.error("Bad DeltaThreshold value in config. %s", "Allowed values: 0 <= threshold <= 255")
+            raise Exception("BAD DELTA THRESHOLD")
+
+        self.__logger.debug("verifying DeltaKeyframeInterval.")
+        if self.DeltaKeyframeInterval < 1:
+            self.__logger.error("Bad DeltaKeyframeInterval value in config. %s", "Value must be at least 1.")
+            raise Exception("BAD DELTA KEYFRAME INTERVAL")
+
+        self.__logger.debug("verifying FFMPEGStreamOptions.")
+        if "&&" in self.FFMPEGStreamOptions:
+            self.__logger.error("FFMPEG options can not contain '&&'.")
+            raise Exception("BAD FFMPEG STREAM OPTIONS")
+
+    def __check_motion_settings(self):
+        self.__logger.debug("verifying IdleFPS.")
+        if self.IdleFPS < 1 or self.IdleFPS > 255:
+            self.__logger.error("Bad IdleFPS value in config. %s", "Allowed values: 1 <= fps <= 255")
+            raise Exception("BAD IDLE FPS")
+
+        self.__logger.debug("verifying IdleAfter.")
+        if self.IdleAfter < 0:
+            self.__logger.error("Bad IdleAfter value in config. %s", "Value can not be negative.")
+            raise Exception("BAD IDLE AFTER VALUE")
+
+        self.__logger.debug("verifying MotionPixelThreshold.")
+        if self.MotionPixelThreshold < 0 or self.MotionPixelThreshold > 255:
+            self.__logger.error("Bad MotionPixelThreshold value in config. %s", "Allowed values: 0 <= value <= 255")
+            raise Exception("BAD MOTION PIXEL THRESHOLD")
+
+        self.__logger.debug("verifying MotionAreaThreshold.")
+        if self.MotionAreaThreshold < 0 or self.MotionAreaThreshold > 1:
+            self.__logger.error("Bad MotionAreaThreshold value in config. %s", "Allowed values: 0 <= value <= 1")
+            raise Exception("BAD MOTION AREA THRESHOLD")
+
+    def __check_live_view_settings(self):
+        self.__logger.debug("verifying LiveViewFPS.")
+        if self.LiveViewFPS <= 0:
+            self.__logger.error("Bad LiveViewFPS value in config. %s", "Value must be above 0.")
+            raise Exception("BAD LIVE VIEW FPS")
+
+        self.__logger.debug("verifying LiveViewQuality.")
+        if self.LiveViewQuality < 1 or self.LiveViewQuality > 100:
+            self.__logger.error("Bad LiveViewQuality value in config. %s", "Allowed values: 1 <= quality <= 100")
+            raise Exception("BAD LIVE VIEW QUALITY")
+
+        self.__logger.debug("verifying LiveViewChunkSize.")
+        if self.LiveViewChunkSize < 1 or self.LiveViewChunkSize > MAX_DATAGRAM_SIZE - CHUNK_HEADER.size:
+            self.__logger.error("Bad LiveViewChunkSize value in config. %s",
+                                f"Allowed values: 1 <= size <= {MAX_DATAGRAM_SIZE - CHUNK_HEADER.size}")
+            raise Exception("BAD LIVE VIEW CHUNK SIZE")
+
     def __check_capture_device(self):
         if self.CaptureDevice < 0:
             self.__logger.error("Bad CaptureDevice value. %s", "Value can not be negative.")
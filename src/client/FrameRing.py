@@ -0,0 +1,125 @@
+from multiprocessing import shared_memory
+import multiprocessing as mp
+import numpy as np
+import ctypes
+
+# Slot states:
+FREE = 0
+CAPTURING = 1
+CAPTURED = 2
+FORMATTING = 3
+FORMATTED = 4
+SENDING = 5
+
+
+# Frame slots in shared memory that capture, overlay and send work on in place.
+# At most `depth` frames wait between the stages, if another one arrives the oldest waiting frame is dropped
+# (latest-frame-wins). One extra slot per stage is reserved for the frame that is currently worked on.
+class FrameRing:
+    def __init__(self, depth, resolution):
+        self.height, self.width = resolution
+        self.depth = depth
+        self.slots = depth + 3
+        self.frame_byte_size = self.height * self.width * 3
+        self.__shm = shared_memory.SharedMemory(create=True, size=self.slots * self.frame_byte_size)
+        self.__frames = [np.ndarray((self.height, self.width, 3), dtype=np.uint8, buffer=self.__shm.buf,
+                                    offset=index * self.frame_byte_size) for index in range(self.slots)]
+        self.__states = mp.RawArray(ctypes.c_byte, self.slots)
+        self.__sequences = mp.RawArray(ctypes.c_ulonglong, self.slots)
+        self.__capture_times = mp.RawArray(ctypes.c_double, self.slots)
+        # captured, dropped, sent
+        self.__counters = mp.RawArray(ctypes.c_ulonglong, 3)
+        self.__condition = mp.Condition()
+
+    def frame(self, index):
+        return self.__frames[index]
+
+    def buffer(self, index):
+        return self.__shm.buf[index * self.frame_byte_size:(index + 1) * self.frame_byte_size]
+
+    def sequence(self, index):
+        return self.__sequences[index]
+
+    def capture_time(self, index):
+        return self.__capture_times[index]
+
+    @property
+    def captured(self):
+        return self.__counters[0]
+
+    @property
+    def dropped(self):
+        return self.__counters[1]
+
+    @property
+    def sent(self):
+        return self.__counters[2]
+
+    def get_counters(self):
+        return f"{self.captured} frames captured, {self.dropped} dropped, {self.sent} sent"
+
+    def acquire_free_slot(self):
+        with self.__condition:
+            index = self.__find_slot(FREE)
+            if index is None:
+                index = self.__find_oldest_waiting_slot()
+                if index is None:
+                    return None
+                self.__counters[1] += 1
+            self.__states[index] = CAPTURING
+            return index
+
+    def publish(self, index, state, capture_time=0.0):
+        with self.__condition:
+            if state == CAPTURED:
+                self.__capture_times[index] = capture_time
+                self.__sequences[index] = self.__counters[0]
+                self.__counters[0] += 1
+            self.__states[index] = state
+            self.__drop_waiting_frames_above_depth()
+            self.__condition.notify_all()
+
+    def acquire(self, state, new_state, is_running, timeout=0.5):
+        with self.__condition:
+            while is_running.value:
+                index = self.__find_oldest_slot((state,))
+                if index is not None:
+                    self.__states[index] = new_state
+                    return index
+                self.__condition.wait(timeout)
+        return None
+
+    def release(self, index):
+        with self.__condition:
+            if self.__states[index] == SENDING:
+                self.__counters[2] += 1
+            self.__states[index] = FREE
+            self.__condition.notify_all()
+
+    def __drop_waiting_frames_above_depth(self):
+        waiting = sum(1 for index in range(self.slots) if self.__states[index] in (CAPTURED, FORMATTED))
+        for _ in range(waiting - self.depth):
+            self.__states[self.__find_oldest_waiting_slot()] = FREE
+            self.__counters[1] += 1
+
+    def __find_slot(self, state):
+        for index in range(self.slots):
+            if self.__states[index] == state:
+                return index
+        return None
+
+    def __find_oldest_waiting_slot(self):
+        return self.__find_oldest_slot((CAPTURED, FORMATTED))
+
+    def __find_oldest_slot(self, states):
+        oldest = None
+        for index in range(self.slots):
+            if self.__states[index] in states and \
+                    (oldest is None or self.__sequences[index] < self.__sequences[oldest]):
+                oldest = index
+        return oldest
+
+    def close(self):
+        self.__frames.clear()
+        self.__shm.close()
+        self.__shm.unlink()
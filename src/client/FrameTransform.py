@@ -0,0 +1,50 @@
+import numpy as np
+import cv2
+import time
+
+
+# Mirrors the captured frame and scales it to the streaming resolution straight into the frame slot.
+# The flip is done on whichever side of the resize is smaller. A single cv2.remap pass was measured to be slower
+# than cv2.resize plus a flip of the smaller frame.
+class FrameTransform:
+    def __init__(self, source_resolution, resolution):
+        self.__source_height, self.__source_width = source_resolution
+        self.__height, self.__width = resolution
+        self.needs_resize = source_resolution != resolution
+        self.__downscale = self.__source_height * self.__source_width > self.__height * self.__width
+        buffer_shape = (self.__height, self.__width, 3) if self.__downscale \
+            else (self.__source_height, self.__source_width, 3)
+        self.__buffer = np.empty(buffer_shape, dtype=np.uint8) if self.needs_resize else None
+
+    @property
+    def source_resolution(self):
+        return self.__source_height, self.__source_width
+
+    def apply(self, frame, dst):
+        if not self.needs_resize:
+            cv2.flip(frame, 1, dst=dst)
+        elif self.__downscale:
+            cv2.resize(frame, (self.__width, self.__height), dst=self.__buffer)
+            cv2.flip(self.__buffer, 1, dst=dst)
+        else:
+            cv2.flip(frame, 1, dst=self.__buffer)
+            cv2.resize(self.__buffer, (self.__width, self.__height), dst=dst)
+        return dst
+
+    def measure(self, repetitions=20):
+        frame = np.zeros((self.__source_height, self.__source_width, 3), dtype=np.uint8)
+        dst = np.empty((self.__height, self.__width, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            self.apply(frame, dst)
+        return (time.perf_counter() - start) / repetitions
+
+    @staticmethod
+    def measure_flip_and_resize(source_resolution, resolution, repetitions=20):
+        # The way frames were prepared before: flip at capture size, then resize.
+        frame = np.zeros((*source_resolution, 3), dtype=np.uint8)
+        height, width = resolution
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            cv2.resize(cv2.flip(frame, 1), (width, height))
+        return (time.perf_counter() - start) / repetitions
@@ -0,0 +1,35 @@
+from src.shared.FrameCodec import encode_jpeg
+from src.shared.LiveViewProtocol import send_chunks
+import socket
+import time
+
+
+# Sends frames for the live view of the webserver as jpeg over udp, at most fps frames per second.
+# Nothing is resent, a frame that loses a packet is simply not shown.
+class LiveViewSender:
+    def __init__(self, server_ip, port, fps, quality, chunk_size):
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__sock.connect((server_ip, port))
+        self.__interval = 1 / fps
+        self.__quality = quality
+        self.__chunk_size = chunk_size
+        self.__sequence = 0
+        self.__last_frame_time = 0.0
+        self.sent_bytes = 0
+        self.failed_frames = 0
+
+    def send(self, frame):
+        now = time.monotonic()
+        if now - self.__last_frame_time < self.__interval:
+            return
+        self.__last_frame_time = now
+        self.__sequence += 1
+        try:
+            self.sent_bytes += send_chunks(self.__sock, encode_jpeg(frame, self.__quality), self.__sequence,
+                                           self.__chunk_size)
+        except OSError:
+            # e.g. the server was not reachable, the live view must never stop the recorded stream.
+            self.failed_frames += 1
+
+    def close(self):
+        self.__sock.close()
@@ -0,0 +1,30 @@
+import numpy as np
+import time
+
+
+# Compares downscaled grayscale versions of consecutive frames.
+class MotionDetector:
+    def __init__(self, pixel_threshold, area_threshold, idle_after, sample_width=80):
+        self.__pixel_threshold = pixel_threshold
+        self.__area_threshold = area_threshold
+        self.__idle_after = idle_after
+        self.__sample_width = sample_width
+        self.__previous = None
+        self.__last_motion = time.monotonic()
+
+    def detect(self, frame):
+        step = max(frame.shape[1] // self.__sample_width, 1)
+        small = frame[::step, ::step].astype(np.uint16)
+        # BGR to grayscale with integer weights (sum = 256).
+        gray = ((small[:, :, 0] * 29 + small[:, :, 1] * 150 + small[:, :, 2] * 77) >> 8).astype(np.int16)
+        previous, self.__previous = self.__previous, gray
+        if previous is None or previous.shape != gray.shape:
+            return False
+        changed = np.count_nonzero(np.abs(gray - previous) > self.__pixel_threshold)
+        if changed > self.__area_threshold * gray.size:
+            self.__last_motion = time.monotonic()
+            return True
+        return False
+
+    def is_idle(self):
+        return time.monotonic() - self.__last_motion >= self.__idle_after
@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+import time
+from datetime import datetime
+
+
+# Renders the date and record timer tiles once per change and blits the cached patches onto every frame.
+class Overlay:
+    def __init__(self, resolution):
+        self.__height, self.__width = resolution
+        self.__date_tile = (10, self.__height - 25, 195, self.__height - 5)
+        self.__timer_tile = ((self.__width - 10) - 95, self.__height - 25, self.__width - 10, self.__height - 5)
+        self.__current_second = None
+        self.__date_patch = None
+        self.__record_timer = None
+        self.__timer_patch = None
+
+    def apply(self, frame, record_start_time):
+        second = int(time.time())
+        if second != self.__current_second:
+            self.__current_second = second
+            now = datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+            self.__date_patch = self.__render_tile(now, self.__date_tile)
+            record_timer = self.__format_record_timer(second - int(record_start_time.value))
+            if record_timer != self.__record_timer:
+                self.__record_timer = record_timer
+                self.__timer_patch = self.__render_tile(record_timer, self.__timer_tile)
+        self.__blit(frame, self.__date_patch)
+        self.__blit(frame, self.__timer_patch)
+        return frame
+
+    @staticmethod
+    def __format_record_timer(elapsed_seconds):
+        days, rem = divmod(max(elapsed_seconds, 0), 86400)
+        if days > 99:  # max REC timer value
+            return "99:23:59:59"
+        hours, rem = divmod(rem, 3600)
+        minutes, seconds = divmod(rem, 60)
+        return f"{days:02d}:{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+    def __render_tile(self, text, tile):
+        # The text is drawn at the bottom left of the black tile and may stick out of it.
+        x0, y0, x1, y1 = tile
+        origin_x, origin_y = x0, y1 - 5
+        (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+        left, top = max(min(x0, origin_x), 0), max(min(y0, origin_y - text_height), 0)
+        right = min(max(x1, origin_x + text_width), self.__width - 1)
+        bottom = min(max(y1, origin_y + baseline), self.__height - 1)
+        if right < left or bottom < top:
+            return None
+        patch = np.zeros((bottom - top + 1, right - left + 1, 3), dtype=np.uint8)
+        cv2.putText(patch, text, (origin_x - left, origin_y - top), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        mask = patch.any(axis=2)
+        mask[max(y0 - top, 0):y1 - top + 1, max(x0 - left, 0):x1 - left + 1] = True
+        region = (slice(top, bottom + 1), slice(left, right + 1))
+        return region, patch, None if mask.all() else mask[:, :, np.newaxis]
+
+    @staticmethod
+    def __blit(frame, tile_patch):
+        if tile_patch is None:
+            return
+        region, patch, mask = tile_patch
+        if mask is None:
+            frame[region] = patch
+        else:
+            np.copyto(frame[region], patch, where=mask)
@@ -0,0 +1,70 @@
+from src.shared.FrameProtocol import send_frame
+from src.shared.FFMPEGOptions import get_frame_rate_mode_option
+from threading import Thread
+import subprocess
+import time
+
+CODECS = {"h264": "libx264", "h265": "libx265"}
+
+
+# Encodes the frames with a local ffmpeg process and streams the resulting MPEG-TS to the server.
+class VideoStreamEncoder:
+    def __init__(self, resolution, codec, options, log):
+        self.__height, self.__width = resolution
+        self.__codec = codec
+        self.__options = options
+        self.__log = log
+        self.__proc = None
+        self.__sender = None
+        self.sent_bytes = 0
+
+    def __get_ffmpeg_command(self):
+        ffmpeg_command = ["ffmpeg",
+                          "-loglevel", "error",
+                          "-f", "rawvideo",
+                          "-vcodec", "rawvideo",
+                          "-video_size", f"{self.__width}x{self.__height}",
+                          "-pixel_format", "bgr24",
+                          # Frames are timestamped when they arrive, the frame rate changes with motion gating.
+                          "-use_wallclock_as_timestamps", "1",
+                          "-i", "pipe:0",
+                          "-c:v", self.__codec,
+                          "-pix_fmt", "yuv420p",
+                          get_frame_rate_mode_option(), "passthrough"]
+        ffmpeg_command += self.__options.split()
+        ffmpeg_command += ["-f", "mpegts", "pipe:1"]
+        return ffmpeg_command
+
+    def start(self, conn):
+        self.__log.debug(f"starting {self.__codec} encoder...")
+        self.__proc = subprocess.Popen(self.__get_ffmpeg_command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.__sender = Thread(target=self.__send_encoded_stream, args=[conn], daemon=True)
+        self.__sender.start()
+
+    def __send_encoded_stream(self, conn):
+        sequence = 0
+        try:
+            while True:
+                chunk = self.__proc.stdout.read1(65536)
+                if not chunk:
+                    break
+                self.sent_bytes += send_frame(conn, chunk, sequence, time.monotonic())
+                sequence += 1
+        except (BrokenPipeError, OSError) as e:
+            self.__log.warning(e)
+        self.__log.debug(f"{self.__codec} encoder output closed.")
+
+    def write(self, frame_buffer):
+        self.__proc.stdin.write(frame_buffer)
+        self.__proc.stdin.flush()
+
+    def stop(self):
+        if self.__proc is None:
+            return
+        try:
+            self.__proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.__proc.wait()
+        self.__sender.join(timeout=10)
+        self.__log.debug(f"{self.__codec} encoder stopped with exit code {self.__proc.returncode}.")
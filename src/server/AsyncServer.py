@@ -0,0 +1,431 @@
+from VideoWriter import VideoWriter
+from ConnectionHandoff import CLOSE_ALL_CLIENTS
+from StreamStatistics import StreamStatistics
+from StreamDecoder import StreamDecoder
+from src.shared.Logger import create_logger
+from src.server.Config import config
+from src.shared.FrameCodec import RAW, VIDEO_STREAM_ENCODINGS, get_encoding_name
+from src.shared.FrameProtocol import VERSION, FRAME_HEADER, negotiate_version, unpack_header
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing as mp
+import asyncio
+import ctypes
+import struct
+
+
+# Handles the management and camera connections of all clients in a single event loop instead of a thread per
+# management connection and a process per camera stream.
+# Everything that blocks (decoding, writing frames to disk or to the VideoWriter pipes) runs in an executor.
+class AsyncServer:
+    def __init__(self, tcp_sock, webserver, to_be_encoded_in, camera_worker_pool, live_view_receiver, metrics, height,
+                 width, connection_handoff=None, listener_index=0):
+        self.__logger = create_logger(__name__, config.DebugMode, "server.log")
+        self.__logger.debug("[Server]: Initializing AsyncServer Class...")
+        self.__tcp_sock = tcp_sock
+        self.__webserver = webserver
+        self.__to_be_encoded_in = to_be_encoded_in
+        self.__camera_worker_pool = camera_worker_pool
+        self.__live_view_receiver = live_view_receiver
+        self.__metrics = metrics
+        # Only set in the SO_REUSEPORT listener processes.
+        self.__connection_handoff = connection_handoff
+        self.__listener_index = listener_index
+        self.__connection_tasks = set()
+        self.__height = height
+        self.__width = width
+        self.__loop = None
+        self.__executor = ThreadPoolExecutor(thread_name_prefix="AsyncServer")
+        # Client Connections
+        self.__management_connections = {}
+        self.__stream_connections = {}
+        self.__stream_connected = {}
+        # Tasks and Processes
+        self.__management_tasks = {}
+        self.__stream_tasks = {}
+        self.__camera_processes = {}
+        self.__camera_slots = {}
+        self.__writer_lags = {}
+        self.__logger.debug("[Server]: AsyncServer Class Initialized.")
+
+    def run(self):
+        asyncio.run(self.__serve())
+
+    async def __serve(self):
+        self.__loop = asyncio.get_running_loop()
+        if self.__connection_handoff is not None:
+            await self.__serve_as_listener()
+            return
+        server = await asyncio.start_server(self.__handle_new_connection, sock=self.__tcp_sock)
+        self.__logger.debug("[Server]: event loop started.")
+        async with server:
+            await server.serve_forever()
+
+    async def __serve_as_listener(self):
+        self.__logger.debug(f"[Server]: event loop of listener {self.__listener_index} started.")
+        self.__tcp_sock.setblocking(False)
+        self.__loop.add_reader(self.__connection_handoff.get_listener_connection(self.__listener_index),
+                               self.__receive_handoff_message)
+        while True:
+            conn, addr = await self.__loop.sock_accept(self.__tcp_sock)
+            # Clients of other listeners are passed on before anything is read, they start their handshake there.
+            if self.__connection_handoff.get_owner(addr[0]) != self.__listener_index:
+                self.__connection_handoff.pass_connection(addr[0], conn)
+                conn.close()
+                continue
+            self.__start_connection_task(conn)
+
+    def __receive_handoff_message(self):
+        message, conn = self.__connection_handoff.receive(self.__listener_index)
+        if message == CLOSE_ALL_CLIENTS:
+            self.__loop.create_task(self.__close_all_clients_for_coordinator())
+        elif conn is not None:
+            self.__start_connection_task(conn)
+
+    def __start_connection_task(self, conn):
+        task = self.__loop.create_task(self.__open_connection(conn))
+        # The event loop only keeps weak references to its tasks.
+        self.__connection_tasks.add(task)
+        task.add_done_callback(self.__connection_tasks.discard)
+
+    async def __open_connection(self, conn):
+        reader, writer = await asyncio.open_connection(sock=conn)
+        await self.__handle_new_connection(reader, writer)
+
+    async def __run_blocking(self, function, *args):
+        return await self.__loop.run_in_executor(self.__executor, function, *args)
+
+    async def __handle_new_connection(self, reader, writer):
+        ip = writer.get_extra_info("peername")[0]
+        self.__logger.debug(f"[Server]: client {ip} connected to server.")
+        try:
+            # Each step of the handshake has to be finished within the HandshakeTimeout.
+            identifier = await asyncio.wait_for(reader.read(1), timeout=config.HandshakeTimeout)
+        except asyncio.TimeoutError:
+            self.__logger.warning(f"[Server]: handshake with client {ip} timed out, connection dropped.")
+            writer.close()
+            return
+        self.__logger.debug(f"[Server]: identifier received: '{identifier.decode('utf-8', 'replace')}' "
+                            f"from client: {ip}")
+        # management
+        if identifier == b"m":
+            self.__logger.debug(f"[{ip}]: management connection created.")
+            self.__management_connections[ip] = writer
+            self.__management_tasks[ip] = asyncio.current_task()
+            try:
+                await self.__handle_management_connection(reader, writer, ip)
+            finally:
+                if self.__management_tasks.get(ip) is asyncio.current_task():
+                    del self.__management_tasks[ip]
+        # camera
+        elif identifier == b"c" and await self.__wait_for_management_connection(ip) and \
+                await self.__negotiate_frame_protocol(reader, writer, ip):
+            self.__logger.debug(f"[{ip}]: camera connection created.")
+            self.__stream_connections[ip] = (reader, writer)
+            self.__get_stream_connected_event(ip).set()
+        else:
+            self.__logger.debug(f"[Server]: dropping identifier {identifier.decode('utf-8', 'replace')}...")
+            writer.close()
+            self.__logger.debug("[Server]: connection dropped.")
+
+    def __get_stream_connected_event(self, ip):
+        if ip not in self.__stream_connected:
+            self.__stream_connected[ip] = asyncio.Event()
+        return self.__stream_connected[ip]
+
+    async def __wait_for_management_connection(self, ip):
+        # Clients open both connections at once, the handshake of the management connection may still be running.
+        deadline = self.__loop.time() + config.HandshakeTimeout
+        while self.__management_connections.get(ip) is None and self.__loop.time() < deadline:
+            await asyncio.sleep(0.01)
+        return self.__management_connections.get(ip) is not None
+
+    async def __negotiate_frame_protocol(self, reader, writer, ip):
+        try:
+            client_version = (await self.__read_arguments(reader, VERSION.format))[0]
+        except asyncio.IncompleteReadError:
+            return False
+        except asyncio.TimeoutError:
+            self.__logger.warning(f"[Server]: client {ip} did not send its frame protocol version in time.")
+            return False
+        version = negotiate_version(client_version)
+        writer.write(VERSION.pack(version))
+        await writer.drain()
+        self.__logger.debug(f"[{ip}]: frame protocol version {version} negotiated (client: {client_version}).")
+        return version != 0
+
+    async def __handle_management_connection(self, reader, writer, ip):
+        log = self.__logger
+        log.debug(f"[{ip}]: handling management connection...")
+        try:
+            # Shared with the VideoWriter, clients may change the fps while streaming (motion gating).
+            is_running, fps, writer_lag = self.__create_stream_values(ip)
+            await self.__listen_for_commands(reader, writer, ip, is_running, fps)
+        finally:
+            # No entries are left behind on any way out, a reconnecting client must not find the old connections.
+            if self.__management_connections.get(ip) is writer:
+                self.__close_client_connections(ip)
+            await self.__run_blocking(self.__release_stream_values, ip)
+        log.debug(f"[{ip}]: stopped listening for commands.")
+
+    async def __listen_for_commands(self, reader, writer, ip, is_running, fps):
+        log = self.__logger
+        height, width = self.__height, self.__width
+        encoding = RAW
+        live_view = False
+        log.debug(f"[{ip}]: listening for commands...")
+        while True:
+            try:
+                request = await reader.read(2)
+                log.debug(f"[{ip}]: command received: {request!r}")
+                # get Resolution
+                if request == b"gr":
+                    log.debug(f"[{ip}]: sending frame resolution to client...")
+                    writer.write(struct.pack(">2H", height, width))
+                    await writer.drain()
+                    log.debug(f"[{ip}]: resolution send.")
+                # set resolution
+                elif request == b"sr":
+                    log.debug(f"[{ip}]: receiving custom resolution...")
+                    height, width = await self.__read_arguments(reader, ">2H")
+                    log.debug(f"[{ip}]: custom resolution received: {width}x{height}.")
+                # set fps
+                elif request == b"sf":
+                    fps.value = (await self.__read_arguments(reader, ">B"))[0]
+                    log.debug(f"[{ip}]: fps set to {fps.value}.")
+                # set encoding
+                elif request == b"se":
+                    encoding, quality = await self.__read_arguments(reader, ">2B")
+                    log.debug(f"[{ip}]: stream encoding set to {get_encoding_name(encoding)} (quality {quality}).")
+                # live view
+                elif request == b"lv":
+                    live_view = self.__live_view_receiver is not None
+                    writer.write(struct.pack(">H", self.__live_view_receiver.port if live_view else 0))
+                    await writer.drain()
+                    log.debug(f"[{ip}]: live view over udp {'accepted' if live_view else 'not available'}.")
+                # start stream
+                elif request == struct.pack(">?", True):
+                    log.debug(f"[{ip}]: requests stream start...")
+                    await self.__start_stream(is_running, height, width, ip, writer, fps, encoding, live_view)
+                # client closed
+                elif request == struct.pack(">?", False):
+                    log.debug(f"[{ip}]: client shutting down...")
+                    await self.__close_client(ip, is_running)
+                    break
+                # client crashed
+                elif request == b"":
+                    await self.__handle_client_crash(is_running, ip)
+                    break
+            except asyncio.IncompleteReadError:
+                await self.__handle_client_crash(is_running, ip)
+                break
+            except asyncio.TimeoutError:
+                log.warning(f"[{ip}]: command arguments not received in time.")
+                await self.__handle_client_crash(is_running, ip)
+                break
+            except OSError:
+                # When connection was closed properly.
+                log.debug(f"[{ip}]: connection dead.")
+                break
+
+    @staticmethod
+    async def __read_arguments(reader, fmt):
+        # A client that sent a command has to send its arguments right after it.
+        size = struct.calcsize(fmt)
+        return struct.unpack(fmt, await asyncio.wait_for(reader.readexactly(size), timeout=config.HandshakeTimeout))
+
+    def __create_stream_values(self, ip):
+        if self.__camera_worker_pool is None:
+            is_running, fps = mp.Value(ctypes.c_bool, False), mp.Value(ctypes.c_ubyte, 30, lock=False)
+            writer_lag = mp.Value(ctypes.c_double, 0.0, lock=False)
+        else:
+            slot, is_running, fps, writer_lag = self.__camera_worker_pool.reserve_slot()
+            self.__camera_slots[ip] = slot
+        self.__writer_lags[ip] = writer_lag
+        self.__metrics.add_camera(ip)
+        return is_running, fps, writer_lag
+
+    def __release_stream_values(self, ip):
+        self.__writer_lags.pop(ip, None)
+        self.__metrics.remove_camera(ip)
+        if self.__live_view_receiver is not None:
+            self.__live_view_receiver.remove_camera(ip)
+        if ip in self.__camera_slots:
+            self.__camera_worker_pool.release_slot(self.__camera_slots.pop(ip))
+
+    async def __start_stream(self, is_running, height, width, ip, writer, fps, encoding, live_view):
+        self.__logger.debug(f"[{ip}] starting stream...")
+        try:
+            # The camera connection is handled by its own task and may not have been negotiated yet.
+            await asyncio.wait_for(self.__get_stream_connected_event(ip).wait(), timeout=15)
+        except asyncio.TimeoutError:
+            self.__logger.error(f"[{ip}]: no camera connection, stream not started.")
+            return
+        live_frame = self.__create_live_frame(ip, height, width, encoding, live_view)
+        if ip in self.__camera_slots:
+            # A camera worker reads the socket from now on, the event loop must not read it as well.
+            stream_writer = self.__stream_connections[ip][1]
+            stream_writer.transport.pause_reading()
+            self.__camera_worker_pool.start_camera(self.__camera_slots[ip], ip, stream_writer.get_extra_info("socket"),
+                                                   (height, width), encoding, live_frame)
+            writer.write(struct.pack(">?", True))
+            await writer.drain()
+            return
+        is_running.value = True
+        pipe_out, pipe_in = mp.Pipe(False)
+        video_writer = VideoWriter((width, height), fps, is_running, self.__writer_lags[ip], ip, pipe_out, encoding,
+                                   self.__metrics.get_camera(ip))
+        if config.InlineVideoWriter:
+            # The executor writes the frames to disk itself, no VideoWriter process is needed.
+            await self.__run_blocking(video_writer.open, self.__to_be_encoded_in)
+            frame_writer = video_writer
+        else:
+            frame_writer = None
+            self.__camera_processes[ip] = [video_writer.start_writing_video(self.__to_be_encoded_in)]
+        self.__stream_tasks[ip] = asyncio.create_task(
+            self.__handle_stream_connection(is_running, pipe_in, frame_writer, live_frame, height, width, ip,
+                                            encoding))
+        writer.write(struct.pack(">?", True))
+        await writer.drain()
+
+    def __create_live_frame(self, ip, height, width, encoding, live_view):
+        # Returns the live frame the stream has to show its frames in.
+        if live_view:
+            # The client sends its live view over udp, this works for encoded video streams as well.
+            self.__live_view_receiver.add_camera(ip, self.__webserver.add_camera(ip, (height, width)))
+            return None
+        return None if encoding in VIDEO_STREAM_ENCODINGS else self.__webserver.add_camera(ip, (height, width))
+
+    async def __handle_stream_connection(self, is_running, pipe, video_writer, live_frame, height, width, ip,
+                                         encoding):
+        log = self.__logger
+        log.debug(f"[{ip}]: stream started ({get_encoding_name(encoding)}).")
+        reader = self.__stream_connections[ip][0]
+        statistics = StreamStatistics(self.__metrics.get_camera(ip))
+        decoder = StreamDecoder((height, width), encoding)
+        write_frame = (lambda frame, frame_times: VideoWriter.send_frame(pipe, frame, frame_times)) \
+            if video_writer is None else video_writer.write
+        try:
+            while True:
+                header = await self.__read_frame_header(reader, is_running)
+                if header is None:
+                    break
+                try:
+                    flags, length, sequence, capture_time = unpack_header(header)
+                    decoder.check_payload_size(length)
+                except ValueError as e:
+                    log.error(f"[{ip}]: {e}")
+                    break
+                payload = await reader.readexactly(length)
+                statistics.add(sequence, capture_time, len(header) + len(payload))
+                # Frames of one camera are passed on one after another, the delta decoder depends on the order.
+                await self.__run_blocking(self.__pass_frame_on, decoder, payload, capture_time, write_frame,
+                                          live_frame, statistics, ip)
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+        finally:
+            if video_writer is not None:
+                await self.__run_blocking(video_writer.close)
+            log.info(f"[{ip}]: {statistics.get_summary()}.")
+            if not decoder.is_video_stream:
+                saved_bytes = statistics.frames * decoder.frame_byte_size - statistics.received_bytes
+                log.info(f"[{ip}]: {saved_bytes} bytes saved.")
+            log.debug(f"[{ip}]: stream stopped..")
+
+    @staticmethod
+    async def __read_frame_header(reader, is_running):
+        # Waits for the next frame in steps, so a stopped stream ends without cancelling a running write.
+        while is_running.value:
+            try:
+                return await asyncio.wait_for(reader.readexactly(FRAME_HEADER.size), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+        return None
+
+    def __pass_frame_on(self, decoder, payload, capture_time, write_frame, live_frame, statistics, ip):
+        try:
+            buffer = decoder.decode(payload)
+        except ValueError as e:
+            self.__logger.warning(f"[{ip}]: dropping frame with {e}.")
+            return
+        if buffer is None:
+            return
+        statistics.frame_queued()
+        write_frame(buffer, statistics.get_frame_times(capture_time))
+        if live_frame is not None:
+            live_frame.publish(buffer)
+
+    async def __stop_stream_task(self, ip):
+        task = self.__stream_tasks.pop(ip, None)
+        if task is None:
+            return
+        try:
+            await task
+        except Exception as e:
+            # e.g. a frame the decoder failed on, the client is still closed.
+            self.__logger.error(f"[{ip}]: stream failed: {e}")
+
+    async def __close_client(self, ip, is_running):
+        is_running.value = False
+        if ip in self.__camera_slots:
+            await self.__run_blocking(self.__camera_worker_pool.stop_camera, self.__camera_slots[ip])
+        await self.__stop_stream_task(ip)
+        await self.__run_blocking(self.__join_all_client_processes, ip)
+
+    async def __handle_client_crash(self, is_running, ip):
+        self.__logger.warning("Client crashed!")
+        self.__logger.info("Handling client crash...")
+        await self.__close_client(ip, is_running)
+        self.__webserver.delete_camera(ip)
+        self.__close_client_connections(ip)
+        self.__logger.info("Client crash handled.")
+
+    def __join_all_client_processes(self, ip):
+        self.__logger.debug(f"[Server]: joining all processes of client {ip}...")
+        for item in self.__camera_processes.pop(ip, []):
+            self.__logger.debug(f"[Server]: joining process: {item} of client {ip}")
+            item.join(timeout=15)
+            self.__logger.debug(f"[Server]: process: {item} of client {ip} joined.")
+        self.__logger.debug(f"[Server]: all processes of client {ip} joined.")
+
+    def __close_client_connections(self, ip):
+        self.__logger.debug(f"[{ip}]: closing socket connections...")
+        management_writer = self.__management_connections.pop(ip, None)
+        if management_writer is not None:
+            management_writer.close()
+        self.__logger.debug(f"[{ip}]: management connection closed.")
+        _, stream_writer = self.__stream_connections.pop(ip, (None, None))
+        if stream_writer is not None:
+            stream_writer.close()
+        self.__logger.debug(f"[{ip}]: stream connection closed.")
+        self.__stream_connected.pop(ip, None)
+        self.__logger.debug(f"[{ip}]: socket connections closed.")
+
+    def get_writer_lags(self):
+        return dict(self.__writer_lags)
+
+    def send_pressure_level(self, ip, level):
+        # Called from the pressure monitor thread.
+        writer = self.__management_connections.get(ip)
+        if writer is not None:
+            self.__loop.call_soon_threadsafe(writer.write, b"p" + struct.pack(">B", level))
+
+    def close_all_clients(self):
+        # Called from the client closing timer thread, blocks until every client has shut down.
+        asyncio.run_coroutine_threadsafe(self.__close_all_clients(), self.__loop).result()
+
+    async def __close_all_clients_for_coordinator(self):
+        await self.__close_all_clients()
+        self.__connection_handoff.confirm_clients_closed(self.__listener_index)
+
+    async def __close_all_clients(self):
+        self.__logger.debug("[Server]: Closing all Client connections...")
+        for ip, writer in self.__management_connections.items():
+            self.__logger.debug(f"[{ip}]: Sending Closing Command.")
+            writer.write(b"q")
+        self.__logger.debug("[Server]: All Client Connection Closing commands have been sent.")
+        management_tasks = list(self.__management_tasks.values())
+        if management_tasks:
+            await asyncio.wait(management_tasks)
+        for ip in list(self.__management_connections):
+            self.__close_client_connections(ip)
+        self.__logger.debug("[Server]: All Client connections closed.")
@@ -0,0 +1,90 @@
+from StreamStatistics import StreamStatistics
+from StreamDecoder import StreamDecoder
+from src.shared.Logger import create_logger
+from src.server.Config import config
+from src.shared.FrameCodec import get_encoding_name
+from src.shared.FrameProtocol import FRAME_HEADER, unpack_header
+
+
+# The stream of one camera inside a camera worker.
+# Frames are received without blocking, so one worker can serve many cameras, and written by the worker itself.
+class CameraStream:
+    def __init__(self, ip, sock, resolution, encoding, video_writer, live_frame, counters):
+        self.__logger = create_logger(__name__, config.DebugMode, "server.log")
+        self.ip = ip
+        self.sock = sock
+        self.__video_writer = video_writer
+        self.__live_frame = live_frame
+        self.__decoder = StreamDecoder(resolution, encoding)
+        self.statistics = StreamStatistics(counters)
+        self.__header = memoryview(bytearray(FRAME_HEADER.size))
+        self.__payload_buffer = bytearray(self.__decoder.frame_byte_size)
+        # The part of the header or payload that is currently received.
+        self.__view = self.__header
+        self.__received = 0
+        self.__frame_info = None
+        self.__logger.debug(f"[{ip}]: stream started ({get_encoding_name(encoding)}).")
+
+    def receive(self):
+        # Receives until the socket has no more data or a frame is complete.
+        # Returns False once the stream can't be continued.
+        while True:
+            try:
+                count = self.sock.recv_into(self.__view[self.__received:])
+            except BlockingIOError:
+                return True
+            except OSError:
+                return False
+            if count == 0:
+                return False
+            self.__received += count
+            if self.__received < len(self.__view):
+                continue
+            if self.__frame_info is None:
+                if not self.__start_payload():
+                    return False
+            else:
+                self.__pass_frame_on()
+                return True
+
+    def __start_payload(self):
+        try:
+            flags, length, sequence, capture_time = unpack_header(self.__header)
+            self.__decoder.check_payload_size(length)
+        except ValueError as e:
+            self.__logger.error(f"[{self.ip}]: {e}")
+            return False
+        if length > len(self.__payload_buffer):
+            self.__payload_buffer = bytearray(length)
+        self.__frame_info = (sequence, capture_time)
+        self.__view = memoryview(self.__payload_buffer)[:length]
+        self.__received = 0
+        return True
+
+    def __pass_frame_on(self):
+        sequence, capture_time = self.__frame_info
+        payload = self.__view
+        self.__frame_info = None
+        self.__view = self.__header
+        self.__received = 0
+        self.statistics.add(sequence, capture_time, FRAME_HEADER.size + len(payload))
+        try:
+            buffer = self.__decoder.decode(payload)
+        except ValueError as e:
+            self.__logger.warning(f"[{self.ip}]: dropping frame with {e}.")
+            return
+        if buffer is None:
+            return
+        self.statistics.frame_queued()
+        self.__video_writer.write(buffer, self.statistics.get_frame_times(capture_time))
+        if self.__live_frame is not None:
+            self.__live_frame.publish(buffer)
+
+    def close(self):
+        self.__video_writer.close()
+        self.sock.close()
+        self.__logger.info(f"[{self.ip}]: {self.statistics.get_summary()}.")
+        if not self.__decoder.is_video_stream:
+            saved_bytes = self.statistics.frames * self.__decoder.frame_byte_size - self.statistics.received_bytes
+            self.__logger.info(f"[{self.ip}]: {saved_bytes} bytes saved.")
+        self.__logger.debug(f"[{self.ip}]: stream stopped..")
@@ -0,0 +1,174 @@
+from VideoWriter import VideoWriter
+from CameraStream import CameraStream
+from src.server.Webserver.LiveFrame import LiveFrame
+from src.shared.Logger import create_logger
+from src.server.Config import config
+import multiprocessing as mp
+from threading import Lock
+import selectors
+import socket
+import ctypes
+import pickle
+import time
+
+CAMERA_SLOTS = 256
+# Slot states:
+FREE = 0
+RESERVED = 1
+STREAMING = 2
+
+
+# A fixed amount of worker processes that receive and write the streams of all cameras.
+# Every client reserves a slot, its running flag, fps and writer lag live in shared memory so the workers and the
+# server see changes.
+# Stream sockets are passed to the worker with the lowest measured byte rate.
+class CameraWorkerPool:
+    def __init__(self, workers, to_be_encoded_in, metrics):
+        self.__logger = create_logger(__name__, config.DebugMode, "server.log")
+        self.__logger.debug(f"[Server]: Initializing CameraWorkerPool Class with {workers} workers...")
+        self.__to_be_encoded_in = to_be_encoded_in
+        self.__metrics = metrics
+        self.__states = mp.RawArray(ctypes.c_byte, CAMERA_SLOTS)
+        self.__is_running = mp.RawArray(ctypes.c_bool, CAMERA_SLOTS)
+        self.__fps = mp.RawArray(ctypes.c_ubyte, CAMERA_SLOTS)
+        self.__received_bytes = mp.RawArray(ctypes.c_ulonglong, CAMERA_SLOTS)
+        self.__writer_lags = mp.RawArray(ctypes.c_double, CAMERA_SLOTS)
+        self.__lock = Lock()
+        self.__slot_workers = {}
+        # slot: (received bytes, time) of the last byte rate measurement
+        self.__byte_rate_samples = {}
+        self.__control_connections = []
+        self.__processes = []
+        for index in range(workers):
+            control_connection, worker_connection = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            p = mp.Process(target=self.__work, args=(index, worker_connection), daemon=True)
+            p.start()
+            worker_connection.close()
+            self.__control_connections.append(control_connection)
+            self.__processes.append(p)
+        self.__logger.debug("[Server]: CameraWorkerPool Class Initialized.")
+
+    def reserve_slot(self):
+        with self.__lock:
+            for slot in range(CAMERA_SLOTS):
+                if self.__states[slot] == FREE:
+                    self.__states[slot] = RESERVED
+                    self.__is_running[slot] = False
+                    self.__fps[slot] = 30
+                    self.__writer_lags[slot] = 0.0
+                    return slot, self.__get_is_running(slot), self.__get_fps(slot), self.__get_writer_lag(slot)
+        self.__logger.error(f"[Server]: all {CAMERA_SLOTS} camera slots are in use.")
+        raise Exception("NO FREE CAMERA SLOT")
+
+    def release_slot(self, slot):
+        self.stop_camera(slot)
+        self.__states[slot] = FREE
+
+    def __get_is_running(self, slot):
+        return ctypes.c_bool.from_buffer(self.__is_running, slot * ctypes.sizeof(ctypes.c_bool))
+
+    def __get_fps(self, slot):
+        return ctypes.c_ubyte.from_buffer(self.__fps, slot * ctypes.sizeof(ctypes.c_ubyte))
+
+    def __get_writer_lag(self, slot):
+        return ctypes.c_double.from_buffer(self.__writer_lags, slot * ctypes.sizeof(ctypes.c_double))
+
+    def start_camera(self, slot, ip, sock, resolution, encoding, live_frame):
+        with self.__lock:
+            worker = self.__choose_worker()
+            self.__slot_workers[slot] = worker
+            self.__received_bytes[slot] = 0
+            self.__byte_rate_samples[slot] = (0, time.monotonic())
+            self.__states[slot] = STREAMING
+            self.__is_running[slot] = True
+            message = pickle.dumps((slot, ip, resolution, encoding, None if live_frame is None else live_frame.name,
+                                    self.__metrics.get_slot(ip)))
+            # The worker receives its own file descriptor of the stream socket.
+            socket.send_fds(self.__control_connections[worker], [message], [sock.fileno()])
+        self.__logger.debug(f"[{ip}]: stream passed to camera worker {worker}.")
+
+    def stop_camera(self, slot, timeout=15):
+        self.__is_running[slot] = False
+        deadline = time.monotonic() + timeout
+        while self.__states[slot] == STREAMING and time.monotonic() < deadline:
+            time.sleep(0.05)
+        with self.__lock:
+            self.__slot_workers.pop(slot, None)
+            self.__byte_rate_samples.pop(slot, None)
+
+    def __choose_worker(self):
+        byte_rates = [0.0] * len(self.__processes)
+        cameras = [0] * len(self.__processes)
+        for slot, worker in self.__slot_workers.items():
+            byte_rates[worker] += self.__measure_byte_rate(slot)
+            cameras[worker] += 1
+        return min(range(len(self.__processes)), key=lambda worker: (byte_rates[worker], cameras[worker]))
+
+    def __measure_byte_rate(self, slot):
+        received_bytes, now = self.__received_bytes[slot], time.monotonic()
+        last_received_bytes, last_time = self.__byte_rate_samples[slot]
+        self.__byte_rate_samples[slot] = (received_bytes, now)
+        return (received_bytes - last_received_bytes) / max(now - last_time, 1e-3)
+
+    def __work(self, index, control_connection):
+        log = self.__logger
+        log.debug(f"[Server]: camera worker {index} started.")
+        for connection in self.__control_connections:
+            connection.close()
+        selector = selectors.DefaultSelector()
+        selector.register(control_connection, selectors.EVENT_READ)
+        streams = {}
+        while True:
+            for key, _ in selector.select(timeout=0.5):
+                if key.fileobj is control_connection:
+                    if not self.__add_camera_stream(control_connection, selector, streams):
+                        log.debug(f"[Server]: camera worker {index} stopped.")
+                        return
+                    continue
+                slot, stream = key.data
+                try:
+                    receiving = stream.receive()
+                except Exception as e:
+                    # Only this stream is closed, the other cameras of the worker keep streaming.
+                    log.error(f"[{stream.ip}]: stream failed: {e}")
+                    receiving = False
+                if not receiving:
+                    self.__close_camera_stream(slot, selector, streams)
+                    continue
+                self.__received_bytes[slot] = stream.statistics.received_bytes
+            for slot in [slot for slot in streams if not self.__is_running[slot]]:
+                self.__close_camera_stream(slot, selector, streams)
+
+    def __add_camera_stream(self, control_connection, selector, streams):
+        message, fds, _, _ = socket.recv_fds(control_connection, 4096, 1)
+        if not message:
+            return False
+        slot, ip, resolution, encoding, live_frame_name, metrics_slot = pickle.loads(message)
+        counters = self.__metrics.get_counters(metrics_slot)
+        sock = socket.socket(fileno=fds[0])
+        sock.setblocking(False)
+        height, width = resolution
+        video_writer = VideoWriter((width, height), self.__get_fps(slot), self.__get_is_running(slot),
+                                   self.__get_writer_lag(slot), ip, None, encoding, counters)
+        video_writer.open(self.__to_be_encoded_in)
+        stream = CameraStream(ip, sock, resolution, encoding, video_writer, self.__attach_live_frame(live_frame_name),
+                              counters)
+        selector.register(sock, selectors.EVENT_READ, (slot, stream))
+        streams[slot] = stream
+        return True
+
+    @staticmethod
+    def __attach_live_frame(name):
+        if name is None:
+            return None
+        try:
+            return LiveFrame(name=name)
+        except FileNotFoundError:
+            # The camera was already deleted from the webserver.
+            return None
+
+    def __close_camera_stream(self, slot, selector, streams):
+        stream = streams.pop(slot)
+        selector.unregister(stream.sock)
+        stream.close()
+        self.__states[slot] = RESERVED
@@ -0,0 +1,61 @@
+from src.shared.LiveViewProtocol import is_newer
+import time
+
+
+# Puts the live view frames of one camera back together from their udp chunks.
+# Only the newest frame is assembled: a frame that is still missing chunks when a newer frame starts, or after the
+# loss timeout, is dropped instead of being shown with holes. Late chunks of older frames are ignored.
+class ChunkAssembler:
+    def __init__(self, loss_timeout):
+        self.__loss_timeout = loss_timeout
+        self.__sequence = None
+        self.__chunks = []
+        self.__missing = 0
+        self.__started = 0.0
+        # sequence of the last frame that was completed or dropped
+        self.__last_sequence = None
+        self.completed_frames = 0
+        self.dropped_frames = 0
+
+    def add(self, sequence, index, count, chunk):
+        # Returns the frame as soon as its last chunk arrived.
+        if self.__sequence is not None and sequence != self.__sequence:
+            if not is_newer(sequence, self.__sequence):
+                return None
+            self.__drop()
+        if self.__sequence is None:
+            if self.__last_sequence is not None and not is_newer(sequence, self.__last_sequence):
+                return None
+            self.__start(sequence, count)
+        if index >= len(self.__chunks) or self.__chunks[index] is not None:
+            return None
+        self.__chunks[index] = bytes(chunk)
+        self.__missing -= 1
+        if self.__missing > 0:
+            return None
+        frame = b"".join(self.__chunks)
+        self.__finish()
+        self.completed_frames += 1
+        return frame
+
+    def expire(self):
+        if self.__sequence is not None and time.monotonic() - self.__started > self.__loss_timeout:
+            self.__drop()
+
+    def __start(self, sequence, count):
+        self.__sequence = sequence
+        self.__chunks = [None] * count
+        self.__missing = count
+        self.__started = time.monotonic()
+
+    def __drop(self):
+        self.dropped_frames += 1
+        self.__finish()
+
+    def __finish(self):
+        self.__last_sequence = self.__sequence
+        self.__sequence = None
+        self.__chunks = []
+
+    def get_summary(self):
+        return f"{self.completed_frames} live view frames shown, {self.dropped_frames} dropped"
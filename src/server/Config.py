@@ -1,4 +1,5 @@
 import configparser
+import importlib.util
 from src.shared.Logger import create_logger
 import os
 import sys
@@ -22,6 +23,11 @@ class Config:
         self.ServerIP = server_config["Network"]["ServerIP"]
         self.ServerPort = server_config["Network"].getint("ServerPort")
         self.ClientStoppingPoint = server_config["Network"]["ClientStoppingPoint"]
+        self.NetworkEngine = server_config["Network"]["NetworkEngine"].strip().lower()
+        self.HandshakeTimeout = server_config["Network"].getfloat("HandshakeTimeout")
+        self.ListenerProcesses = server_config["Network"].getint("ListenerProcesses")
+        self.LiveViewPort = server_config["Network"].getint("LiveViewPort")
+        self.LiveViewLossTimeout = server_config["Network"].getfloat("LiveViewLossTimeout")
         self.__logger.debug("Network settings loaded.")
         # Video Variables
         self.__logger.debug("Loading Video settings...")
@@ -31,13 +37,23 @@ class Config:
         self.OutputFileExtension = server_config["Video"]["OutputFileExtension"]
         self.VideoCutTime = server_config["Video"]["VideoCutTime"]
         self.ConcatAmount = server_config["Video"].getint("ConcatAmount")
+        self.LiveEncoding = server_config["Video"].getboolean("LiveEncoding")
+        self.DuplicateFrameThreshold = server_config["Video"].getfloat("DuplicateFrameThreshold")
+        self.MaxSegmentSize = server_config["Video"].getint("MaxSegmentSize")
         self.__logger.debug("Video settings loaded.")
         # Storage Variables
         self.StoragePath = server_config["Storage"]["StoragePath"]
         self.FreeStorageAmountBeforeDeleting = server_config["Storage"].getint("FreeStorageAmountBeforeDeleting")
+        self.WriteBlockSize = server_config["Storage"].getint("WriteBlockSize")
+        self.PreallocateLimit = server_config["Storage"].getint("PreallocateLimit")
+        self.DirectIO = server_config["Storage"].getboolean("DirectIO")
+        self.SyncInterval = server_config["Storage"].getfloat("SyncInterval")
+        self.RawCompression = server_config["Storage"]["RawCompression"].strip().lower()
         # Process Variables
         self.__logger.debug("Loading Process settings...")
         self.ConsecutiveFFMPEGThreads = server_config["Processes"].getint("ConsecutiveFFMPEGThreads")
+        self.InlineVideoWriter = server_config["Processes"].getboolean("InlineVideoWriter")
+        self.CameraWorkers = server_config["Processes"].getint("CameraWorkers")
         self.__logger.debug("Process settings loaded.")
         # Webserver
         self.WebserverHost = server_config["Webserver"]["WebserverHost"]
@@ -66,6 +82,32 @@ class Config:
             raise Exception("BAD CLIENT STOPPING VALUE")
         self.ClientStoppingPoint = match.group(0) if match else None
 
+        self.__logger.debug("verifying NetworkEngine.")
+        if self.NetworkEngine not in ("threads", "asyncio"):
+            self.__logger.error("Bad NetworkEngine value in config. Value must be threads or asyncio.")
+            raise Exception("BAD NETWORK ENGINE")
+
+        self.__logger.debug("verifying ListenerProcesses.")
+        if self.ListenerProcesses < 0:
+            self.__logger.error("Bad ListenerProcesses value in config. Value can not be negative.")
+            raise Exception("BAD LISTENER PROCESSES")
+        if self.ListenerProcesses > 0 and self.NetworkEngine != "asyncio":
+            self.__logger.error("ListenerProcesses needs the asyncio NetworkEngine.")
+            raise Exception("BAD LISTENER PROCESSES")
+
+        self.__logger.debug("verifying HandshakeTimeout.")
+        if self.HandshakeTimeout <= 0:
+            self.__logger.error("Bad HandshakeTimeout value in config. Value must be above 0.")
+            raise Exception("BAD HANDSHAKE TIMEOUT")
+
+        if self.LiveViewPort != 0:
+            self.__config_verifier.check_port(self.LiveViewPort)
+
+        self.__logger.debug("verifying LiveViewLossTimeout.")
+        if self.LiveViewLossTimeout <= 0:
+            self.__logger.error("Bad LiveViewLossTimeout value in config. Value must be above 0.")
+            raise Exception("BAD LIVE VIEW LOSS TIMEOUT")
+
     def __check_video_settings(self):
         self.__config_verifier.check_frame_height(self.DefaultHeight)
         self.__config_verifier.check_frame_width(self.DefaultWidth)
@@ -89,6 +131,16 @@ class Config:
             self.__logger.error("FFMPEG options can not contain '&&'.")
             raise Exception("BAD FFMPEG OUTPUT FILE OPTIONS")
 
+        self.__logger.debug("verifying DuplicateFrameThreshold.")
+        if self.DuplicateFrameThreshold > 255:
+            self.__logger.error("Bad DuplicateFrameThreshold value in config. Value can not be above 255.")
+            raise Exception("BAD DUPLICATE FRAME THRESHOLD")
+
+        self.__logger.debug("verifying MaxSegmentSize.")
+        if self.MaxSegmentSize < 0:
+            self.__logger.error("Bad MaxSegmentSize value in config. Value can not be negative.")
+            raise Exception("BAD MAX SEGMENT SIZE")
+
         self.__logger.debug("verifying ConcatAmount.")
         if self.ConcatAmount < 1:
             self.__logger.debug("Bad ConcatAmount value. Value can not be negative or 0.")
@@ -105,12 +157,42 @@ class Config:
             self.__logger.debug("Bad FreeStorageAmountBeforeDeleting value. Value Can not be negative or zero")
             raise Exception("BAD FREE STORAGE AMOUNT BEFORE DELETING")
 
+        self.__logger.debug("verifying WriteBlockSize.")
+        if self.WriteBlockSize < 1:
+            self.__logger.error("Bad WriteBlockSize value in config. Value must be at least 1.")
+            raise Exception("BAD WRITE BLOCK SIZE")
+
+        self.__logger.debug("verifying PreallocateLimit.")
+        if self.PreallocateLimit < 0:
+            self.__logger.error("Bad PreallocateLimit value in config. Value can not be negative.")
+            raise Exception("BAD PREALLOCATE LIMIT")
+
+        self.__logger.debug("verifying SyncInterval.")
+        if self.SyncInterval < 0:
+            self.__logger.error("Bad SyncInterval value in config. Value can not be negative.")
+            raise Exception("BAD SYNC INTERVAL")
+
+        self.__logger.debug("verifying RawCompression.")
+        if self.RawCompression not in ("off", "zlib", "lz4", "zstd"):
+            self.__logger.error("Bad RawCompression value in config. Value must be off, zlib, lz4 or zstd.")
+            raise Exception("BAD RAW COMPRESSION")
+        module = {"lz4": "lz4", "zstd": "zstandard"}.get(self.RawCompression)
+        if module and importlib.util.find_spec(module) is None:
+            self.__logger.error(f"RawCompression {self.RawCompression} needs the {module} package.")
+            raise Exception("BAD RAW COMPRESSION")
+        self.RawCompression = None if self.RawCompression == "off" else self.RawCompression
+
     def __check_process_settings(self):
         self.__logger.debug("verifying ConsecutiveFFMPEGThreads.")
         if self.ConsecutiveFFMPEGThreads <= 0:
             self.__logger.debug("Bad ConsecutiveFFMPEGThreads value. The value cannot be negative or 0.")
             raise Exception("BAD CONSECUTIVE FFMPEG THREADS VALUE")
 
+        self.__logger.debug("verifying CameraWorkers.")
+        if self.CameraWorkers < 0:
+            self.__logger.debug("Bad CameraWorkers value. The value cannot be negative.")
+            raise Exception("BAD CAMERA WORKERS VALUE")
+
     def __check_webserver_settings(self):
         self.__config_verifier.check_ip_address(self.WebserverHost)
         self.__config_verifier.check_port(self.WebserverPort)
@@ -0,0 +1,59 @@
+import socket
+import time
+import zlib
+
+# Messages to a listener process:
+CONNECTION = b"c"
+CLOSE_ALL_CLIENTS = b"q"
+# Message from a listener process:
+CLIENTS_CLOSED = b"d"
+# Seconds the coordinator waits for the listeners to close their clients.
+CLOSE_TIMEOUT = 60
+
+
+# The kernel spreads the connections of SO_REUSEPORT listeners by source port, so the management and the camera
+# connection of one client may be accepted by different listener processes.
+# Every client belongs to the listener its ip hashes to and connections accepted elsewhere are passed to it before
+# anything was read from them.
+class ConnectionHandoff:
+    def __init__(self, listeners):
+        self.listeners = listeners
+        # (coordinator and other listeners, owning listener)
+        self.__connections = [socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET) for _ in range(listeners)]
+
+    def get_owner(self, ip):
+        return zlib.crc32(ip.encode()) % self.listeners
+
+    def pass_connection(self, ip, sock):
+        # The owner receives its own file descriptor of the socket.
+        socket.send_fds(self.__connections[self.get_owner(ip)][0], [CONNECTION], [sock.fileno()])
+
+    def get_listener_connection(self, index):
+        return self.__connections[index][1]
+
+    def receive(self, index):
+        # Returns the message and the passed socket, if any.
+        message, fds, _, _ = socket.recv_fds(self.__connections[index][1], 16, 1)
+        return message, socket.socket(fileno=fds[0]) if fds else None
+
+    def close_all_clients(self, processes):
+        # Called by the coordinator, blocks until every listener that is still alive has closed its clients.
+        # Returns the indexes of the listeners that didn't confirm within the CLOSE_TIMEOUT.
+        running = [index for index, process in enumerate(processes) if process.is_alive()]
+        for index in running:
+            self.__connections[index][0].send(CLOSE_ALL_CLIENTS)
+        deadline = time.monotonic() + CLOSE_TIMEOUT
+        unconfirmed = []
+        for index in running:
+            connection = self.__connections[index][0]
+            connection.settimeout(max(deadline - time.monotonic(), 0.001))
+            try:
+                connection.recv(16)
+            except socket.timeout:
+                unconfirmed.append(index)
+            finally:
+                connection.settimeout(None)
+        return unconfirmed
+
+    def confirm_clients_closed(self, index):
+        self.__connections[index][1].send(CLIENTS_CLOSED)
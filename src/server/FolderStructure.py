@@ -9,6 +9,9 @@ import struct
 import shutil
 import time
 from VideoEncoder import VideoEncoder
+from RawContainer import RawContainer, EXTENSION as RAW_CONTAINER_EXTENSION
+
+RAW_EXTENSIONS = (".raw", RAW_CONTAINER_EXTENSION)
 
 
 class FolderStructure:
@@ -51,9 +54,26 @@ class FolderStructure:
         if not os.path.isdir(folder_path):
             self.__logger.debug(f"[{self.__ip}]: creating directory {folder_path}.")
             os.mkdir(folder_path)
-        filename = datetime.now().strftime("%H_%M_%S.raw")
+        filename = datetime.now().strftime("%H_%M_%S") + (RAW_CONTAINER_EXTENSION if config.RawCompression else ".raw")
         return os.path.join(folder_path, filename)
 
+    def get_segment_output_pattern(self):
+        # ffmpeg fills in the date and time when a segment starts.
+        return os.path.join(self.__ip_camera_path, f"%Y-%m-%d_%H_%M_%S{config.OutputFileExtension}")
+
+    def move_finished_segment(self, segment_name, duration):
+        # Moves a finished segment into its date folder and renames it like an encoded video file.
+        folder_date_name, filename = segment_name.split("_", 1)
+        folder_path = os.path.join(self.__ip_camera_path, folder_date_name)
+        if not os.path.isdir(folder_path):
+            self.__logger.debug(f"[{self.__ip}]: creating directory {folder_path}.")
+            os.mkdir(folder_path)
+        new_segment_path = FolderStructure.__build_new_file_path(os.path.join(folder_path, filename),
+                                                                 timedelta(seconds=int(duration)))
+        os.rename(os.path.join(self.__ip_camera_path, segment_name), new_segment_path)
+        self.__logger.debug(f"[{self.__ip}]: moved segment {segment_name} to {new_segment_path}.")
+        return new_segment_path
+
     def rename_output_file(self, output_path):
         new_output_path = self.__get_rename_output_path(output_path)
         os.rename(output_path, new_output_path)
@@ -62,7 +82,8 @@ class FolderStructure:
         return new_output_path
 
     def __get_rename_output_path(self, path):
-        new_path = path.rstrip(".raw") + datetime.now().strftime("-%H_%M_%S.raw")
+        name, extension = os.path.splitext(path)
+        new_path = name + datetime.now().strftime("-%H_%M_%S") + extension
         return new_path
 
     @staticmethod
@@ -87,7 +108,7 @@ class FolderStructure:
     def __find_unfinished_files(log):
         cam_files = FolderStructure.__get_all_files_from_cam_dir()
         raw_files = list(filter(
-            lambda file: file.endswith(".raw"),
+            lambda file: file.endswith(RAW_EXTENSIONS),
             cam_files
         ))
         to_be_renamed = list(filter(
@@ -116,8 +137,15 @@ class FolderStructure:
         log.debug("[Server]: handling leftover raw files...")
         for raw_file in raw_files:
             log.debug(f"[Server]: unpacking metadata from {raw_file}")
-            width, height, fps = tuple(struct.unpack(">H", os.getxattr(raw_file, attr))[0]
-                                       for attr in os.listxattr(raw_file))
+            if RawContainer.is_raw_container(raw_file):
+                try:
+                    width, height, fps = RawContainer.get_metadata(raw_file)
+                except (ValueError, struct.error) as e:
+                    log.error(f"[Server]: can't encode {raw_file}, {e}.")
+                    continue
+            else:
+                width, height, fps = tuple(struct.unpack(">H", os.getxattr(raw_file, attr))[0]
+                                           for attr in os.listxattr(raw_file))
             log.debug(f"[Server]: sending {raw_file} to be encoded.")
             encoding_queue.put((2, VideoEncoder.get_ffmpeg_command(raw_file, width, height, fps)))
         log.debug("[Server]: leftover raw files handled.")
@@ -126,7 +154,8 @@ class FolderStructure:
     def __handled_unnamed_files(to_be_renamed, raw_files, log):
         log.debug("[Server]: handling unnamed files...")
         for unnamed_file_path in to_be_renamed:
-            if re.sub(rf"{config.OutputFileExtension}$", ".raw", unnamed_file_path) not in raw_files:
+            name = re.sub(rf"{config.OutputFileExtension}$", "", unnamed_file_path)
+            if not any(name + extension in raw_files for extension in RAW_EXTENSIONS):
                 FolderStructure.rename_file_if_not_renamed(unnamed_file_path, log)
         log.debug("[Server]: unnamed files handled.")
 
@@ -165,10 +194,15 @@ class FolderStructure:
         log.debug("[Server]: building new name...")
         video_length = proc.stdout.decode().strip()
         fmt_video_length = datetime.strptime(video_length, "%H:%M:%S.%f")
+        return FolderStructure.__build_new_file_path(file_path, timedelta(hours=fmt_video_length.hour,
+                                                                          minutes=fmt_video_length.minute,
+                                                                          seconds=fmt_video_length.second))
+
+    @staticmethod
+    def __build_new_file_path(file_path, video_length):
         video_name = os.path.splitext(ntpath.basename(file_path))[0]
         video_start_time = datetime.strptime(video_name, "%H_%M_%S")
-        new_video_name_fmt = timedelta(hours=fmt_video_length.hour, minutes=fmt_video_length.minute,
-                                       seconds=fmt_video_length.second) + video_start_time
+        new_video_name_fmt = video_length + video_start_time
         new_video_name = video_name + datetime.strftime(new_video_name_fmt, f"-%H_%M_%S{config.OutputFileExtension}")
         pure_path = PurePath(file_path)
         new_file_path = list(pure_path.parts)
@@ -283,6 +317,6 @@ class FolderStructure:
 
     @staticmethod
     def __is_raw_file(file_path):
-        if file_path.endswith(".raw"):
+        if file_path.endswith(RAW_EXTENSIONS):
             return True
         return False
@@ -0,0 +1,101 @@
+from ChunkAssembler import ChunkAssembler
+from src.server.Webserver.LiveFrame import LiveFrame
+from src.shared.Logger import create_logger
+from src.server.Config import config
+from src.shared.FrameCodec import decode_jpeg
+from src.shared.LiveViewProtocol import CHUNK_HEADER, MAX_DATAGRAM_SIZE
+import multiprocessing as mp
+from threading import Lock
+import selectors
+import socket
+import pickle
+
+
+# Receives the udp live view of all cameras in its own process and shows the newest complete frame of every camera
+# in its live frame. The recorded stream stays on tcp, losing live view chunks never loses recorded frames.
+class LiveViewReceiver:
+    def __init__(self, ip, port, loss_timeout):
+        self.__logger = create_logger(__name__, config.DebugMode, "server.log")
+        self.__logger.debug("[Server]: Initializing LiveViewReceiver Class...")
+        self.__loss_timeout = loss_timeout
+        self.__udp_sock = self.__create_udp_socket(ip, port)
+        self.port = self.__udp_sock.getsockname()[1]
+        self.__lock = Lock()
+        self.__control_connection, worker_connection = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.__process = mp.Process(target=self.__receive, args=(worker_connection,), daemon=True)
+        self.__process.start()
+        worker_connection.close()
+        self.__logger.debug("[Server]: LiveViewReceiver Class Initialized.")
+
+    def __create_udp_socket(self, ip, port):
+        self.__logger.debug("[Server]: creating udp socket...")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1152000*5)
+        sock.bind((ip, port))
+        self.__logger.debug("[Server]: udp socket created.")
+        return sock
+
+    def add_camera(self, ip, live_frame):
+        self.__send_control_message(("add", ip, live_frame.name))
+        self.__logger.debug(f"[{ip}]: live view is received over udp.")
+
+    def remove_camera(self, ip):
+        self.__send_control_message(("remove", ip, None))
+
+    def __send_control_message(self, message):
+        # Called from the threads of the management connections.
+        with self.__lock:
+            self.__control_connection.send(pickle.dumps(message))
+
+    def __receive(self, control_connection):
+        log = self.__logger
+        log.debug("[Server]: starting to listen on udp socket...")
+        self.__control_connection.close()
+        selector = selectors.DefaultSelector()
+        selector.register(control_connection, selectors.EVENT_READ)
+        selector.register(self.__udp_sock, selectors.EVENT_READ)
+        datagram = memoryview(bytearray(MAX_DATAGRAM_SIZE))
+        # ip: (live frame, chunk assembler)
+        cameras = {}
+        while True:
+            for key, _ in selector.select(timeout=self.__loss_timeout / 2):
+                if key.fileobj is control_connection:
+                    if not self.__handle_control_message(control_connection, cameras):
+                        log.debug("[Server]: stopped listening on udp socket.")
+                        return
+                    continue
+                size, address = self.__udp_sock.recvfrom_into(datagram)
+                if address[0] in cameras and size >= CHUNK_HEADER.size:
+                    self.__add_chunk(address[0], datagram[:size], *cameras[address[0]])
+            for _, assembler in cameras.values():
+                assembler.expire()
+
+    def __handle_control_message(self, control_connection, cameras):
+        message = control_connection.recv(4096)
+        if not message:
+            return False
+        command, ip, live_frame_name = pickle.loads(message)
+        if ip in cameras:
+            self.__logger.info(f"[{ip}]: {cameras.pop(ip)[1].get_summary()}.")
+        if command == "add":
+            try:
+                cameras[ip] = (LiveFrame(name=live_frame_name), ChunkAssembler(self.__loss_timeout))
+            except FileNotFoundError:
+                # The camera was already deleted from the webserver.
+                pass
+        return True
+
+    def __add_chunk(self, ip, datagram, live_frame, assembler):
+        sequence, index, count = CHUNK_HEADER.unpack_from(datagram)
+        payload = assembler.add(sequence, index, count, datagram[CHUNK_HEADER.size:])
+        if payload is None:
+            return
+        try:
+            frame = decode_jpeg(payload)
+        except ValueError as e:
+            self.__logger.warning(f"[{ip}]: dropping live view frame with {e}.")
+            return
+        if frame.shape[:2] != live_frame.resolution:
+            self.__logger.warning(f"[{ip}]: dropping live view frame of {frame.shape[1]}x{frame.shape[0]}.")
+            return
+        live_frame.publish(frame)
@@ -0,0 +1,89 @@
+import struct
+
+EBML = b"\x1a\x45\xdf\xa3"
+EBML_VERSION = b"\x42\x86"
+EBML_READ_VERSION = b"\x42\xf7"
+EBML_MAX_ID_LENGTH = b"\x42\xf2"
+EBML_MAX_SIZE_LENGTH = b"\x42\xf3"
+DOC_TYPE = b"\x42\x82"
+DOC_TYPE_VERSION = b"\x42\x87"
+DOC_TYPE_READ_VERSION = b"\x42\x85"
+SEGMENT = b"\x18\x53\x80\x67"
+INFO = b"\x15\x49\xa9\x66"
+TIMESTAMP_SCALE = b"\x2a\xd7\xb1"
+MUXING_APP = b"\x4d\x80"
+WRITING_APP = b"\x57\x41"
+TRACKS = b"\x16\x54\xae\x6b"
+TRACK_ENTRY = b"\xae"
+TRACK_NUMBER = b"\xd7"
+TRACK_UID = b"\x73\xc5"
+TRACK_TYPE = b"\x83"
+CODEC_ID = b"\x86"
+VIDEO = b"\xe0"
+PIXEL_WIDTH = b"\xb0"
+PIXEL_HEIGHT = b"\xba"
+COLOUR_SPACE = b"\x2e\xb5\x24"
+CLUSTER = b"\x1f\x43\xb6\x75"
+CLUSTER_TIMESTAMP = b"\xe7"
+SIMPLE_BLOCK = b"\xa3"
+UNKNOWN_SIZE = b"\x01\xff\xff\xff\xff\xff\xff\xff"
+# track number 1, timestamp relative to the cluster, keyframe
+BLOCK_HEADER = b"\x81" + struct.pack(">hB", 0, 0x80)
+
+
+# Wraps raw bgr24 frames and their timestamps in a matroska stream for ffmpeg. The rawvideo demuxer only knows a
+# constant frame rate, matroska keeps the timestamp of every frame, so skipped frames keep their time.
+# Every frame is a cluster of its own, timestamps are in milliseconds since the first frame.
+class MatroskaWriter:
+    def __init__(self, stream, width, height):
+        self.__stream = stream
+        self.__first_timestamp = None
+        self.__last_timecode = -1
+        stream.write(MatroskaWriter.__element(EBML,
+                                              MatroskaWriter.__uint(EBML_VERSION, 1) +
+                                              MatroskaWriter.__uint(EBML_READ_VERSION, 1) +
+                                              MatroskaWriter.__uint(EBML_MAX_ID_LENGTH, 4) +
+                                              MatroskaWriter.__uint(EBML_MAX_SIZE_LENGTH, 8) +
+                                              MatroskaWriter.__element(DOC_TYPE, b"matroska") +
+                                              MatroskaWriter.__uint(DOC_TYPE_VERSION, 4) +
+                                              MatroskaWriter.__uint(DOC_TYPE_READ_VERSION, 2)))
+        # The size of the segment is unknown while it is streamed.
+        stream.write(SEGMENT + UNKNOWN_SIZE)
+        stream.write(MatroskaWriter.__element(INFO,
+                                              MatroskaWriter.__uint(TIMESTAMP_SCALE, 1000000) +
+                                              MatroskaWriter.__element(MUXING_APP, b"randall") +
+                                              MatroskaWriter.__element(WRITING_APP, b"randall")))
+        video = MatroskaWriter.__uint(PIXEL_WIDTH, width) + MatroskaWriter.__uint(PIXEL_HEIGHT, height) + \
+            MatroskaWriter.__element(COLOUR_SPACE, b"BGR\x18")
+        stream.write(MatroskaWriter.__element(TRACKS, MatroskaWriter.__element(
+            TRACK_ENTRY,
+            MatroskaWriter.__uint(TRACK_NUMBER, 1) +
+            MatroskaWriter.__uint(TRACK_UID, 1) +
+            MatroskaWriter.__uint(TRACK_TYPE, 1) +
+            MatroskaWriter.__element(CODEC_ID, b"V_UNCOMPRESSED") +
+            MatroskaWriter.__element(VIDEO, video))))
+
+    def write(self, frame, timestamp):
+        if self.__first_timestamp is None:
+            self.__first_timestamp = timestamp
+        # Timestamps have to increase, even for frames captured within the same millisecond.
+        timecode = max(round((timestamp - self.__first_timestamp) * 1000), self.__last_timecode + 1)
+        self.__last_timecode = timecode
+        cluster = MatroskaWriter.__uint(CLUSTER_TIMESTAMP, timecode) + SIMPLE_BLOCK + \
+            MatroskaWriter.__size(len(BLOCK_HEADER) + len(frame)) + BLOCK_HEADER
+        # The frame is written on its own instead of being copied into the cluster.
+        self.__stream.write(CLUSTER + MatroskaWriter.__size(len(cluster) + len(frame)) + cluster)
+        self.__stream.write(frame)
+
+    @staticmethod
+    def __size(size):
+        # Always 8 bytes long, the first byte marks the length.
+        return (1 << 56 | size).to_bytes(8, "big")
+
+    @staticmethod
+    def __element(element_id, data):
+        return element_id + MatroskaWriter.__size(len(data)) + data
+
+    @staticmethod
+    def __uint(element_id, value):
+        return MatroskaWriter.__element(element_id, struct.pack(">Q", value))
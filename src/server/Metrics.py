@@ -0,0 +1,167 @@
+from src.server.Config import config
+import multiprocessing as mp
+from threading import Lock
+import ctypes
+import shutil
+import time
+
+CAMERA_SLOTS = 256
+
+
+# Counters of one camera. Each field is only written by one process or thread (the one receiving the stream, or the
+# VideoWriter for written_frames, duplicate_frames and the disk fields), so the hot loops update them without a lock.
+class CameraCounters(ctypes.Structure):
+    _fields_ = [("ip", ctypes.c_char * 16),  # empty while the slot is free
+                ("frames", ctypes.c_uint64),
+                ("received_bytes", ctypes.c_uint64),
+                ("dropped_frames", ctypes.c_uint64),
+                ("queued_frames", ctypes.c_uint64),
+                ("written_frames", ctypes.c_uint64),
+                ("duplicate_frames", ctypes.c_uint64),
+                ("writer_lag", ctypes.c_double),
+                ("disk_lag", ctypes.c_double),
+                ("disk_written_bytes", ctypes.c_uint64),
+                ("disk_write_seconds", ctypes.c_double),
+                ("file_extents", ctypes.c_uint32)]
+
+
+# Counters of the encoding. queued_files is only written by the thread that fills the encoding queue, the others only
+# by the thread that runs ffmpeg.
+class ServerCounters(ctypes.Structure):
+    _fields_ = [("queued_files", ctypes.c_uint64),
+                ("started_files", ctypes.c_uint64),
+                ("running_ffmpeg_processes", ctypes.c_uint32),
+                ("encoded_files", ctypes.c_uint64),
+                ("encode_speed", ctypes.c_double)]
+
+
+# (name, type, help, camera counter field)
+CAMERA_METRICS = (
+    ("randall_camera_frames_received_total", "counter", "Frames received from the camera.", "frames"),
+    ("randall_camera_received_bytes_total", "counter", "Bytes received from the camera.", "received_bytes"),
+    ("randall_camera_frames_dropped_total", "counter", "Frames the camera dropped before sending them.",
+     "dropped_frames"),
+    ("randall_camera_frames_written_total", "counter", "Frames written to disk or skipped as duplicates.",
+     "written_frames"),
+    ("randall_camera_frames_duplicate_total", "counter", "Frames not written because they repeat the previous frame.",
+     "duplicate_frames"),
+    ("randall_camera_writer_lag_seconds", "gauge", "Time from capture until the last frame was written.",
+     "writer_lag"),
+    ("randall_camera_disk_lag_seconds", "gauge", "Time from receiving the last frame until it was written.",
+     "disk_lag"),
+    ("randall_camera_disk_written_bytes_total", "counter", "Bytes of finished raw files written to disk.",
+     "disk_written_bytes"),
+    ("randall_camera_disk_write_seconds_total", "counter", "Seconds spent writing and syncing finished raw files.",
+     "disk_write_seconds"),
+    ("randall_camera_file_extents", "gauge", "Extents the last finished raw file is stored in (fragmentation).",
+     "file_extents"),
+)
+
+
+# Pipeline counters of the server and all cameras in shared memory, written by whichever process handles a camera
+# and rendered in the prometheus text format by the webserver.
+# Which slot belongs to which camera is in shared memory as well, cameras can be added by any process.
+class Metrics:
+    def __init__(self, encoding_queue):
+        self.__encoding_queue = encoding_queue
+        self.__cameras = mp.RawArray(CameraCounters, CAMERA_SLOTS)
+        self.server = mp.RawValue(ServerCounters)
+        self.__lock = mp.Lock()
+        self.__byte_rate_lock = Lock()
+        # slot: (ip, received bytes, time) of the last scrape
+        self.__byte_rate_samples = {}
+
+    def add_camera(self, ip):
+        with self.__lock:
+            slot = self.__find_slot(b"")
+            if slot is None:
+                # The camera works without metrics.
+                return None
+            ctypes.memset(ctypes.addressof(self.__cameras[slot]), 0, ctypes.sizeof(CameraCounters))
+            self.__cameras[slot].ip = ip.encode()
+        return slot
+
+    def remove_camera(self, ip):
+        with self.__lock:
+            slot = self.__find_slot(ip.encode())
+            if slot is not None:
+                self.__cameras[slot].ip = b""
+
+    def get_slot(self, ip):
+        return self.__find_slot(ip.encode())
+
+    def __find_slot(self, ip):
+        return next((slot for slot in range(CAMERA_SLOTS) if self.__cameras[slot].ip == ip), None)
+
+    def __get_slots(self):
+        slots = {}
+        for slot in range(CAMERA_SLOTS):
+            ip = self.__cameras[slot].ip
+            if ip:
+                slots[ip.decode()] = slot
+        return slots
+
+    def get_encode_queue_size(self):
+        return self.server.queued_files - self.server.started_files
+
+    def get_counters(self, slot):
+        return None if slot is None else self.__cameras[slot]
+
+    def get_camera(self, ip):
+        return self.get_counters(self.get_slot(ip))
+
+    def render(self, viewers):
+        with self.__lock:
+            slots = self.__get_slots()
+        lines = []
+        for name, metric_type, description, field in CAMERA_METRICS:
+            Metrics.__add_metric(lines, name, metric_type, description,
+                                 {ip: getattr(self.__cameras[slot], field) for ip, slot in slots.items()})
+        Metrics.__add_metric(lines, "randall_camera_received_bytes_per_second", "gauge",
+                             "Bytes received from the camera per second since the last scrape.",
+                             self.__measure_byte_rates(slots))
+        Metrics.__add_metric(lines, "randall_camera_writer_queue_frames", "gauge",
+                             "Frames handed to the VideoWriter but not written yet.",
+                             {ip: self.__cameras[slot].queued_frames - self.__cameras[slot].written_frames
+                              for ip, slot in slots.items()})
+        Metrics.__add_metric(lines, "randall_camera_viewers", "gauge", "Webserver clients watching the camera.",
+                             {ip: viewers.get(ip, 0) for ip in slots})
+        Metrics.__add_metric(lines, "randall_encode_queue_files", "gauge", "Files waiting to be encoded.",
+                             self.__count_queued_files(), "priority")
+        Metrics.__add_metric(lines, "randall_ffmpeg_processes_running", "gauge", "Running ffmpeg processes.",
+                             {None: self.server.running_ffmpeg_processes})
+        Metrics.__add_metric(lines, "randall_encoded_files_total", "counter", "Files encoded by ffmpeg.",
+                             {None: self.server.encoded_files})
+        Metrics.__add_metric(lines, "randall_encode_speed_ratio", "gauge",
+                             "Seconds of video encoded per second of the last ffmpeg run.",
+                             {None: self.server.encode_speed})
+        Metrics.__add_metric(lines, "randall_storage_free_bytes", "gauge", "Free space on the storage path.",
+                             {None: shutil.disk_usage(config.StoragePath).free})
+        return "\n".join(lines) + "\n"
+
+    def __measure_byte_rates(self, slots):
+        # Called by the webserver threads only.
+        byte_rates = {}
+        with self.__byte_rate_lock:
+            samples, self.__byte_rate_samples = self.__byte_rate_samples, {}
+            for ip, slot in slots.items():
+                received_bytes, now = self.__cameras[slot].received_bytes, time.monotonic()
+                sample = samples.get(slot)
+                if sample is None or sample[0] != ip or sample[1] > received_bytes:
+                    # The camera was not scraped before.
+                    byte_rates[ip] = 0.0
+                else:
+                    byte_rates[ip] = (received_bytes - sample[1]) / max(now - sample[2], 1e-3)
+                self.__byte_rate_samples[slot] = (ip, received_bytes, now)
+        return byte_rates
+
+    def __count_queued_files(self):
+        with self.__encoding_queue.mutex:
+            priorities = [priority for priority, _ in self.__encoding_queue.queue]
+        return {priority: priorities.count(priority) for priority in sorted(set(priorities))}
+
+    @staticmethod
+    def __add_metric(lines, name, metric_type, description, values, label="camera"):
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {metric_type}"]
+        for key, value in values.items():
+            lines.append(f'{name} {value}' if key is None else f'{name}{{{label}="{key}"}} {value}')
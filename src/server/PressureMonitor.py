@@ -0,0 +1,78 @@
+from src.shared.Logger import create_logger
+from src.server.Config import config
+import os
+import time
+
+MAX_PRESSURE_LEVEL = 3
+UPDATE_INTERVAL = 2  # seconds
+# Each threshold that is reached raises the pressure by one level.
+WRITER_LAG_THRESHOLDS = (0.5, 1.0, 2.0)  # seconds from capture until the frame is written
+ENCODE_QUEUE_THRESHOLDS = (2, 4, 8)  # queued files per ffmpeg thread
+DISK_UTILIZATION_THRESHOLDS = (0.70, 0.85, 0.95)  # share of the time the storage device was busy
+# Updates the pressure has to stay lower before a camera's level is lowered again.
+RELAX_AFTER = 3
+
+
+# Decides how much each camera has to hold back, from how far behind its writer is, how many files wait to be
+# encoded and how busy the storage device is.
+class PressureMonitor:
+    def __init__(self, metrics):
+        self.__logger = create_logger(__name__, config.DebugMode, "server.log")
+        self.__metrics = metrics
+        # Found once the storage folder exists, it may only be created after the server started.
+        self.__disk_stat_path = None
+        self.__last_io_ticks = None
+        self.__last_time = None
+        self.__server_level = 0
+        # ip: (level, updates below level)
+        self.__camera_levels = {}
+
+    @staticmethod
+    def __find_disk_stat_path(path):
+        try:
+            device = os.stat(path).st_dev
+        except OSError:
+            return None
+        stat_path = f"/sys/dev/block/{os.major(device)}:{os.minor(device)}/stat"
+        return stat_path if os.path.isfile(stat_path) else None
+
+    def update(self):
+        encode_queue_level = PressureMonitor.__get_level(
+            self.__metrics.get_encode_queue_size() / max(config.ConsecutiveFFMPEGThreads, 1), ENCODE_QUEUE_THRESHOLDS)
+        disk_level = PressureMonitor.__get_level(self.__measure_disk_utilization(), DISK_UTILIZATION_THRESHOLDS)
+        self.__server_level = max(encode_queue_level, disk_level)
+
+    def __measure_disk_utilization(self):
+        if self.__disk_stat_path is None:
+            self.__disk_stat_path = PressureMonitor.__find_disk_stat_path(config.StoragePath)
+            if self.__disk_stat_path is None:
+                return 0.0
+            self.__logger.debug(f"[Server]: disk statistics: {self.__disk_stat_path}.")
+        with open(self.__disk_stat_path) as stat:
+            io_ticks = int(stat.read().split()[9])  # milliseconds spent doing I/O
+        now = time.monotonic()
+        utilization = 0.0
+        if self.__last_io_ticks is not None:
+            utilization = (io_ticks - self.__last_io_ticks) / max((now - self.__last_time) * 1000, 1)
+        self.__last_io_ticks, self.__last_time = io_ticks, now
+        return utilization
+
+    def get_level(self, ip, writer_lag):
+        level = max(self.__server_level, PressureMonitor.__get_level(writer_lag, WRITER_LAG_THRESHOLDS))
+        current_level, relaxed_updates = self.__camera_levels.get(ip, (0, 0))
+        if level >= current_level:
+            self.__camera_levels[ip] = (level, 0)
+            return level
+        # Lowered one level at a time, so a camera doesn't flip between levels.
+        relaxed_updates += 1
+        if relaxed_updates >= RELAX_AFTER:
+            current_level, relaxed_updates = current_level - 1, 0
+        self.__camera_levels[ip] = (current_level, relaxed_updates)
+        return current_level
+
+    def remove_camera(self, ip):
+        self.__camera_levels.pop(ip, None)
+
+    @staticmethod
+    def __get_level(value, thresholds):
+        return min(sum(value >= threshold for threshold in thresholds), MAX_PRESSURE_LEVEL)
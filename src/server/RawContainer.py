@@ -0,0 +1,178 @@
+import numpy as np
+import os
+import struct
+import zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+EXTENSION = ".rawz"
+MAGIC = b"RNDZ"
+INDEX_MAGIC = b"RNDI"
+VERSION = 1
+COMPRESSIONS = {"zlib": 1, "lz4": 2, "zstd": 3}
+# Frames stored whole, the ones between only store the difference to the previous frame.
+KEYFRAME_INTERVAL = 64
+# magic, version, compression, width, height, fps
+HEADER = struct.Struct(">4sBBHHH")
+# compressed size, capture time, keyframe
+RECORD_HEADER = struct.Struct(">Id?")
+# record offset, capture time, keyframe
+INDEX_ENTRY = struct.Struct(">Qd?")
+# magic, index offset, amount of frames
+TRAILER = struct.Struct(">4sQI")
+
+
+# Raw frames compressed one by one, replaces the plain .raw file and its extended attributes.
+# header | (record header, compressed frame)... | index | trailer
+# Unchanged pixels have a difference of 0 to the previous frame, which costs next to nothing once compressed.
+# The capture times come from the clock of the client, only the time between frames means something.
+# The index and the trailer are only written when the file is finished, without them the records are read until the
+# file ends, so a file that wasn't finished can still be encoded.
+class RawContainer:
+    def __init__(self, file, width, height, fps, compression):
+        self.__file = file
+        self.__compress = RawContainer.get_compressor(compression)
+        self.__offset = HEADER.size
+        self.__index = bytearray()
+        self.__previous_frame = None
+        # Capture time of the last skipped frame, if no frame was written since.
+        self.__skipped_timestamp = None
+        self.frames = 0
+        self.skipped_frames = 0
+        self.frame_bytes = 0
+        file.write(HEADER.pack(MAGIC, VERSION, COMPRESSIONS[compression], width, height, fps))
+
+    def write(self, frame, timestamp):
+        frame = np.frombuffer(frame, np.uint8)
+        keyframe = self.frames % KEYFRAME_INTERVAL == 0
+        # uint8 wraps around, adding the difference to the previous frame restores the frame exactly.
+        data = self.__compress(frame if keyframe else frame - self.__previous_frame)
+        # A copy, the buffer of the frame may be reused for the next one.
+        self.__previous_frame = frame.copy()
+        self.__skipped_timestamp = None
+        self.__file.write(RECORD_HEADER.pack(len(data), timestamp, keyframe))
+        self.__file.write(data)
+        self.__index += INDEX_ENTRY.pack(self.__offset, timestamp, keyframe)
+        self.__offset += RECORD_HEADER.size + len(data)
+        self.frames += 1
+        self.frame_bytes += frame.size
+
+    def is_duplicate(self, frame, threshold):
+        # threshold: the mean absolute difference per byte up to which a frame counts as the previous one,
+        # 0 only matches identical frames and a negative threshold none.
+        if threshold < 0 or self.__previous_frame is None:
+            return False
+        frame = np.frombuffer(frame, np.uint8)
+        if threshold == 0:
+            return np.array_equal(frame, self.__previous_frame)
+        return np.abs(frame.astype(np.int16) - self.__previous_frame).mean() <= threshold
+
+    def skip(self, timestamp):
+        # The previous frame is shown until the next written frame instead.
+        self.__skipped_timestamp = timestamp
+        self.skipped_frames += 1
+
+    def finish(self):
+        if self.__skipped_timestamp is not None:
+            # Otherwise the video would end with the last frame that changed.
+            self.write(self.__previous_frame, self.__skipped_timestamp)
+        self.__file.write(self.__index)
+        self.__file.write(TRAILER.pack(INDEX_MAGIC, self.__offset, self.frames))
+
+    def get_compression_ratio(self):
+        return self.frame_bytes / max(self.__offset, 1)
+
+    @staticmethod
+    def is_raw_container(file_path):
+        return file_path.endswith(EXTENSION)
+
+    @staticmethod
+    def get_compressor(compression):
+        if compression == "zstd":
+            return zstandard.ZstdCompressor(level=1).compress
+        if compression == "lz4":
+            return lz4.frame.compress
+        return lambda frame: zlib.compress(frame, 1)
+
+    @staticmethod
+    def get_decompressor(compression):
+        if compression == COMPRESSIONS["zstd"]:
+            return zstandard.ZstdDecompressor().decompress
+        if compression == COMPRESSIONS["lz4"]:
+            return lz4.frame.decompress
+        return zlib.decompress
+
+    @staticmethod
+    def read_header(file):
+        # Returns width, height, fps and the compression of an open container.
+        magic, version, compression, width, height, fps = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a raw container of version {VERSION}")
+        return width, height, fps, compression
+
+    @staticmethod
+    def get_metadata(file_path):
+        with open(file_path, "rb") as file:
+            return RawContainer.read_header(file)[:3]
+
+    @staticmethod
+    def __read_trailer(file):
+        # Returns the index offset and the amount of frames, None if the file wasn't finished.
+        size = file.seek(0, os.SEEK_END)
+        if size < HEADER.size + TRAILER.size:
+            return None
+        file.seek(size - TRAILER.size)
+        magic, index_offset, frames = TRAILER.unpack(file.read(TRAILER.size))
+        if magic != INDEX_MAGIC or index_offset + frames * INDEX_ENTRY.size + TRAILER.size != size:
+            return None
+        return index_offset, frames
+
+    @staticmethod
+    def __read_records(file, end):
+        file.seek(HEADER.size)
+        while file.tell() + RECORD_HEADER.size <= end:
+            size, timestamp, keyframe = RECORD_HEADER.unpack(file.read(RECORD_HEADER.size))
+            data = file.read(size)
+            if len(data) < size:
+                # The last record of a file that wasn't finished.
+                return
+            yield data, timestamp, keyframe
+
+    @staticmethod
+    def read_frames(file_path):
+        # Yields the decompressed frames with their timestamps.
+        with open(file_path, "rb") as file:
+            decompress = RawContainer.get_decompressor(RawContainer.read_header(file)[3])
+            trailer = RawContainer.__read_trailer(file)
+            end = trailer[0] if trailer else file.seek(0, os.SEEK_END)
+            previous_frame = None
+            for data, timestamp, keyframe in RawContainer.__read_records(file, end):
+                try:
+                    frame = np.frombuffer(decompress(data), np.uint8)
+                except Exception as e:
+                    # zlib, lz4 and zstd all raise their own errors.
+                    raise ValueError(f"damaged frame: {e}")
+                if not keyframe:
+                    if previous_frame is None or len(previous_frame) != len(frame):
+                        raise ValueError("frame difference without a previous frame")
+                    frame = frame + previous_frame
+                previous_frame = frame
+                yield frame.tobytes(), timestamp
+
+    @staticmethod
+    def read_timestamps(file_path):
+        with open(file_path, "rb") as file:
+            RawContainer.read_header(file)
+            trailer = RawContainer.__read_trailer(file)
+            if not trailer:
+                return [timestamp for _, timestamp, _ in
+                        RawContainer.__read_records(file, file.seek(0, os.SEEK_END))]
+            index_offset, frames = trailer
+            file.seek(index_offset)
+            return [timestamp for _, timestamp, _ in INDEX_ENTRY.iter_unpack(file.read(frames * INDEX_ENTRY.size))]
@@ -0,0 +1,112 @@
+import ctypes
+import fcntl
+import mmap
+import os
+import struct
+import time
+
+FALLOC_FL_KEEP_SIZE = 0x01
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_FLAG_SYNC = 0x01
+# struct fiemap without the extent array: start, length, flags, mapped extents, extent count, reserved
+FIEMAP = struct.Struct("=QQIIII")
+DIRECT_IO_ALIGNMENT = 4096
+
+libc = ctypes.CDLL(None, use_errno=True)
+libc.fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+
+
+# Writes a raw file in large blocks instead of a write per frame.
+# When many cameras write small pieces at the same time their files interleave on disk. Reserving the expected size
+# up front and writing whole blocks keeps every file in a few extents.
+class SegmentFile:
+    def __init__(self, path, block_size, expected_size=0, direct_io=False, sync_interval=0):
+        self.direct_io = direct_io and hasattr(os, "O_DIRECT")
+        self.__fd = self.__open(path)
+        self.preallocated = expected_size > 0 and self.__preallocate(expected_size)
+        # mmap memory is page aligned, which O_DIRECT needs.
+        self.__block = mmap.mmap(-1, block_size)
+        self.__block_view = memoryview(self.__block)
+        self.__block_used = 0
+        self.__sync_interval = sync_interval
+        self.__last_sync = time.monotonic()
+        self.written_bytes = 0
+        # Seconds spent in write and fdatasync.
+        self.write_seconds = 0.0
+        self.sync_seconds = 0.0
+
+    def __open(self, path):
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        if self.direct_io:
+            try:
+                return os.open(path, flags | os.O_DIRECT, 0o666)
+            except OSError:
+                # e.g. tmpfs doesn't support O_DIRECT.
+                self.direct_io = False
+        return os.open(path, flags, 0o666)
+
+    def __preallocate(self, size):
+        # Reserves the space without changing the file size, so a file that isn't closed properly has no empty tail.
+        if libc.fallocate(self.__fd, FALLOC_FL_KEEP_SIZE, 0, size) == 0:
+            return True
+        # e.g. not enough space or not supported by the file system, the file is written without reservation.
+        return False
+
+    def write(self, data):
+        data = memoryview(data).cast("B")
+        while data:
+            size = min(len(data), len(self.__block) - self.__block_used)
+            self.__block_view[self.__block_used:self.__block_used + size] = data[:size]
+            self.__block_used += size
+            data = data[size:]
+            if self.__block_used == len(self.__block):
+                self.__write_block()
+
+    @property
+    def size(self):
+        # Includes the bytes still waiting in the block.
+        return self.written_bytes + self.__block_used
+
+    def __write_block(self):
+        start = time.perf_counter()
+        size = self.__block_used
+        if self.direct_io:
+            # O_DIRECT only writes whole aligned blocks, the padding of the last block is cut off in close.
+            size = -(-size // DIRECT_IO_ALIGNMENT) * DIRECT_IO_ALIGNMENT
+        written = 0
+        while written < size:
+            written += os.write(self.__fd, self.__block_view[written:size])
+        self.written_bytes += self.__block_used
+        self.__block_used = 0
+        self.write_seconds += time.perf_counter() - start
+        if self.__sync_interval and time.monotonic() - self.__last_sync >= self.__sync_interval:
+            self.__sync()
+
+    def __sync(self):
+        start = time.perf_counter()
+        os.fdatasync(self.__fd)
+        self.sync_seconds += time.perf_counter() - start
+        self.__last_sync = time.monotonic()
+
+    def close(self):
+        # Returns the amount of extents the file is stored in, None if the file system can't tell.
+        if self.__block_used:
+            self.__write_block()
+        if self.preallocated or self.direct_io:
+            # Releases the unused reservation and the O_DIRECT padding.
+            os.ftruncate(self.__fd, self.written_bytes)
+        if self.__sync_interval:
+            self.__sync()
+        extents = self.__count_extents()
+        os.close(self.__fd)
+        self.__block_view.release()
+        self.__block.close()
+        return extents
+
+    def __count_extents(self):
+        request = bytearray(FIEMAP.pack(0, 0xFFFFFFFFFFFFFFFF, FIEMAP_FLAG_SYNC, 0, 0, 0))
+        try:
+            fcntl.ioctl(self.__fd, FS_IOC_FIEMAP, request)
+        except OSError:
+            return None
+        return FIEMAP.unpack(request)[3]
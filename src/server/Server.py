@@ -4,15 +4,27 @@ sys.path.append(os.path.dirname(os.path.dirname(sys.path[0])))
 from src.shared.Logger import create_logger
 from src.server.Config import config
 import multiprocessing as mp
+from multiprocessing import resource_tracker
 from queue import PriorityQueue
 import ctypes
 import socket
 from threading import Thread
 import struct
 from VideoWriter import VideoWriter
-import subprocess
 from FolderStructure import FolderStructure
 from Webserver import Webserver
+from Webserver.RemoteWebserver import RemoteWebserver
+from StreamStatistics import StreamStatistics
+from StreamDecoder import StreamDecoder
+from AsyncServer import AsyncServer
+from CameraWorkerPool import CameraWorkerPool
+from ConnectionHandoff import ConnectionHandoff
+from LiveViewReceiver import LiveViewReceiver
+from PressureMonitor import PressureMonitor, UPDATE_INTERVAL
+from Metrics import Metrics
+from VideoEncoder import VideoEncoder
+from src.shared.FrameCodec import RAW, VIDEO_STREAM_ENCODINGS, get_encoding_name
+from src.shared.FrameProtocol import VERSION, FRAME_HEADER, negotiate_version, unpack_header
 import re
 from datetime import datetime
 import time
@@ -30,6 +42,7 @@ class Server:
         self.__camera_processes = {}
         # TODO: handle server threads
         self.__server_processes_threads = []
+        self.__listener_processes = []
         # Variables
         self.__is_running = mp.Value(ctypes.c_bool, True)
         self.__height = config.DefaultHeight
@@ -37,14 +50,30 @@ class Server:
         self.__ip = config.ServerIP
         self.__port = config.ServerPort
         self.__consecutive_ffmpeg_threads = config.ConsecutiveFFMPEGThreads
-        self.__current_running_ffmpeg_processes = 0
         # Network
-        self.__tcp_sock = self.__create_tcp_socket()
-        # Webserver
-        self.webserver = Webserver.Webserver()
+        self.__connection_handoff = ConnectionHandoff(config.ListenerProcesses) if config.ListenerProcesses > 0 \
+            else None
+        # The listener processes create their own sockets.
+        self.__tcp_sock = self.__create_tcp_socket() if self.__connection_handoff is None else None
+        self.__async_server = None
         # Video Encoder
         self.__to_be_encoded_out, self.__to_be_encoded_in = mp.Pipe(False)
         self.__encoding_queue = PriorityQueue()
+        # Shared by every process forked from here on, live frames are registered by the processes that attach to
+        # them as well and must not be unlinked when one of those ends.
+        resource_tracker.ensure_running()
+        # Metrics, must exist before any process that handles cameras is started.
+        self.__metrics = Metrics(self.__encoding_queue)
+        # Webserver
+        self.webserver = Webserver.Webserver(self.__metrics)
+        # Camera Workers
+        self.__camera_slots = {}
+        self.__writer_lags = {}
+        self.__camera_worker_pool = CameraWorkerPool(config.CameraWorkers, self.__to_be_encoded_in, self.__metrics) \
+            if config.CameraWorkers > 0 and self.__connection_handoff is None else None
+        # Live View
+        self.__live_view_receiver = LiveViewReceiver(self.__ip, config.LiveViewPort, config.LiveViewLossTimeout) \
+            if config.LiveViewPort != 0 else None
         self.__start_handling_unencoded_files_thread()
         # FolderStructure.encode_rename_and_delete_all_unfinished_raw_files(self.__encoding_queue, self.__logger)
         # Start Network listening
@@ -55,12 +84,17 @@ class Server:
                daemon=True).start()
         # Start Client Closing timer
         self.__start_client_closing_timer_thread()
+        # Start asking clients to hold back when the server falls behind, listener processes do this themselves.
+        if self.__connection_handoff is None:
+            self.__start_pressure_monitor_thread()
         self.__logger.debug("[Server]: Server Class Initialized.")
 
     def __create_tcp_socket(self):
         self.__logger.debug("[Server]: creating tcp socket...")
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, True)
+        if self.__connection_handoff is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, True)
         sock.setblocking(True)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1152000*5)
         # print(sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
@@ -75,11 +109,17 @@ class Server:
             while is_running.value:
                 current_running_ffmpeg_processes = []
                 priority = 0
+                # The processes of a run are started together, the speed is measured over the whole run.
+                start_time = time.monotonic()
+                video_duration = 0.0
                 for _ in range(consecutive_ffmpeg_threads):
                     priority, ffmpeg_command = encoding_queue.get()
+                    self.__metrics.server.started_files += 1
                     proc = self.__start_ffmpeg_process(ffmpeg_command, priority, log)
                     current_running_ffmpeg_processes.append((proc, ffmpeg_command[-1]))  # file path
+                    video_duration += VideoEncoder.get_input_duration(ffmpeg_command)
                 self.__handle_current_running_ffmpeg_processes(current_running_ffmpeg_processes, priority, log)
+                self.__metrics.server.encode_speed = video_duration / max(time.monotonic() - start_time, 1e-3)
             log.debug("[Server]: stopped handling unencoded files.")
 
         Thread(target=self.__pass_encoding_requests_from_pipe_to_priority_queue,
@@ -91,15 +131,16 @@ class Server:
 
     def __start_ffmpeg_process(self, ffmpeg_command, priority, log):
         log.debug(f"[Server]: ffmpeg command received with priority {priority}.")
-        proc = subprocess.Popen(ffmpeg_command, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL)
-        self.__current_running_ffmpeg_processes += 1
+        proc = VideoEncoder.start_ffmpeg_process(ffmpeg_command)
+        self.__metrics.server.running_ffmpeg_processes += 1
         log.debug(f"[Server]: ffmpeg process started with {proc.pid} PID.")
         return proc
 
     def __handle_current_running_ffmpeg_processes(self, current_running_ffmpeg_processes, priority, log):
         for proc, file_path in current_running_ffmpeg_processes:
             proc.wait()
-            self.__current_running_ffmpeg_processes -= 1
+            self.__metrics.server.running_ffmpeg_processes -= 1
+            self.__metrics.server.encoded_files += 1
             log.debug(f"[Server]: ffmpeg process with {proc.pid} PID finished with exit code: {proc.returncode}.")
             self.__handle_ffmpeg_return_code(proc, file_path, priority, log)
 
@@ -121,36 +162,91 @@ class Server:
         while is_running.value:
             output = pipe_out.recv()
             log.debug("[Server]: passing output from pipe to queue.")
+            self.__metrics.server.queued_files += 1
             encoding_queue.put(output)
 
     def __start_handling_new_connections_thread(self):
         self.__logger.debug("[Server]: listening for connections....")
+        if self.__connection_handoff is not None:
+            self.__start_listener_processes()
+            return
         self.__tcp_sock.listen()
+        if config.NetworkEngine == "asyncio":
+            self.__start_async_server_thread()
+            return
 
         def loop(is_running, tcp, log):
             while is_running.value:
                 conn, addr = tcp.accept()
                 log.debug(f"[Server]: client {addr[0]} connected to server.")
-                identifier = conn.recv(1)
-                log.debug(f"[Server]: identifier received: '{identifier.decode('utf-8')}' from client: {addr[0]}")
-                self.__handle_identifier(identifier, conn, addr[0])
+                # Every handshake gets its own thread, so a slow client doesn't hold up the others.
+                Thread(target=self.__handle_handshake, args=[conn, addr[0]], daemon=True).start()
 
         t = Thread(target=loop, args=[self.__is_running, self.__tcp_sock, self.__logger], daemon=True)
         t.start()
         self.__server_processes_threads.append(t)
 
+    def __start_async_server_thread(self):
+        self.__logger.debug("[Server]: starting asyncio network engine...")
+        self.__async_server = AsyncServer(self.__tcp_sock, self.webserver, self.__to_be_encoded_in,
+                                          self.__camera_worker_pool, self.__live_view_receiver, self.__metrics,
+                                          self.__height, self.__width)
+        t = Thread(target=self.__async_server.run, daemon=True)
+        t.start()
+        self.__server_processes_threads.append(t)
+
+    def __start_listener_processes(self):
+        self.__logger.debug(f"[Server]: starting {self.__connection_handoff.listeners} listener processes...")
+        remote_webserver = RemoteWebserver()
+        Thread(target=remote_webserver.serve, args=[self.webserver], daemon=True).start()
+        for index in range(self.__connection_handoff.listeners):
+            # Not a daemon, listeners start VideoWriter processes of their own.
+            p = mp.Process(target=self.__run_listener, args=(index, remote_webserver))
+            p.start()
+            self.__server_processes_threads.append(p)
+            self.__listener_processes.append(p)
+
+    def __run_listener(self, index, remote_webserver):
+        # Owns the clients whose ip belongs to this listener, from the handshake until the frames are written.
+        self.__logger.debug(f"[Server]: listener {index} started.")
+        self.__tcp_sock = self.__create_tcp_socket()
+        self.__tcp_sock.listen()
+        self.__async_server = AsyncServer(self.__tcp_sock, remote_webserver, self.__to_be_encoded_in, None,
+                                          self.__live_view_receiver, self.__metrics, self.__height, self.__width,
+                                          self.__connection_handoff, index)
+        self.__start_pressure_monitor_thread()
+        self.__async_server.run()
+
+    def __handle_handshake(self, conn, ip):
+        # Each step of the handshake has to be finished within the HandshakeTimeout.
+        conn.settimeout(config.HandshakeTimeout)
+        try:
+            identifier = conn.recv(1)
+            self.__logger.debug(f"[Server]: identifier received: '{identifier.decode('utf-8')}' from client: {ip}")
+            self.__handle_identifier(identifier, conn, ip)
+        except socket.timeout:
+            self.__logger.warning(f"[Server]: handshake with client {ip} timed out, connection dropped.")
+            conn.close()
+        except (struct.error, UnicodeDecodeError, OSError) as e:
+            # e.g. the client closed the connection in the middle of the handshake.
+            self.__logger.error(f"[Server]: handshake with client {ip} failed, connection dropped: {e}")
+            conn.close()
+
     def __handle_identifier(self, identifier, conn, ip):
         self.__logger.debug(f"[Server]: handling identifier '{identifier.decode('utf-8')}'...")
         # management
         if identifier == b"m":
             self.__logger.debug(f"[{ip}]: management connection created.")
             self.__logger.debug("[Server]: processing new management connection...")
+            conn.settimeout(None)
             self.__management_connections[ip] = conn
             self.__handle_management_connection(conn, ip)
         # camera
-        elif identifier == b"c" and self.__management_connections.get(ip) is not None:
+        elif identifier == b"c" and self.__wait_for_management_connection(ip) and \
+                self.__negotiate_frame_protocol(conn, ip):
             self.__logger.debug(f"[{ip}]: camera connection created.")
             self.__logger.debug("[Server]: processing new camera connection...")
+            conn.settimeout(None)
             self.__stream_connections[ip] = conn
         else:
             self.__logger.debug(f"[Server]: dropping identifier {identifier.decode('utf-8')}...")
@@ -158,85 +254,219 @@ class Server:
             self.__logger.debug("[Server]: connection dropped.")
         self.__logger.debug("[Server]: identifier handled.")
 
+    def __wait_for_management_connection(self, ip):
+        # Clients open both connections at once, the handshake of the management connection may still be running.
+        deadline = time.monotonic() + config.HandshakeTimeout
+        while self.__management_connections.get(ip) is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.__management_connections.get(ip) is not None
+
+    def __negotiate_frame_protocol(self, conn, ip):
+        client_version = VERSION.unpack(conn.recv(VERSION.size))[0]
+        version = negotiate_version(client_version)
+        conn.send(VERSION.pack(version))
+        self.__logger.debug(f"[{ip}]: frame protocol version {version} negotiated (client: {client_version}).")
+        return version != 0
+
     def __handle_management_connection(self, connection, ip_address):
         def loop(log, conn, ip, height, width):
             log.debug(f"[{ip}]: handling management connection...")
-            is_running = mp.Value(ctypes.c_bool, False)
-            log.debug(f"[{ip}]: listening for commands...")
-            fps = 30
-            while True:
-                try:
-                    request = conn.recv(2)
-                except OSError:
-                    # When connection was closed properly.
-                    self.__logger.debug(f"[{ip}]: connection dead.")
-                    break
-                log.debug(f"[{ip}]: command received: '{request.decode('utf-8')}'")
-                # get Resolution
-                if request == b"gr":
-                    log.debug(f"[{ip}]: requesting frames resolution.")
-                    log.debug(f"[{ip}]: sending frame resolution to client...")
-                    conn.send(struct.pack(">2H", height, width))
-                    log.debug(f"[{ip}]: resolution send.")
-                # set resolution
-                elif request == b"sr":
-                    log.debug(f"[{ip}]: requests use of custom resolution")
-                    log.debug(f"[{ip}]: receiving custom resolution...")
-                    height, width = struct.unpack(">2H", conn.recv(struct.calcsize(">2H")))
-                    print(height, width)
-                    log.debug(f"[{ip}]: custom resolution received.")
-                # set fps
-                elif request == b"sf":
-                    log.debug(f"[{ip}]: sending fps...")
-                    fps = int(struct.unpack(">B", conn.recv(struct.calcsize(">B")))[0])
-                # start stream
-                elif request == struct.pack(">?", True):
-                    log.debug(f"[{ip}]: requests stream start...")
-                    self.__start_stream(log, is_running, height, width, ip, conn, fps)
-                # client closed
-                elif request == struct.pack(">?", False):
-                    log.debug(f"[{ip}]: client shutting down...")
-                    self.__close_client(ip, is_running)
-                    break
-                # client crashed
-                elif request == b"":
-                    self.__handle_client_crash(is_running, ip)
-                    break
+            encoding = RAW
+            live_view = False
+            try:
+                # Shared with the VideoWriter, clients may change the fps while streaming (motion gating).
+                is_running, fps, writer_lag = self.__create_stream_values(ip)
+                log.debug(f"[{ip}]: listening for commands...")
+                while True:
+                    try:
+                        request = conn.recv(2)
+                        log.debug(f"[{ip}]: command received: {request!r}")
+                        # get Resolution
+                        if request == b"gr":
+                            log.debug(f"[{ip}]: requesting frames resolution.")
+                            log.debug(f"[{ip}]: sending frame resolution to client...")
+                            conn.send(struct.pack(">2H", height, width))
+                            log.debug(f"[{ip}]: resolution send.")
+                        # set resolution
+                        elif request == b"sr":
+                            log.debug(f"[{ip}]: requests use of custom resolution")
+                            log.debug(f"[{ip}]: receiving custom resolution...")
+                            height, width = self.__receive_arguments(conn, ">2H")
+                            log.debug(f"[{ip}]: custom resolution received: {width}x{height}.")
+                        # set fps
+                        elif request == b"sf":
+                            log.debug(f"[{ip}]: sending fps...")
+                            fps.value = self.__receive_arguments(conn, ">B")[0]
+                            log.debug(f"[{ip}]: fps set to {fps.value}.")
+                        # set encoding
+                        elif request == b"se":
+                            encoding, quality = self.__receive_arguments(conn, ">2B")
+                            log.debug(f"[{ip}]: stream encoding set to {get_encoding_name(encoding)} "
+                                      f"(quality {quality}).")
+                        # live view
+                        elif request == b"lv":
+                            live_view = self.__live_view_receiver is not None
+                            conn.send(struct.pack(">H", self.__live_view_receiver.port if live_view else 0))
+                            log.debug(f"[{ip}]: live view over udp {'accepted' if live_view else 'not available'}.")
+                        # start stream
+                        elif request == struct.pack(">?", True):
+                            log.debug(f"[{ip}]: requests stream start...")
+                            self.__start_stream(log, is_running, height, width, ip, conn, fps, encoding, live_view)
+                        # client closed
+                        elif request == struct.pack(">?", False):
+                            log.debug(f"[{ip}]: client shutting down...")
+                            self.__close_client(ip, is_running)
+                            break
+                        # client crashed
+                        elif request == b"":
+                            self.__handle_client_crash(is_running, ip)
+                            break
+                    except (socket.timeout, ConnectionAbortedError):
+                        log.warning(f"[{ip}]: command arguments not received.")
+                        self.__handle_client_crash(is_running, ip)
+                        break
+                    except OSError:
+                        # When connection was closed properly.
+                        self.__logger.debug(f"[{ip}]: connection dead.")
+                        break
+            finally:
+                # No entries are left behind on any way out, a reconnecting client must not find the old connections.
+                if self.__management_connections.get(ip) is conn:
+                    self.__close_client_connections(ip)
+                self.__release_stream_values(ip)
             log.debug(f"[{ip}]: stopped listening for commands.")
 
         t = Thread(target=loop, args=[self.__logger, connection, ip_address, self.__height, self.__width], daemon=True)
         t.start()
 
-    def __start_stream(self, log, is_running, height, width, ip, conn, fps):
+    @staticmethod
+    def __receive_arguments(conn, fmt):
+        # A client that sent a command has to send its arguments right after it.
+        arguments = memoryview(bytearray(struct.calcsize(fmt)))
+        conn.settimeout(config.HandshakeTimeout)
+        try:
+            received = 0
+            while received < len(arguments):
+                count = conn.recv_into(arguments[received:])
+                if count == 0:
+                    raise ConnectionAbortedError("connection closed while receiving command arguments")
+                received += count
+        finally:
+            conn.settimeout(None)
+        return struct.unpack(fmt, arguments)
+
+    def __create_stream_values(self, ip):
+        if self.__camera_worker_pool is None:
+            is_running, fps = mp.Value(ctypes.c_bool, False), mp.Value(ctypes.c_ubyte, 30, lock=False)
+            writer_lag = mp.Value(ctypes.c_double, 0.0, lock=False)
+        else:
+            slot, is_running, fps, writer_lag = self.__camera_worker_pool.reserve_slot()
+            self.__camera_slots[ip] = slot
+        self.__writer_lags[ip] = writer_lag
+        self.__metrics.add_camera(ip)
+        return is_running, fps, writer_lag
+
+    def __release_stream_values(self, ip):
+        self.__writer_lags.pop(ip, None)
+        self.__metrics.remove_camera(ip)
+        if self.__live_view_receiver is not None:
+            self.__live_view_receiver.remove_camera(ip)
+        if ip in self.__camera_slots:
+            self.__camera_worker_pool.release_slot(self.__camera_slots.pop(ip))
+
+    def __start_stream(self, log, is_running, height, width, ip, conn, fps, encoding, live_view):
         log.debug(f"[{ip}] starting stream...")
+        live_frame = self.__create_live_frame(ip, height, width, encoding, live_view)
+        if ip in self.__camera_slots:
+            # A camera worker receives and writes the stream together with the streams of other cameras.
+            self.__camera_worker_pool.start_camera(self.__camera_slots[ip], ip, self.__stream_connections[ip],
+                                                   (height, width), encoding, live_frame)
+            self.__camera_processes[ip] = []
+            conn.send(struct.pack(">?", True))
+            return
         is_running.value = True
         pipe_out, pipe_in = mp.Pipe(False)
-        video_writer = VideoWriter((width, height), fps, is_running, ip, pipe_out)
-        self.webserver.resolutions[ip] = (height, width)
+        video_writer = VideoWriter((width, height), fps, is_running, self.__writer_lags[ip], ip, pipe_out, encoding,
+                                   self.__metrics.get_camera(ip))
+        # Inline, the stream process writes the frames itself and no VideoWriter process is needed.
         self.__handle_stream_connection(is_running, pipe_in, height, width, ip, self.__stream_connections[ip],
-                                        self.webserver.frames)
-        p = video_writer.start_writing_video(self.__to_be_encoded_in)
-        self.__camera_processes[ip].append(p)
+                                        live_frame, encoding, video_writer if config.InlineVideoWriter else None)
+        if not config.InlineVideoWriter:
+            p = video_writer.start_writing_video(self.__to_be_encoded_in)
+            self.__camera_processes[ip].append(p)
         conn.send(struct.pack(">?", True))
 
+    def __create_live_frame(self, ip, height, width, encoding, live_view):
+        # Returns the live frame the stream has to show its frames in.
+        if live_view:
+            # The client sends its live view over udp, this works for encoded video streams as well.
+            self.__live_view_receiver.add_camera(ip, self.webserver.add_camera(ip, (height, width)))
+            return None
+        return None if encoding in VIDEO_STREAM_ENCODINGS else self.webserver.add_camera(ip, (height, width))
+
     def __handle_stream_connection(self, is_running, pipe_in, height, width, ip_address, stream_connection,
-                                   webserver_frames):
-        def loop(log, ip, conn, h, w, is_run, pipe, ws_frames):
-            log.debug(f"[{ip}]: stream started.")
-            frame_byte_size = h * w * 3
+                                   live_frame, encoding, video_writer):
+        def loop(log, ip, conn, h, w, is_run, pipe, live, enc, writer, to_be_encoded_in, counters):
+            log.debug(f"[{ip}]: stream started ({get_encoding_name(enc)}).")
+            if writer is not None:
+                writer.open(to_be_encoded_in)
+            write_frame = (lambda frame, frame_times: VideoWriter.send_frame(pipe, frame, frame_times)) \
+                if writer is None else writer.write
+            statistics = StreamStatistics(counters)
+            decoder = StreamDecoder((h, w), enc)
+            # Frames are received straight into these buffers, they can be reused as soon as the frame was passed on.
+            header = memoryview(bytearray(FRAME_HEADER.size))
+            payload_buffer = bytearray(decoder.frame_byte_size)
             while is_run.value:
-                buffer = b""
-                while len(buffer) < frame_byte_size and is_run.value:
-                    buffer += conn.recv(frame_byte_size - len(buffer))
-                pipe.send_bytes(buffer)
-                ws_frames[ip] = buffer
+                if self.__receive_into(conn, header, is_run) < FRAME_HEADER.size:
+                    break
+                try:
+                    flags, length, sequence, capture_time = unpack_header(header)
+                    decoder.check_payload_size(length)
+                except ValueError as e:
+                    log.error(f"[{ip}]: {e}")
+                    break
+                if length > len(payload_buffer):
+                    payload_buffer = bytearray(length)
+                payload = memoryview(payload_buffer)[:length]
+                if self.__receive_into(conn, payload, is_run) < length:
+                    break
+                statistics.add(sequence, capture_time, FRAME_HEADER.size + length)
+                try:
+                    buffer = decoder.decode(payload)
+                except ValueError as e:
+                    log.warning(f"[{ip}]: dropping frame with {e}.")
+                    continue
+                if buffer is None:
+                    continue
+                statistics.frame_queued()
+                write_frame(buffer, statistics.get_frame_times(capture_time))
+                if live is not None:
+                    live.publish(buffer)
+            if writer is not None:
+                writer.close()
+            log.info(f"[{ip}]: {statistics.get_summary()}.")
+            if not decoder.is_video_stream:
+                saved_bytes = statistics.frames * decoder.frame_byte_size - statistics.received_bytes
+                log.info(f"[{ip}]: {saved_bytes} bytes saved.")
             log.debug(f"[{ip}]: stream stopped..")
 
         p = mp.Process(target=loop, args=(self.__logger, ip_address, stream_connection, height, width,
-                                          is_running, pipe_in, webserver_frames), daemon=True)
+                                          is_running, pipe_in, live_frame, encoding, video_writer,
+                                          self.__to_be_encoded_in, self.__metrics.get_camera(ip_address)), daemon=True)
         p.start()
         self.__camera_processes[ip_address] = [p]
 
+    @staticmethod
+    def __receive_into(conn, view, is_running):
+        received = 0
+        while received < len(view) and is_running.value:
+            count = conn.recv_into(view[received:])
+            if count == 0:
+                break
+            received += count
+        return received
+
     def __close_client(self, ip, is_running):
         is_running.value = False
         self.__join_all_client_processes(ip)
@@ -252,18 +482,21 @@ class Server:
 
     def __join_all_client_processes(self, ip):
         self.__logger.debug(f"[Server]: joining all processes of client {ip}...")
-        for item in self.__camera_processes[ip]:
+        if ip in self.__camera_slots:
+            self.__camera_worker_pool.stop_camera(self.__camera_slots[ip])
+        # A client whose handshake timed out never started a stream.
+        for item in self.__camera_processes.pop(ip, []):
             self.__logger.debug(f"[Server]: joining process: {item} of client {ip}")
             item.join(timeout=15)
             self.__logger.debug(f"[Server]: process: {item} of client {ip} joined.")
         self.__logger.debug(f"[Server]: all processes of client {ip} joined.")
-        del self.__camera_processes[ip]
 
     def __close_client_connections(self, ip):
         self.__logger.debug(f"[{ip}]: closing socket connections...")
         self.__management_connections[ip].close()
         self.__logger.debug(f"[{ip}]: management connection closed.")
-        self.__stream_connections[ip].close()
+        if ip in self.__stream_connections:
+            self.__stream_connections[ip].close()
         self.__logger.debug(f"[{ip}]: stream connection closed.")
         self.__clear_client_from_connections_dict(ip)
         self.__logger.debug(f"[{ip}]: socket connections closed.")
@@ -272,9 +505,45 @@ class Server:
         self.__logger.debug(f"[{ip}]: deleting client connections from server memory...")
         del self.__management_connections[ip]
         self.__logger.debug(f"[{ip}]: management connection deleted.")
-        del self.__stream_connections[ip]
+        self.__stream_connections.pop(ip, None)
         self.__logger.debug(f"[{ip}]: stream connection deleted.")
 
+    def __start_pressure_monitor_thread(self):
+        self.__logger.debug("[Server]: Starting pressure monitor thread...")
+
+        def loop(is_running, log, monitor):
+            # ip: (writer lag of the client, pressure level sent to it)
+            levels = {}
+            while is_running.value:
+                time.sleep(UPDATE_INTERVAL)
+                monitor.update()
+                writer_lags = self.__async_server.get_writer_lags() if self.__async_server is not None \
+                    else dict(self.__writer_lags)
+                for ip in set(levels) - set(writer_lags):
+                    del levels[ip]
+                    monitor.remove_camera(ip)
+                for ip, writer_lag in writer_lags.items():
+                    level = monitor.get_level(ip, writer_lag.value)
+                    last_writer_lag, last_level = levels.get(ip, (None, 0))
+                    # A client that reconnected starts without pressure.
+                    if level == (last_level if last_writer_lag is writer_lag else 0):
+                        continue
+                    log.info(f"[{ip}]: sending pressure level {level}.")
+                    self.__send_pressure_level(ip, level)
+                    levels[ip] = (writer_lag, level)
+
+        Thread(target=loop, args=[self.__is_running, self.__logger, PressureMonitor(self.__metrics)],
+               daemon=True).start()
+
+    def __send_pressure_level(self, ip, level):
+        if self.__async_server is not None:
+            self.__async_server.send_pressure_level(ip, level)
+            return
+        try:
+            self.__management_connections[ip].send(b"p" + struct.pack(">B", level))  # pressure
+        except (KeyError, OSError) as e:
+            self.__logger.warning(f"[{ip}]: pressure level not sent: {e}")
+
     def __start_client_closing_timer_thread(self):
         self.__logger.debug(f"[Server]: Client Closing time: {config.ClientStoppingPoint}")
         if config.ClientStoppingPoint is not None:
@@ -300,6 +569,15 @@ class Server:
         return time_until_closing
 
     def __close_all_clients(self):
+        if self.__connection_handoff is not None:
+            for index in self.__connection_handoff.close_all_clients(self.__listener_processes):
+                self.__logger.error(f"[Server]: listener {index} did not close its clients in time.")
+            self.__cleanup_after_all_clients_close()
+            return
+        if self.__async_server is not None:
+            self.__async_server.close_all_clients()
+            self.__cleanup_after_all_clients_close()
+            return
         self.__logger.debug("[Server]: Closing all Client connections...")
         for key in self.__management_connections:
             self.__logger.debug(f"[{key}]: Sending Closing Command.")
@@ -331,7 +609,7 @@ class Server:
 
     def __wait_until_all_planned_and_running_ffmpeg_processes_conclude(self):
         self.__logger.debug("[Server]: Waiting until all planned and running ffmpeg processes conclude...")
-        while self.__current_running_ffmpeg_processes != 0 and self.__encoding_queue.qsize() > 0:
+        while self.__metrics.server.running_ffmpeg_processes != 0 and self.__encoding_queue.qsize() > 0:
             pass
         self.__logger.debug("[Server]: All planned and running ffmpeg processes have concluded.")
 
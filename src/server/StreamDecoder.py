@@ -0,0 +1,36 @@
+from src.shared.FrameCodec import RAW, JPEG, DELTA, VIDEO_STREAM_ENCODINGS, decode_jpeg
+from src.shared.TileDelta import TileDeltaDecoder
+
+
+# Turns the payloads of a camera stream back into raw frames for the VideoWriter and the webserver.
+class StreamDecoder:
+    def __init__(self, resolution, encoding):
+        height, width = resolution
+        self.frame_byte_size = height * width * 3
+        # Padded delta tiles with their indices and encoded video stay well below this, anything larger is corrupt.
+        self.max_payload_size = self.frame_byte_size * 2 + (1 << 16)
+        self.__encoding = encoding
+        self.__delta_decoder = TileDeltaDecoder(resolution) if encoding == DELTA else None
+
+    @property
+    def is_video_stream(self):
+        return self.__encoding in VIDEO_STREAM_ENCODINGS
+
+    def check_payload_size(self, size):
+        # Called before a buffer for the payload is allocated.
+        if size > self.max_payload_size:
+            raise ValueError(f"payload of {size} bytes exceeds the maximum of {self.max_payload_size} bytes")
+
+    def decode(self, payload):
+        # Encoded video is passed on as it is and not shown in the live view.
+        if self.is_video_stream:
+            return payload
+        if self.__encoding == RAW:
+            buffer = payload
+        elif self.__encoding == JPEG:
+            buffer = decode_jpeg(payload).tobytes()
+        else:
+            buffer = self.__delta_decoder.decode(payload)
+        if buffer is not None and len(buffer) != self.frame_byte_size:
+            raise ValueError(f"unexpected frame size {len(buffer)}")
+        return buffer
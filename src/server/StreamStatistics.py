@@ -0,0 +1,50 @@
+import time
+
+
+class StreamStatistics:
+    def __init__(self, counters=None):
+        # The shared memory counters of the camera for the metrics, if any.
+        self.__counters = counters
+        self.frames = 0
+        self.received_bytes = 0
+        self.skipped_frames = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.__next_sequence = None
+        self.__clock_offset = None
+        self.__receive_time = 0.0
+
+    def add(self, sequence, capture_time, received_bytes):
+        self.__receive_time = time.monotonic()
+        self.frames += 1
+        self.received_bytes += received_bytes
+        # Sequence numbers missing in between were dropped on the client.
+        skipped_frames = 0
+        if self.__next_sequence is not None:
+            skipped_frames = (sequence - self.__next_sequence) & 0xFFFFFFFF
+            self.skipped_frames += skipped_frames
+        self.__next_sequence = (sequence + 1) & 0xFFFFFFFF
+        if self.__counters is not None:
+            self.__counters.frames += 1
+            self.__counters.received_bytes += received_bytes
+            self.__counters.dropped_frames += skipped_frames
+        # The clocks of client and server are unrelated, the smallest difference seen counts as zero latency.
+        clock_offset = self.__receive_time - capture_time
+        if self.__clock_offset is None or clock_offset < self.__clock_offset:
+            self.__clock_offset = clock_offset
+        self.latency = clock_offset - self.__clock_offset
+        self.max_latency = max(self.max_latency, self.latency)
+
+    def frame_queued(self):
+        # Called right before a frame is handed to the VideoWriter, VideoWriter.write counts the written frames.
+        if self.__counters is not None:
+            self.__counters.queued_frames += 1
+
+    def get_frame_times(self, capture_time):
+        # The capture time of the last added frame on the client's and on the server's clock and its receive time.
+        # VideoWriter.write measures the lags with them once the frame is written.
+        return capture_time, self.__receive_time - self.latency, self.__receive_time
+
+    def get_summary(self):
+        return f"{self.frames} frames, {self.received_bytes} bytes received, {self.skipped_frames} frames skipped, " \
+               f"max latency {self.max_latency * 1000:.0f} ms"
@@ -1,5 +1,9 @@
 import os
+from RawContainer import RawContainer
+from MatroskaWriter import MatroskaWriter
 from src.server.Config import config
+from src.shared.FFMPEGOptions import get_frame_rate_mode_option
+from threading import Thread
 import ntpath
 import subprocess
 
@@ -7,18 +11,114 @@ import subprocess
 class VideoEncoder:
     @staticmethod
     def get_ffmpeg_command(input_path, width, height, fps):
-        final_output_path = os.path.join(os.path.dirname(input_path), os.path.splitext(ntpath.basename(input_path))[0] +
-                                         config.OutputFileExtension)
         ffmpeg_command = ["ffmpeg",
                           "-y",
                           "-f", "rawvideo",
                           "-vcodec", "rawvideo",
                           "-video_size", f"{width}x{height}",
                           "-pixel_format", "bgr24",
-                          "-framerate", "5",
+                          "-framerate", str(fps),
                           "-i", input_path]
         ffmpeg_command += config.FFMPEGOutputFileOptions.split(" ")
-        ffmpeg_command.append(final_output_path)
+        ffmpeg_command.append(VideoEncoder.get_output_path(input_path))
+        return ffmpeg_command
+
+    @staticmethod
+    def get_output_path(input_path):
+        return os.path.join(os.path.dirname(input_path), os.path.splitext(ntpath.basename(input_path))[0] +
+                            config.OutputFileExtension)
+
+    @staticmethod
+    def start_ffmpeg_process(ffmpeg_command):
+        # Compressed raw files are decompressed into the stdin of ffmpeg, the frames never go to disk uncompressed.
+        # They are passed on with their capture times, skipped duplicate frames are shown until the next frame
+        # (variable frame rate).
+        input_path = ffmpeg_command[ffmpeg_command.index("-i") + 1]
+        if not RawContainer.is_raw_container(input_path):
+            return subprocess.Popen(ffmpeg_command, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL)
+        ffmpeg_command = ["ffmpeg",
+                          "-y",
+                          "-f", "matroska",
+                          "-i", "pipe:0",
+                          get_frame_rate_mode_option(), "vfr"]
+        ffmpeg_command += config.FFMPEGOutputFileOptions.split(" ")
+        ffmpeg_command.append(VideoEncoder.get_output_path(input_path))
+        proc = subprocess.Popen(ffmpeg_command, stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+                                stdout=subprocess.DEVNULL)
+        Thread(target=VideoEncoder.__feed_frames, args=[input_path, proc.stdin], daemon=True).start()
+        return proc
+
+    @staticmethod
+    def __feed_frames(input_path, stdin):
+        try:
+            width, height, _ = RawContainer.get_metadata(input_path)
+            matroska_writer = MatroskaWriter(stdin, width, height)
+            for frame, capture_time in RawContainer.read_frames(input_path):
+                matroska_writer.write(frame, capture_time)
+        except (BrokenPipeError, ValueError, OSError):
+            # ffmpeg stopped or the file is damaged, ffmpeg encodes what it received.
+            pass
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+
+    @staticmethod
+    def get_input_duration(ffmpeg_command):
+        # Seconds of video in the raw input file of a command from get_ffmpeg_command.
+        input_path = ffmpeg_command[ffmpeg_command.index("-i") + 1]
+        width, height = map(int, ffmpeg_command[ffmpeg_command.index("-video_size") + 1].split("x"))
+        framerate = float(ffmpeg_command[ffmpeg_command.index("-framerate") + 1])
+        try:
+            if RawContainer.is_raw_container(input_path):
+                # Duplicate frames may have been skipped, the capture times tell how long the video is.
+                capture_times = RawContainer.read_timestamps(input_path)
+                return capture_times[-1] - capture_times[0] + 1 / framerate if capture_times else 0.0
+            frames = os.path.getsize(input_path) / (width * height * 3)
+        except (OSError, ValueError):
+            return 0.0
+        return frames / framerate
+
+    @staticmethod
+    def get_segment_command(input_format, output_pattern, segment_time):
+        # Cuts the incoming stream into segments without re-encoding.
+        return VideoEncoder.__get_segment_command(["-f", input_format], ["-c", "copy"], output_pattern, segment_time)
+
+    @staticmethod
+    def get_live_encode_command(width, height, fps, output_pattern, segment_time, first_cut=0):
+        # Encodes raw frames as they arrive, a keyframe is forced at every cut so the segments have the right length.
+        # first_cut: seconds until the first wall-clock cut, the following ones are segment_time apart.
+        # Every frame is stamped with the time it arrives, so t follows the same clock as -segment_atclocktime even
+        # when frames were skipped, and ffmpeg fills the gaps to keep fps.
+        input_options = ["-f", "rawvideo",
+                         "-vcodec", "rawvideo",
+                         "-video_size", f"{width}x{height}",
+                         "-pixel_format", "bgr24",
+                         "-framerate", str(fps),
+                         "-use_wallclock_as_timestamps", "1"]
+        output_options = config.FFMPEGOutputFileOptions.split(" ") + \
+            ["-force_key_frames", f"expr:gte(t,{first_cut:.3f}+(n_forced-1)*{segment_time})"]
+        return VideoEncoder.__get_segment_command(input_options, output_options, output_pattern, segment_time)
+
+    @staticmethod
+    def __get_segment_command(input_options, output_options, output_pattern, segment_time):
+        # Reads the stream from stdin, finished segments are listed on stdout.
+        ffmpeg_command = ["ffmpeg",
+                          "-y",
+                          "-loglevel", "error"]
+        ffmpeg_command += input_options
+        ffmpeg_command += ["-i", "pipe:0"]
+        ffmpeg_command += output_options
+        ffmpeg_command += ["-f", "segment",
+                           "-segment_time", str(segment_time),
+                           # Cuts at multiples of segment_time since midnight, like the raw files.
+                           "-segment_atclocktime", "1",
+                           "-reset_timestamps", "1",
+                           "-strftime", "1",
+                           "-segment_list", "pipe:1",
+                           "-segment_list_type", "csv",
+                           output_pattern]
         return ffmpeg_command
 
     @staticmethod
@@ -1,26 +1,55 @@
 from FolderStructure import FolderStructure
 from VideoEncoder import VideoEncoder
+from PressureMonitor import MAX_PRESSURE_LEVEL
+from SegmentFile import SegmentFile
+from RawContainer import RawContainer
 from src.shared.Logger import create_logger
 from src.server.Config import config
+from src.shared.FrameCodec import VIDEO_STREAM_ENCODINGS
 import multiprocessing as mp
+import subprocess
 from threading import Thread
-import ctypes
 import struct
 import os
 import time
-from datetime import timedelta
+from datetime import datetime, timedelta
+
+# Sent ahead of every frame to a VideoWriter process, see StreamStatistics.get_frame_times.
+FRAME_TIMES = struct.Struct(">3d")
+# Under pressure clients send every (level + 1)th frame at most, without telling the server about the lower rate.
+MAX_REPEATS = MAX_PRESSURE_LEVEL + 1
 
 
 class VideoWriter:
-    def __init__(self, resolution, fps, is_running, ip, pipe):
+    def __init__(self, resolution, fps, is_running, writer_lag, ip, pipe, encoding, counters=None):
         self.__logger = create_logger(__name__, config.DebugMode, "server.log")
         self.__logger.debug(f"[{ip}]: Initializing VideoWriter Class...")
         self.__width, self.__height = resolution
         self.__fps = fps
         self.__is_running = is_running
+        # Shared with the pressure monitor, the time from capture until the last frame was written.
+        self.__writer_lag = writer_lag
         self.__ip = ip
         self.__pipe_out = pipe
+        self.__encoding = encoding
+        # The shared memory counters of the camera for the metrics, if any.
+        self.__counters = counters
         self.__folder_structure = FolderStructure(ip)
+        self.__encoding_pipe_in = None
+        # raw files
+        self.__output_file = None
+        # Server time at which the output file is cut, None if files are only cut by fps changes and size.
+        self.__next_cut_time = None
+        # Compresses the frames into the output file, if RawCompression is on.
+        self.__output_container = None
+        self.__output_path = None
+        self.__output_fps = None
+        # Capture time of the first frame and amount of frames written, of the current plain raw file.
+        self.__first_capture_time = None
+        self.__output_frames = 0
+        # encoded video streams
+        self.__segment_process = None
+        self.__segment_thread = None
         self.__logger.debug(f"[{ip}]: VideoWriter Class initialized.")
 
     def start_writing_video(self, to_be_encoded_pipe_in):
@@ -33,45 +62,202 @@ class VideoWriter:
         return write_video_process
 
     def __write_video(self, is_running, pipe_out, encoding_pipe_in, log, ip):
-        cut_bool = mp.Value(ctypes.c_bool, True)
-        if not config.VideoCutTime:
-            self.__start_cut_timer_thread(cut_bool, is_running, log, ip)
-        while is_running.value:
-            output_path = self.__folder_structure.get_output_path()
-            self.__create_and_write_to_output_file(output_path, cut_bool, is_running, pipe_out, log, ip)
-            new_output_path = self.__folder_structure.rename_output_file(output_path)
-            encoding_pipe_in.send(
-                (3, VideoEncoder.get_ffmpeg_command(new_output_path, self.__width, self.__height, self.__fps)))
-
-    def __start_cut_timer_thread(self, cut_bool, is_running, log, ip):
-        log.debug(f"[{ip}]: starting cut timer thread...")
-        cut_timer_thread = Thread(target=self.__cut_timer, args=[cut_bool, is_running], daemon=True)
-        cut_timer_thread.start()
-
-    def __cut_timer(self, cut_bool, is_running):
-        while is_running.value:
-            if cut_bool.value:
-                continue
-            time.sleep(self.__calculate_cut_timer())
-            cut_bool.value = True
-
-    def __calculate_cut_timer(self):
+        self.open(encoding_pipe_in)
+        try:
+            while is_running.value:
+                frame_times = FRAME_TIMES.unpack(pipe_out.recv_bytes())
+                self.write(pipe_out.recv_bytes(), frame_times)
+        finally:
+            self.close()
+        log.debug(f"[{ip}]: video writing process finished.")
+
+    @staticmethod
+    def send_frame(pipe, frame, frame_times):
+        # Passes a frame to the process of start_writing_video.
+        pipe.send_bytes(FRAME_TIMES.pack(*frame_times))
+        pipe.send_bytes(frame)
+
+    # open, write and close can also be called directly by whoever receives the stream,
+    # the frames then go to disk without passing through a VideoWriter process.
+    def open(self, encoding_pipe_in):
+        self.__encoding_pipe_in = encoding_pipe_in
+        if self.__encoding in VIDEO_STREAM_ENCODINGS or config.LiveEncoding:
+            self.__start_segment_process()
+
+    def write(self, frame, frame_times):
+        capture_time, server_capture_time, receive_time = frame_times
+        if self.__encoding in VIDEO_STREAM_ENCODINGS:
+            self.__write_to_segment_process(frame)
+        elif config.LiveEncoding:
+            # The frame rate of the encoder is fixed, a fps change starts a new process and with it a new segment.
+            if self.__fps.value != self.__output_fps:
+                self.__stop_segment_process()
+                self.__start_segment_process()
+            self.__write_to_segment_process(frame)
+        else:
+            # Every file is written with a single frame rate, a fps change starts a new file.
+            if self.__output_file is None or self.__is_cut_due() or self.__fps.value != self.__output_fps:
+                self.__finish_output_file()
+                self.__create_output_file()
+            if self.__output_container is None:
+                for _ in range(self.__get_repeats(capture_time)):
+                    self.__output_file.write(frame)
+            elif self.__output_container.is_duplicate(frame, config.DuplicateFrameThreshold):
+                self.__output_container.skip(capture_time)
+                if self.__counters is not None:
+                    self.__counters.duplicate_frames += 1
+            else:
+                self.__output_container.write(frame, capture_time)
+        now = time.monotonic()
+        self.__writer_lag.value = now - server_capture_time
+        if self.__counters is not None:
+            self.__counters.written_frames += 1
+            self.__counters.writer_lag = self.__writer_lag.value
+            self.__counters.disk_lag = now - receive_time
+
+    def __get_repeats(self, capture_time):
+        # How often a frame is written to keep the fixed frame rate of a plain raw file in time.
+        # Frames the client skipped under pressure are filled with the frame before them.
+        if self.__first_capture_time is None:
+            self.__first_capture_time = capture_time
+        due = round((capture_time - self.__first_capture_time) * self.__output_fps) + 1 - self.__output_frames
+        repeats = min(max(due, 1), MAX_REPEATS)
+        self.__output_frames += repeats
+        return repeats
+
+    def close(self):
+        if self.__encoding in VIDEO_STREAM_ENCODINGS or config.LiveEncoding:
+            self.__stop_segment_process()
+        else:
+            self.__finish_output_file()
+
+    def __start_segment_process(self):
+        # ffmpeg cuts at the same wall-clock boundaries as the raw files (see __get_next_cut_time).
+        segment_time = self.__calculate_cut_timer() if config.VideoCutTime else 24 * 60 * 60
+        output_pattern = self.__folder_structure.get_segment_output_pattern()
+        if self.__encoding in VIDEO_STREAM_ENCODINGS:
+            # The client already encoded the video, ffmpeg only cuts it into the final files.
+            ffmpeg_command = VideoEncoder.get_segment_command("mpegts", output_pattern, segment_time)
+        else:
+            # Raw frames are encoded while they arrive, they never go to disk or the encoding queue.
+            self.__output_fps = self.__fps.value
+            first_cut = VideoWriter.__get_next_cut_time(time.time()) - time.time() if config.VideoCutTime else 0
+            ffmpeg_command = VideoEncoder.get_live_encode_command(self.__width, self.__height, self.__output_fps,
+                                                                  output_pattern, segment_time, first_cut)
+        self.__logger.debug(f"[{self.__ip}]: starting segment process...")
+        self.__segment_process = subprocess.Popen(ffmpeg_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.__segment_thread = Thread(target=self.__handle_finished_segments,
+                                       args=[self.__segment_process.stdout, self.__logger, self.__ip], daemon=True)
+        self.__segment_thread.start()
+
+    def __write_to_segment_process(self, data):
+        if self.__segment_process is None:
+            return
+        try:
+            self.__segment_process.stdin.write(data)
+        except BrokenPipeError:
+            self.__logger.error(f"[{self.__ip}]: segment process closed unexpectedly.")
+            self.__stop_segment_process()
+
+    def __stop_segment_process(self):
+        proc, self.__segment_process = self.__segment_process, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        proc.wait()
+        self.__segment_thread.join(timeout=15)
+        self.__logger.debug(f"[{self.__ip}]: segment process finished with exit code: {proc.returncode}.")
+
+    def __handle_finished_segments(self, segment_list, log, ip):
+        for line in segment_list:
+            # csv: file name, start time, end time
+            segment_name, start, end = line.decode().strip().rsplit(",", 2)
+            log.debug(f"[{ip}]: segment finished: {segment_name}.")
+            new_segment_path = self.__folder_structure.move_finished_segment(segment_name, float(end) - float(start))
+            if config.ConcatAmount > 1:
+                FolderStructure.add_to_be_concat(new_segment_path, log)
+
+    def __is_cut_due(self):
+        # Checked for every frame, so no thread has to wait for the cut.
+        if self.__next_cut_time is not None and time.time() >= self.__next_cut_time:
+            return True
+        return bool(config.MaxSegmentSize) and self.__output_file.size >= config.MaxSegmentSize
+
+    @staticmethod
+    def __calculate_cut_timer():
         return timedelta(hours=config.VideoCutTime.hour, minutes=config.VideoCutTime.minute,
                          seconds=config.VideoCutTime.second).seconds
 
-    def __create_and_write_to_output_file(self, output_path, cut_bool, is_running, pipe_out, log, ip):
-        log.debug(f"[{ip}]: creating new file: {output_path}.")
-        with open(output_path, "wb") as file:
-            self.__write_extended_attributes(output_path)
-            log.debug(f"[{ip}]: writing to {output_path}...")
-            cut_bool.value = False
-            while is_running.value and not cut_bool.value:
-                frame = pipe_out.recv_bytes()
-                file.write(frame)
-        log.debug(f"[{ip}]: stopped writing to {output_path}.")
-
-    def __write_extended_attributes(self, file_path):
+    @staticmethod
+    def __get_next_cut_time(now):
+        # The cuts are counted from midnight, so every camera cuts at the same time, e.g. at :00, :15, :30 and :45
+        # for 00:15:00, no matter when it connected. The last file of a day ends at midnight.
+        # Uses the time of the server, the capture times of the frames come from the clock of the client.
+        now = datetime.fromtimestamp(now)
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        cut_time = VideoWriter.__calculate_cut_timer()
+        elapsed = (now - midnight).total_seconds()
+        next_cut = midnight + timedelta(seconds=(elapsed // cut_time + 1) * cut_time)
+        return min(next_cut, midnight + timedelta(days=1)).timestamp()
+
+    def __create_output_file(self):
+        self.__output_path = self.__folder_structure.get_output_path()
+        self.__output_fps = self.__fps.value
+        self.__first_capture_time, self.__output_frames = None, 0
+        if config.VideoCutTime:
+            self.__next_cut_time = VideoWriter.__get_next_cut_time(time.time())
+        self.__logger.debug(f"[{self.__ip}]: creating new file: {self.__output_path}.")
+        self.__output_file = SegmentFile(self.__output_path, config.WriteBlockSize << 20,
+                                         min(self.__get_expected_file_size(), config.PreallocateLimit << 20),
+                                         config.DirectIO, config.SyncInterval)
+        if config.RawCompression:
+            self.__output_container = RawContainer(self.__output_file, self.__width, self.__height, self.__output_fps,
+                                                   config.RawCompression)
+        else:
+            self.__write_extended_attributes(self.__output_path, self.__output_fps)
+        self.__logger.debug(f"[{self.__ip}]: writing to {self.__output_path}...")
+
+    def __get_expected_file_size(self):
+        # Without VideoCutTime files are only cut by fps changes and size, an hour is expected then.
+        seconds = self.__next_cut_time - time.time() if config.VideoCutTime else 60 * 60
+        expected_size = int(self.__width * self.__height * 3 * self.__output_fps * seconds)
+        return min(expected_size, config.MaxSegmentSize) if config.MaxSegmentSize else expected_size
+
+    def __finish_output_file(self):
+        if self.__output_file is None:
+            return
+        output_file, self.__output_file = self.__output_file, None
+        if self.__output_container is not None:
+            self.__output_container.finish()
+            self.__logger.debug(f"[{self.__ip}]: {self.__output_container.frames} frames compressed "
+                                f"{self.__output_container.get_compression_ratio():.1f}x, "
+                                f"{self.__output_container.skipped_frames} duplicate frames skipped.")
+            self.__output_container = None
+        extents = output_file.close()
+        self.__logger.debug(f"[{self.__ip}]: stopped writing to {self.__output_path}.")
+        self.__report_disk_statistics(output_file, extents)
+        new_output_path = self.__folder_structure.rename_output_file(self.__output_path)
+        self.__encoding_pipe_in.send(
+            (3, VideoEncoder.get_ffmpeg_command(new_output_path, self.__width, self.__height, self.__output_fps)))
+
+    def __report_disk_statistics(self, output_file, extents):
+        seconds = output_file.write_seconds + output_file.sync_seconds
+        self.__logger.info(f"[{self.__ip}]: wrote {output_file.written_bytes / (1 << 20):.1f} MiB in "
+                           f"{'unknown' if extents is None else extents} extents at "
+                           f"{output_file.written_bytes / (1 << 20) / max(seconds, 1e-6):.1f} MiB/s "
+                           f"({output_file.sync_seconds:.2f}s fdatasync, "
+                           f"{'direct' if output_file.direct_io else 'buffered'}, "
+                           f"{'preallocated' if output_file.preallocated else 'not preallocated'}).")
+        if self.__counters is not None:
+            self.__counters.disk_written_bytes += output_file.written_bytes
+            self.__counters.disk_write_seconds += seconds
+            self.__counters.file_extents = extents or 0
+
+    def __write_extended_attributes(self, file_path, fps):
         self.__logger.debug(f"[{self.__ip}]: writing metadata to {file_path}.")
         os.setxattr(file_path, "user.width", struct.pack(">H", self.__width))
         os.setxattr(file_path, "user.height", struct.pack(">H", self.__height))
-        os.setxattr(file_path, "user.fps", struct.pack(">H", self.__fps))
+        os.setxattr(file_path, "user.fps", struct.pack(">H", fps))
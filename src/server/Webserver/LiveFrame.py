@@ -0,0 +1,69 @@
+from multiprocessing import shared_memory
+import numpy as np
+import struct
+import sys
+import time
+
+# generation, height, width
+DESCRIPTOR = struct.Struct("=QHH")
+FRAMES_OFFSET = 16
+
+
+# The newest frame of a camera in shared memory, written by whichever process receives the stream.
+# The generation is a sequence lock: it is odd while the frame is written and even once it is complete.
+# Readers copy the frame and retry unless the generation was even and didn't change during the copy.
+# Only the process that created a live frame unlinks it, the others attach by name and only close their mapping.
+class LiveFrame:
+    def __init__(self, resolution=None, name=None):
+        self.is_owner = name is None
+        if name is None:
+            height, width = resolution
+            self.__shm = shared_memory.SharedMemory(create=True, size=FRAMES_OFFSET + height * width * 3)
+            DESCRIPTOR.pack_into(self.__shm.buf, 0, 0, height, width)
+        elif sys.version_info >= (3, 13):
+            self.__shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # Registered with the resource tracker as well, the server starts it before any process is forked, so
+            # all processes share it and the unlink of the owner removes the registration.
+            self.__shm = shared_memory.SharedMemory(name=name)
+        _, self.height, self.width = DESCRIPTOR.unpack_from(self.__shm.buf)
+        self.frame_byte_size = self.height * self.width * 3
+
+    @property
+    def name(self):
+        return self.__shm.name
+
+    @property
+    def resolution(self):
+        return self.height, self.width
+
+    @property
+    def generation(self):
+        return DESCRIPTOR.unpack_from(self.__shm.buf)[0]
+
+    def publish(self, buffer):
+        # Only one process may publish to a live frame.
+        generation = self.generation
+        DESCRIPTOR.pack_into(self.__shm.buf, 0, generation + 1, self.height, self.width)
+        self.__shm.buf[FRAMES_OFFSET:FRAMES_OFFSET + self.frame_byte_size] = memoryview(buffer).cast("B")
+        DESCRIPTOR.pack_into(self.__shm.buf, 0, generation + 2, self.height, self.width)
+
+    def read(self):
+        # Returns the generation and a copy of the frame, generation 0 means nothing was published yet.
+        while True:
+            generation = self.generation
+            if generation % 2 == 0:
+                # No view of the buffer is kept, it would keep the mapping from being closed.
+                frame = np.ndarray((self.height, self.width, 3), dtype=np.uint8, buffer=self.__shm.buf,
+                                   offset=FRAMES_OFFSET).copy()
+                if self.generation == generation:
+                    return generation, frame
+            time.sleep(0.001)
+
+    def unlink(self):
+        # Readers that still use the frame keep their mapping until they let go of it.
+        self.__shm.unlink()
+
+    def close(self):
+        # Only once nothing reads or writes the frame anymore.
+        self.__shm.close()
@@ -0,0 +1,40 @@
+from src.server.Webserver.LiveFrame import LiveFrame
+import socket
+import pickle
+
+
+# Takes the place of the webserver in the listener processes.
+# Live frames are created where the stream is received and announced to the webserver of the coordinator, which
+# attaches them by name. The listener unlinks them once the camera is deleted.
+class RemoteWebserver:
+    def __init__(self):
+        self.__listener_connection, self.__webserver_connection = socket.socketpair(socket.AF_UNIX,
+                                                                                      socket.SOCK_SEQPACKET)
+        self.__live_frames = {}
+
+    def add_camera(self, ip, resolution):
+        self.__release_live_frame(ip)
+        live_frame = LiveFrame(resolution)
+        self.__live_frames[ip] = live_frame
+        self.__listener_connection.send(pickle.dumps(("add", ip, live_frame.name)))
+        return live_frame
+
+    def delete_camera(self, ip):
+        self.__release_live_frame(ip)
+        self.__listener_connection.send(pickle.dumps(("delete", ip, None)))
+
+    def __release_live_frame(self, ip):
+        # The listener created the live frame, so it unlinks it as well. The stream no longer writes to it.
+        live_frame = self.__live_frames.pop(ip, None)
+        if live_frame is not None:
+            live_frame.unlink()
+            live_frame.close()
+
+    def serve(self, webserver):
+        # Runs in the coordinator.
+        while True:
+            command, ip, live_frame_name = pickle.loads(self.__webserver_connection.recv(4096))
+            if command == "add":
+                webserver.attach_camera(ip, live_frame_name)
+            else:
+                webserver.delete_camera(ip)
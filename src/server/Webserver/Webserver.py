@@ -1,8 +1,9 @@
 import time
+from threading import Lock
 from flask import Flask, render_template, Response
 from flask.logging import default_handler
-import multiprocessing as mp
-from src.server.Webserver.BufferFormatter import encode_frame_to_bytes, reshape_np_array
+from src.server.Webserver.BufferFormatter import encode_frame_to_bytes
+from src.server.Webserver.LiveFrame import LiveFrame
 from src.shared.Logger import create_logger
 from src.server.Config import config
 import sys
@@ -12,11 +13,15 @@ from file_read_backwards import FileReadBackwards
 
 # TODO:add flask logging to filehandler
 class Webserver:
-    def __init__(self):
+    def __init__(self, metrics):
         self.__logger = create_logger(__name__, config.DebugMode, "server.log")
         self.__logger.debug("[Server]: Initializing Webserver Class...")
-        self.frames = mp.Manager().dict()
-        self.resolutions = mp.Manager().dict()
+        # Only changed in the server process, the stream processes write to the shared memory of the LiveFrames.
+        self.live_frames = {}
+        self.__metrics = metrics
+        # ip: amount of clients watching the camera
+        self.__viewers = {}
+        self.__viewers_lock = Lock()
         self.__number_of_columns = config.WebserverTableWidth
         self.__logger.debug("[Server]: Webserver Class Initialized.")
 
@@ -26,42 +31,56 @@ class Webserver:
 
         @_app.route("/video_feed/<string:ip>")
         def _video_feed(ip):
-            if ip in self.frames.keys():
+            if ip in self.live_frames:
                 return Response(self._generate_frame(ip), mimetype='multipart/x-mixed-replace; boundary=frame')
             return "NO CAMERA CONNECTED!"
 
+        @_app.route("/metrics")
+        def _metrics():
+            with self.__viewers_lock:
+                viewers = dict(self.__viewers)
+            return Response(self.__metrics.render(viewers), mimetype="text/plain; version=0.0.4")
+
         @_app.route("/log")
         def _log():
             return Response(self._generate_log(), mimetype="text/plain")
 
         @_app.route("/")
         def _index():
-            return render_template("index.html", camera_ips=sorted(list(self.frames.keys())),
+            return render_template("index.html", camera_ips=sorted(list(self.live_frames.keys())),
                                    noc=self.__number_of_columns,
-                                   nor=self.__calculate_row_number(self.__number_of_columns, len(self.frames)))
+                                   nor=self.__calculate_row_number(self.__number_of_columns, len(self.live_frames)))
 
         # p = mp.Process(target=_app.run, kwargs={"debug": False, "host": "0.0.0.0", "port": 8080})
         # p.start()
         _app.run(host=config.WebserverHost, port=config.WebserverPort, threaded=True)
 
     def _generate_frame(self, ip):
-        height, width = self.resolutions[ip]
-        prev_frame = b""
+        live_frame = self.live_frames.get(ip)
+        prev_generation = 0
         self.__logger.debug(f"[{ip}]: Webserver started displaying frames...")
+        self.__count_viewer(ip, 1)
         try:
-            while ip in self.frames.keys():
-                if self.frames[ip] == prev_frame:
+            # Stops when the camera is deleted or was replaced by a new stream.
+            while live_frame is not None and self.live_frames.get(ip) is live_frame:
+                generation = live_frame.generation
+                if generation == prev_generation:
                     time.sleep(0.05)
                     continue
-                frame = encode_frame_to_bytes(reshape_np_array(self.frames[ip], height, width))
-                prev_frame = self.frames[ip]
+                prev_generation, frame = live_frame.read()
+                frame = encode_frame_to_bytes(frame)
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        except KeyError:
-            self.__logger.exception(f"[{ip}]: Caused KeyError Exception.")
         finally:
+            self.__count_viewer(ip, -1)
             self.__logger.debug(f"[{ip}]: Webserver stopped displaying frames.")
 
+    def __count_viewer(self, ip, change):
+        with self.__viewers_lock:
+            self.__viewers[ip] = self.__viewers.get(ip, 0) + change
+            if self.__viewers[ip] == 0:
+                del self.__viewers[ip]
+
     def _generate_log(self):
         log_path = os.path.join(sys.path[-1], "logs")
         with FileReadBackwards(os.path.join(log_path, "server.log"), encoding="utf-8") as log_file:
@@ -76,18 +95,34 @@ class Webserver:
         result = cams - columns
         return self.__calculate_row_number(columns, result, x + 1)
 
+    def add_camera(self, ip, resolution):
+        self.__logger.debug(f"[{ip}]: creating Camera entries...")
+        self.delete_camera(ip)
+        self.live_frames[ip] = LiveFrame(resolution)
+        self.__logger.debug(f"[{ip}]: live frame {self.live_frames[ip].name} created.")
+        return self.live_frames[ip]
+
+    def attach_camera(self, ip, name):
+        # The live frame was created by a listener process.
+        self.delete_camera(ip)
+        try:
+            self.live_frames[ip] = LiveFrame(name=name)
+        except FileNotFoundError:
+            # The camera was already gone again.
+            return
+        self.__logger.debug(f"[{ip}]: live frame {name} attached.")
+
     def delete_camera(self, ip):
         self.__logger.debug(f"[{ip}]: deleting Camera entries...")
-        del self.frames[ip]
-        self.__logger.debug(f"[{ip}]: frames entry deleted.")
-        del self.resolutions[ip]
-        self.__logger.debug(f"[{ip}]: resolutions entry deleted.")
+        # Cameras streaming encoded video never have a live frame.
+        live_frame = self.live_frames.pop(ip, None)
+        # Attached live frames belong to a listener process, the mapping is closed once no viewer uses it.
+        if live_frame is not None and live_frame.is_owner:
+            live_frame.unlink()
         self.__logger.debug(f"[{ip}]: Camera entries deleted.")
 
     def delete_all_cameras(self):
         self.__logger.debug("[Server]: deleting all Camera entries...")
-        self.frames.clear()
-        self.__logger.debug("[Server]: all frames entries deleted.")
-        self.resolutions.clear()
-        self.__logger.debug("[Server]: all resolutions entries deleted.")
+        for ip in list(self.live_frames):
+            self.delete_camera(ip)
         self.__logger.debug("[Server]: All Camera entries deleted.")
@@ -0,0 +1,18 @@
+from functools import lru_cache
+import subprocess
+import re
+
+
+# -fps_mode exists since ffmpeg 5.1, older versions only know -vsync, which newer versions deprecate.
+@lru_cache(maxsize=None)
+def get_frame_rate_mode_option():
+    try:
+        version = subprocess.run(["ffmpeg", "-version"], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL, text=True).stdout
+    except OSError:
+        return "-fps_mode"
+    match = re.match(r"ffmpeg version n?(\d+)\.(\d+)", version)
+    # Builds from git have no version number and are newer.
+    if match is not None and (int(match.group(1)), int(match.group(2))) < (5, 1):
+        return "-vsync"
+    return "-fps_mode"
@@ -0,0 +1,26 @@
+import simplejpeg
+
+# Stream encodings negotiated per camera with the "se" (set encoding) command.
+RAW = 0
+JPEG = 1
+DELTA = 2
+H264 = 3
+H265 = 4
+ENCODINGS = {"raw": RAW, "jpeg": JPEG, "delta": DELTA, "h264": H264, "h265": H265}
+# Encoded on the client and stored by the server without re-encoding.
+VIDEO_STREAM_ENCODINGS = (H264, H265)
+
+
+def get_encoding_name(encoding):
+    for name, value in ENCODINGS.items():
+        if value == encoding:
+            return name
+    return str(encoding)
+
+
+def encode_jpeg(frame, quality):
+    return simplejpeg.encode_jpeg(frame, quality=quality, colorspace="BGR")
+
+
+def decode_jpeg(buffer):
+    return simplejpeg.decode_jpeg(buffer, colorspace="BGR")
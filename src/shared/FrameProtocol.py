@@ -0,0 +1,38 @@
+import struct
+
+# Negotiated on the camera connection: the client sends b"c" followed by its version,
+# the server answers with the version both sides use.
+PROTOCOL_VERSION = 1
+VERSION = struct.Struct(">B")
+
+# version, flags, payload length, sequence number, capture time (client monotonic clock in seconds)
+FRAME_HEADER = struct.Struct(">BBIId")
+# The payload can be decoded without any previous frame.
+KEYFRAME = 0x01
+
+
+def negotiate_version(client_version):
+    version = min(client_version, PROTOCOL_VERSION)
+    return version if version >= 1 else 0
+
+
+def send_frame(sock, payload, sequence, capture_time, flags=0):
+    # header and payload are handed to the kernel together, without joining them first.
+    payload = memoryview(payload).cast("B")
+    buffers = [memoryview(FRAME_HEADER.pack(PROTOCOL_VERSION, flags, len(payload), sequence & 0xFFFFFFFF,
+                                            capture_time)), payload]
+    sent_bytes = FRAME_HEADER.size + len(payload)
+    while buffers:
+        sent = sock.sendmsg(buffers)
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers.pop(0))
+        if buffers:
+            buffers[0] = buffers[0][sent:]
+    return sent_bytes
+
+
+def unpack_header(header):
+    version, flags, length, sequence, capture_time = FRAME_HEADER.unpack(header)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"unsupported frame protocol version {version}")
+    return flags, length, sequence, capture_time
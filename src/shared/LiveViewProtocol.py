@@ -0,0 +1,23 @@
+import struct
+
+# The live view is sent next to the recorded stream as jpeg frames over udp.
+# Every frame is split into chunks that fit into a single datagram, so a lost chunk only loses its own frame.
+# frame sequence number, chunk index, chunk count
+CHUNK_HEADER = struct.Struct(">IHH")
+MAX_DATAGRAM_SIZE = 65507
+
+
+def send_chunks(sock, payload, sequence, chunk_size):
+    payload = memoryview(payload).cast("B")
+    count = max(-(-len(payload) // chunk_size), 1)
+    if count > 0xFFFF:
+        raise ValueError(f"frame of {len(payload)} bytes needs more than {0xFFFF} chunks")
+    for index in range(count):
+        header = CHUNK_HEADER.pack(sequence & 0xFFFFFFFF, index, count)
+        sock.sendmsg([header, payload[index * chunk_size:(index + 1) * chunk_size]])
+    return count * CHUNK_HEADER.size + len(payload)
+
+
+def is_newer(sequence, other):
+    # Sequence numbers wrap around after 2^32 frames.
+    return 0 < (sequence - other) & 0xFFFFFFFF < 0x80000000
@@ -0,0 +1,95 @@
+import struct
+import numpy as np
+
+KEYFRAME = 1
+# flags, tile size, amount of tiles
+DELTA_HEADER = struct.Struct(">BHI")
+TILE_INDEX_DTYPE = np.dtype(">u4")
+
+
+# Frames are split into square tiles, only tiles that changed compared to what the receiver already has are sent.
+# Frame sizes that are not a multiple of the tile size are padded internally.
+class TileDeltaEncoder:
+    def __init__(self, resolution, tile_size, threshold, keyframe_interval):
+        self.__height, self.__width = resolution
+        self.__tile_size = tile_size
+        self.__threshold = threshold
+        self.__keyframe_interval = keyframe_interval
+        self.__grid_height, self.__grid_width = -(-self.__height // tile_size), -(-self.__width // tile_size)
+        padded_shape = (self.__grid_height * tile_size, self.__grid_width * tile_size, 3)
+        self.__reference = np.zeros(padded_shape, dtype=np.uint8)
+        self.__current = np.zeros(padded_shape, dtype=np.uint8)
+        self.__frames_since_keyframe = keyframe_interval
+
+    def encode(self, frame):
+        self.__current[:self.__height, :self.__width] = frame
+        self.__frames_since_keyframe += 1
+        if self.__frames_since_keyframe >= self.__keyframe_interval:
+            return self.__encode_keyframe(frame)
+        current_tiles = get_tiles(self.__current, self.__tile_size)
+        reference_tiles = get_tiles(self.__reference, self.__tile_size)
+        difference = np.maximum(current_tiles, reference_tiles) - np.minimum(current_tiles, reference_tiles)
+        rows, columns = np.nonzero(difference.max(axis=(2, 3, 4)) > self.__threshold)
+        # A keyframe is cheaper once most of the scene changed.
+        if len(rows) * 2 > self.__grid_height * self.__grid_width:
+            return self.__encode_keyframe(frame)
+        tiles = current_tiles[rows, columns]
+        reference_tiles[rows, columns] = tiles
+        indices = (rows * self.__grid_width + columns).astype(TILE_INDEX_DTYPE)
+        return DELTA_HEADER.pack(0, self.__tile_size, len(indices)) + indices.tobytes() + tiles.tobytes()
+
+    def __encode_keyframe(self, frame):
+        self.__frames_since_keyframe = 0
+        self.__reference[:] = self.__current
+        return DELTA_HEADER.pack(KEYFRAME, self.__tile_size, self.__grid_height * self.__grid_width) + \
+            np.ascontiguousarray(frame).tobytes()
+
+
+class TileDeltaDecoder:
+    def __init__(self, resolution):
+        self.__height, self.__width = resolution
+        self.__frame = None
+        self.__tile_size = None
+
+    def decode(self, payload):
+        # Raises ValueError for payloads that can't come from a TileDeltaEncoder.
+        if len(payload) < DELTA_HEADER.size:
+            raise ValueError(f"delta payload of {len(payload)} bytes")
+        flags, tile_size, tile_count = DELTA_HEADER.unpack_from(payload)
+        if tile_size == 0:
+            raise ValueError("delta tile size 0")
+        body = memoryview(payload)[DELTA_HEADER.size:]
+        if flags & KEYFRAME:
+            if len(body) != self.__height * self.__width * 3:
+                raise ValueError(f"delta keyframe of {len(body)} bytes")
+            self.__reset(tile_size)
+            self.__frame[:self.__height, :self.__width] = \
+                np.frombuffer(body, dtype=np.uint8).reshape((self.__height, self.__width, 3))
+        elif self.__frame is None or tile_size != self.__tile_size:
+            # Deltas are useless until the next keyframe arrives.
+            return None
+        else:
+            index_byte_size = tile_count * TILE_INDEX_DTYPE.itemsize
+            if len(body) != index_byte_size + tile_count * tile_size * tile_size * 3:
+                raise ValueError(f"delta of {len(body)} bytes for {tile_count} tiles")
+            indices = np.frombuffer(body[:index_byte_size], dtype=TILE_INDEX_DTYPE)
+            grid_width = self.__frame.shape[1] // tile_size
+            if tile_count and indices.max() >= (self.__frame.shape[0] // tile_size) * grid_width:
+                raise ValueError(f"delta tile index {indices.max()} outside of the frame")
+            tiles = np.frombuffer(body[index_byte_size:], dtype=np.uint8).reshape((tile_count, tile_size,
+                                                                                   tile_size, 3))
+            rows, columns = np.divmod(indices, grid_width)
+            get_tiles(self.__frame, tile_size)[rows, columns] = tiles
+        return self.__frame[:self.__height, :self.__width].tobytes()
+
+    def __reset(self, tile_size):
+        if self.__tile_size != tile_size:
+            self.__tile_size = tile_size
+            self.__frame = np.zeros((-(-self.__height // tile_size) * tile_size,
+                                     -(-self.__width // tile_size) * tile_size, 3), dtype=np.uint8)
+
+
+def get_tiles(frame, tile_size):
+    # (grid height, grid width, tile size, tile size, 3) view of the frame.
+    height, width = frame.shape[:2]
+    return frame.reshape((height // tile_size, tile_size, width // tile_size, tile_size, 3)).swapaxes(1, 2)
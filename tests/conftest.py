@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The server modules import each other by name and find conf/server.ini through sys.path[0], like when Server.py runs.
+# pytest puts the tests folder in front again later, the config has to be loaded while the server folder is first.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "server"))
+from src.server.Config import config  # noqa: E402,F401
@@ -0,0 +1,65 @@
+import pytest
+from src.server.ChunkAssembler import ChunkAssembler
+
+CHUNKS = [b"ab", b"cd", b"e"]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Seconds returned by time.monotonic while the test runs.
+    clock = [100.0]
+    monkeypatch.setattr("src.server.ChunkAssembler.time.monotonic", lambda: clock[0])
+    return clock
+
+
+def add_frame(assembler, sequence, order=(0, 1, 2)):
+    # Returns what adding each chunk of the frame returned.
+    return [assembler.add(sequence, index, len(CHUNKS), CHUNKS[index]) for index in order]
+
+
+def test_frame_is_returned_once_its_last_chunk_arrived():
+    assembler = ChunkAssembler(1.0)
+    assert add_frame(assembler, 5, (2, 0, 1)) == [None, None, b"abcde"]
+    assert (assembler.completed_frames, assembler.dropped_frames) == (1, 0)
+
+
+def test_repeated_chunk_is_ignored():
+    assembler = ChunkAssembler(1.0)
+    assert assembler.add(5, 0, 3, b"ab") is None
+    assert assembler.add(5, 0, 3, b"xx") is None
+    assert add_frame(assembler, 5, (1, 2)) == [None, b"abcde"]
+
+
+def test_newer_frame_drops_the_incomplete_frame():
+    assembler = ChunkAssembler(1.0)
+    add_frame(assembler, 5, (0, 1))
+    assert add_frame(assembler, 6) == [None, None, b"abcde"]
+    # The last chunk of the dropped frame comes too late.
+    assert assembler.add(5, 2, 3, b"e") is None
+    assert (assembler.completed_frames, assembler.dropped_frames) == (1, 1)
+
+
+def test_chunks_of_older_frames_are_ignored():
+    assembler = ChunkAssembler(1.0)
+    add_frame(assembler, 6)
+    assert add_frame(assembler, 5) == [None, None, None]
+    assert assembler.completed_frames == 1
+
+
+def test_sequence_numbers_wrap_around():
+    assembler = ChunkAssembler(1.0)
+    add_frame(assembler, 0xFFFFFFFF)
+    assert add_frame(assembler, 0) == [None, None, b"abcde"]
+
+
+def test_incomplete_frame_expires_after_the_loss_timeout(clock):
+    assembler = ChunkAssembler(1.0)
+    add_frame(assembler, 5, (0, 1))
+    clock[0] += 0.5
+    assembler.expire()
+    assert assembler.dropped_frames == 0
+    clock[0] += 1.0
+    assembler.expire()
+    assert assembler.dropped_frames == 1
+    assert assembler.add(5, 2, 3, b"e") is None
+    assert add_frame(assembler, 6) == [None, None, b"abcde"]
@@ -0,0 +1,83 @@
+import ctypes
+import multiprocessing as mp
+import pytest
+from src.client.FrameRing import FrameRing, CAPTURED, FORMATTING, FORMATTED, SENDING
+
+RESOLUTION = (12, 16)
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(2, RESOLUTION)
+    yield ring
+    ring.close()
+
+
+def is_running(value=True):
+    return mp.Value(ctypes.c_bool, value)
+
+
+def capture(ring, capture_time=0.0, value=0):
+    index = ring.acquire_free_slot()
+    ring.frame(index)[:] = value
+    ring.publish(index, CAPTURED, capture_time)
+    return index
+
+
+def test_frame_passes_through_all_stages_in_place(ring):
+    index = capture(ring, 1.5, 7)
+    assert ring.acquire(CAPTURED, FORMATTING, is_running()) == index
+    ring.publish(index, FORMATTED)
+    assert ring.acquire(FORMATTED, SENDING, is_running()) == index
+    assert bytes(ring.buffer(index)) == bytes([7]) * ring.frame_byte_size
+    assert (ring.sequence(index), ring.capture_time(index)) == (0, 1.5)
+    ring.release(index)
+    assert (ring.captured, ring.dropped, ring.sent) == (1, 0, 1)
+
+
+def test_oldest_frame_is_handed_on_first(ring):
+    first = capture(ring)
+    second = capture(ring)
+    assert ring.acquire(CAPTURED, FORMATTING, is_running()) == first
+    assert ring.acquire(CAPTURED, FORMATTING, is_running()) == second
+
+
+def test_acquire_returns_none_once_stopped(ring):
+    assert ring.acquire(CAPTURED, FORMATTING, is_running(False)) is None
+
+
+def test_released_frame_that_was_not_sent_is_not_counted(ring):
+    index = capture(ring)
+    ring.acquire(CAPTURED, FORMATTING, is_running())
+    ring.release(index)
+    assert (ring.captured, ring.sent) == (1, 0)
+    assert ring.acquire_free_slot() is not None
+
+
+def test_oldest_waiting_frame_is_dropped_above_depth(ring):
+    capture(ring)
+    second = capture(ring)
+    capture(ring)
+    assert (ring.captured, ring.dropped) == (3, 1)
+    assert ring.acquire(CAPTURED, FORMATTING, is_running()) == second
+
+
+def test_frames_in_work_are_never_dropped(ring):
+    formatting = capture(ring, value=1)
+    ring.acquire(CAPTURED, FORMATTING, is_running())
+    for _ in range(5):
+        capture(ring, value=2)
+    assert ring.dropped == 3
+    assert (ring.frame(formatting) == 1).all()
+
+
+def test_capture_takes_the_oldest_waiting_slot_when_none_is_free(ring):
+    formatting = capture(ring)
+    ring.acquire(CAPTURED, FORMATTING, is_running())
+    waiting = capture(ring)
+    # The remaining slots are being captured into.
+    for _ in range(ring.slots - 2):
+        assert ring.acquire_free_slot() not in (formatting, waiting)
+    assert ring.acquire_free_slot() == waiting
+    assert ring.dropped == 1
+    assert ring.acquire_free_slot() is None
@@ -0,0 +1,42 @@
+import multiprocessing as mp
+import numpy as np
+from src.server.Webserver.LiveFrame import LiveFrame
+
+RESOLUTION = (120, 160)
+
+
+def publish_frames(name, frames):
+    live_frame = LiveFrame(name=name)
+    for value in range(frames):
+        live_frame.publish(np.full(RESOLUTION + (3,), value % 256, np.uint8))
+
+
+def test_read_returns_the_published_frame():
+    live_frame = LiveFrame(RESOLUTION)
+    try:
+        assert live_frame.read()[0] == 0
+        live_frame.publish(np.full(RESOLUTION + (3,), 7, np.uint8))
+        generation, frame = live_frame.read()
+        assert generation == 2
+        assert (frame == 7).all()
+    finally:
+        live_frame.unlink()
+
+
+def test_read_interleaved_with_publish_is_never_torn():
+    # Every published frame has a single value, a torn frame mixes two of them.
+    live_frame = LiveFrame(RESOLUTION)
+    writer = mp.get_context("spawn").Process(target=publish_frames, args=(live_frame.name, 20000))
+    try:
+        writer.start()
+        reads = 0
+        while writer.is_alive() or reads == 0:
+            generation, frame = live_frame.read()
+            assert generation % 2 == 0
+            assert (frame == frame.flat[0]).all()
+            reads += 1
+        writer.join()
+        assert writer.exitcode == 0
+        assert live_frame.generation == 2 * 20000
+    finally:
+        live_frame.unlink()
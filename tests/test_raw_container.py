@@ -0,0 +1,99 @@
+import io
+import os
+import numpy as np
+import pytest
+from src.server.RawContainer import RawContainer, KEYFRAME_INTERVAL, TRAILER
+from src.server.SegmentFile import SegmentFile
+
+WIDTH, HEIGHT, FPS = 16, 12, 10
+FRAME_SIZE = WIDTH * HEIGHT * 3
+
+
+def get_frames(count):
+    rng = np.random.default_rng(1)
+    frame = rng.integers(0, 256, FRAME_SIZE, np.uint8)
+    frames = []
+    for _ in range(count):
+        # Most pixels stay the same, like in a real scene.
+        frame = frame.copy()
+        frame[rng.integers(0, FRAME_SIZE, 20)] = rng.integers(0, 256, 20, np.uint8)
+        frames.append(frame.tobytes())
+    return frames
+
+
+def write_container(path, frames, compression="zlib", threshold=-1):
+    # A small block size, so the frames span many blocks.
+    file = SegmentFile(path, 4096, expected_size=len(frames) * FRAME_SIZE)
+    container = RawContainer(file, WIDTH, HEIGHT, FPS, compression)
+    for number, frame in enumerate(frames):
+        if container.is_duplicate(frame, threshold):
+            container.skip(number / FPS)
+        else:
+            container.write(frame, number / FPS)
+    container.finish()
+    file.close()
+    return container
+
+
+@pytest.mark.parametrize("compression, module", [("zlib", None), ("lz4", "lz4"), ("zstd", "zstandard")])
+def test_frames_are_read_back_exactly(tmp_path, compression, module):
+    if module is not None:
+        pytest.importorskip(module)
+    path = str(tmp_path / "frames.rawz")
+    frames = get_frames(KEYFRAME_INTERVAL + 10)
+    container = write_container(path, frames, compression)
+    assert container.get_compression_ratio() > 1
+    assert RawContainer.get_metadata(path) == (WIDTH, HEIGHT, FPS)
+    assert [frame for frame, _ in RawContainer.read_frames(path)] == frames
+    assert RawContainer.read_timestamps(path) == [number / FPS for number in range(len(frames))]
+
+
+def test_unfinished_file_is_read_until_it_ends(tmp_path):
+    path = str(tmp_path / "frames.rawz")
+    frames = get_frames(5)
+    write_container(path, frames)
+    # Cuts off the index, the trailer and the end of the last frame.
+    with open(path, "r+b") as file:
+        file.truncate(os.path.getsize(path) - TRAILER.size - 5 * 17 - 1)
+    assert [frame for frame, _ in RawContainer.read_frames(path)] == frames[:4]
+    assert RawContainer.read_timestamps(path) == [0.0, 0.1, 0.2, 0.3]
+
+
+def test_duplicate_frames_are_skipped(tmp_path):
+    path = str(tmp_path / "frames.rawz")
+    first, second = get_frames(2)
+    container = write_container(path, [first, first, second, second, second], threshold=0)
+    assert (container.frames, container.skipped_frames) == (3, 3)
+    assert [frame for frame, _ in RawContainer.read_frames(path)] == [first, second, second]
+    # The skipped frames are shown until the next written frame, the video still ends with the last capture time.
+    assert RawContainer.read_timestamps(path) == [0.0, 0.2, 0.4]
+
+
+def test_duplicate_threshold():
+    container = RawContainer(io.BytesIO(), WIDTH, HEIGHT, FPS, "zlib")
+    frame = np.full(FRAME_SIZE, 100, np.uint8)
+    container.write(frame.tobytes(), 0.0)
+    assert container.is_duplicate(frame.tobytes(), 0)
+    assert not container.is_duplicate(frame.tobytes(), -1)
+    assert not container.is_duplicate((frame + 1).tobytes(), 0)
+    assert container.is_duplicate((frame + 1).tobytes(), 1)
+
+
+def test_damaged_frame_raises_value_error(tmp_path):
+    path = str(tmp_path / "frames.rawz")
+    write_container(path, get_frames(3))
+    with open(path, "r+b") as file:
+        file.seek(30)
+        file.write(b"\xff" * 8)
+    with pytest.raises(ValueError):
+        list(RawContainer.read_frames(path))
+
+
+def test_segment_file_releases_the_unused_reservation(tmp_path):
+    path = str(tmp_path / "frames.raw")
+    file = SegmentFile(path, 4096, expected_size=1 << 20)
+    file.write(bytes(10000))
+    assert file.size == 10000
+    file.close()
+    assert os.path.getsize(path) == 10000
+    assert os.stat(path).st_blocks * 512 < 1 << 20
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from src.shared.TileDelta import TileDeltaEncoder, TileDeltaDecoder, DELTA_HEADER, TILE_INDEX_DTYPE
+
+RESOLUTION = (48, 64)
+TILE_SIZE = 16
+
+
+def get_decoder_with_keyframe():
+    encoder = TileDeltaEncoder(RESOLUTION, TILE_SIZE, 0, 100)
+    decoder = TileDeltaDecoder(RESOLUTION)
+    decoder.decode(encoder.encode(np.zeros(RESOLUTION + (3,), np.uint8)))
+    return encoder, decoder
+
+
+def get_delta(indices):
+    tiles = np.zeros((len(indices), TILE_SIZE, TILE_SIZE, 3), np.uint8)
+    return DELTA_HEADER.pack(0, TILE_SIZE, len(indices)) + np.array(indices, TILE_INDEX_DTYPE).tobytes() + \
+        tiles.tobytes()
+
+
+def test_decode_restores_changed_tiles():
+    encoder, decoder = get_decoder_with_keyframe()
+    frame = np.zeros(RESOLUTION + (3,), np.uint8)
+    frame[20:30, 40:50] = 200
+    assert decoder.decode(encoder.encode(frame)) == frame.tobytes()
+
+
+@pytest.mark.parametrize("payload", [b"", b"\x00\x00\x10", DELTA_HEADER.pack(0, TILE_SIZE, 1)[:-1]])
+def test_decode_rejects_truncated_header(payload):
+    _, decoder = get_decoder_with_keyframe()
+    with pytest.raises(ValueError):
+        decoder.decode(payload)
+
+
+def test_decode_rejects_truncated_body():
+    _, decoder = get_decoder_with_keyframe()
+    with pytest.raises(ValueError):
+        decoder.decode(get_delta([0, 1])[:-1])
+    with pytest.raises(ValueError):
+        decoder.decode(DELTA_HEADER.pack(1, TILE_SIZE, 12) + bytes(10))
+
+
+def test_decode_rejects_tile_index_outside_of_the_grid():
+    _, decoder = get_decoder_with_keyframe()
+    # The grid of 48x64 with 16 pixel tiles has 12 tiles.
+    decoder.decode(get_delta([11]))
+    with pytest.raises(ValueError):
+        decoder.decode(get_delta([12]))
+
+
+def test_decode_rejects_tile_size_zero():
+    _, decoder = get_decoder_with_keyframe()
+    with pytest.raises(ValueError):
+        decoder.decode(DELTA_HEADER.pack(1, 0, 0) + bytes(RESOLUTION[0] * RESOLUTION[1] * 3))
@@ -0,0 +1,103 @@
+import ctypes
+import os
+import time
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from VideoWriter import VideoWriter, MAX_REPEATS
+from src.server.Config import config
+
+WIDTH, HEIGHT = 16, 12
+FRAME = bytes(WIDTH * HEIGHT * 3)
+
+
+# Stands in for the pipe to the encoding queue, remembers the size of every finished file.
+class EncodingPipe:
+    def __init__(self):
+        self.file_sizes = []
+
+    def send(self, request):
+        ffmpeg_command = request[1]
+        self.file_sizes.append(os.path.getsize(ffmpeg_command[ffmpeg_command.index("-i") + 1]))
+
+
+@pytest.fixture
+def clock(monkeypatch, tmp_path):
+    # Server time returned by time.time inside the VideoWriter.
+    clock = [0.0]
+    monkeypatch.setattr("VideoWriter.time", SimpleNamespace(time=lambda: clock[0], monotonic=time.monotonic))
+    for name, value in dict(StoragePath=str(tmp_path), VideoCutTime=None, RawCompression=None, LiveEncoding=False,
+                            MaxSegmentSize=0, PreallocateLimit=1, WriteBlockSize=1, DirectIO=False,
+                            SyncInterval=0).items():
+        monkeypatch.setattr(config, name, value)
+    return clock
+
+
+def open_video_writer(fps=10):
+    video_writer = VideoWriter((WIDTH, HEIGHT), ctypes.c_ubyte(fps), ctypes.c_bool(True), ctypes.c_double(), "1.2.3.4",
+                               None, 0)
+    pipe = EncodingPipe()
+    video_writer.open(pipe)
+    return video_writer, pipe
+
+
+def write(video_writer, capture_time):
+    video_writer.write(FRAME, (capture_time, capture_time, time.monotonic()))
+
+
+def test_files_are_cut_at_aligned_boundaries(clock, monkeypatch):
+    monkeypatch.setattr(config, "VideoCutTime", datetime.strptime("00:15:00", "%H:%M:%S"))
+    clock[0] = datetime(2026, 3, 1, 10, 7, 30).timestamp()
+    video_writer, pipe = open_video_writer()
+    write(video_writer, 0.0)
+    clock[0] = datetime(2026, 3, 1, 10, 14, 59).timestamp()
+    write(video_writer, 0.1)
+    assert pipe.file_sizes == []
+    clock[0] = datetime(2026, 3, 1, 10, 15).timestamp()
+    write(video_writer, 0.2)
+    assert pipe.file_sizes == [2 * len(FRAME)]
+    video_writer.close()
+    assert pipe.file_sizes == [2 * len(FRAME), len(FRAME)]
+
+
+def test_last_file_of_a_day_ends_at_midnight(clock, monkeypatch):
+    # The next 7 hour boundary would be at 04:00.
+    monkeypatch.setattr(config, "VideoCutTime", datetime.strptime("07:00:00", "%H:%M:%S"))
+    clock[0] = datetime(2026, 3, 1, 23, 50).timestamp()
+    video_writer, pipe = open_video_writer()
+    write(video_writer, 0.0)
+    clock[0] = datetime(2026, 3, 1, 23, 59, 59).timestamp()
+    write(video_writer, 0.1)
+    clock[0] = datetime(2026, 3, 2).timestamp()
+    write(video_writer, 0.2)
+    assert pipe.file_sizes == [2 * len(FRAME)]
+    video_writer.close()
+
+
+def test_files_are_only_cut_by_fps_changes_without_cut_time(clock):
+    video_writer, pipe = open_video_writer()
+    write(video_writer, 0.0)
+    clock[0] += 24 * 60 * 60
+    write(video_writer, 0.1)
+    assert pipe.file_sizes == []
+    video_writer._VideoWriter__fps.value = 5
+    write(video_writer, 0.2)
+    video_writer.close()
+    assert pipe.file_sizes == [2 * len(FRAME), len(FRAME)]
+
+
+def test_frames_skipped_by_the_client_are_filled_in(clock):
+    video_writer, pipe = open_video_writer(fps=10)
+    # 0.4 follows two skipped frames, the last gap is longer than the client ever skips.
+    for capture_time in (0.0, 0.1, 0.4, 0.5, 5.0):
+        write(video_writer, capture_time)
+    video_writer.close()
+    assert pipe.file_sizes == [(1 + 1 + 3 + 1 + MAX_REPEATS) * len(FRAME)]
+
+
+def test_early_frames_are_written_once(clock):
+    video_writer, pipe = open_video_writer(fps=10)
+    for capture_time in (0.0, 0.01, 0.02, 0.1):
+        write(video_writer, capture_time)
+    video_writer.close()
+    assert pipe.file_sizes == [4 * len(FRAME)]